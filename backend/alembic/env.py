@@ -0,0 +1,46 @@
+# alembic/env.py
+from logging.config import fileConfig
+
+from dotenv import load_dotenv
+from alembic import context
+
+# Carica variabili d'ambiente prima di importare la configurazione del database
+load_dotenv()
+
+from app import models
+from app.database import engine
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = models.Base.metadata
+
+def run_migrations_offline():
+    """Genera lo SQL delle migrazioni senza connettersi al database."""
+    context.configure(
+        url=engine.url.render_as_string(hide_password=False),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    """Applica le migrazioni usando l'engine dell'applicazione."""
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
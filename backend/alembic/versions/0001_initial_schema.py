@@ -0,0 +1,145 @@
+"""Schema iniziale (tabelle create in precedenza da Base.metadata.create_all)
+
+Revision ID: 0001_initial_schema
+Revises:
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_initial_schema'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # I database esistenti sono stati creati da create_all all'avvio: in quel caso
+    # lo schema iniziale è già presente e la migrazione si limita a registrarlo
+    if "professors" in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'professors',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('first_name', sa.String(), nullable=False),
+        sa.Column('last_name', sa.String(), nullable=False),
+        sa.Column('username', sa.String(), nullable=False, unique=True),
+        sa.Column('password', sa.String(), nullable=False),
+        sa.Column('is_admin', sa.Boolean(), nullable=True),
+        sa.Column('notes', sa.String(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+    )
+    op.create_index('ix_professors_id', 'professors', ['id'])
+
+    op.create_table(
+        'students',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('first_name', sa.String(), nullable=False),
+        sa.Column('last_name', sa.String(), nullable=False),
+        sa.Column('birth_date', sa.Date(), nullable=True),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('phone', sa.String(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+    )
+    op.create_index('ix_students_id', 'students', ['id'])
+
+    op.create_table(
+        'packages',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('start_date', sa.Date(), nullable=False),
+        sa.Column('total_hours', sa.DECIMAL(5, 2), nullable=False),
+        sa.Column('package_cost', sa.DECIMAL(10, 2), nullable=False),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('is_paid', sa.Boolean(), nullable=True),
+        sa.Column('payment_date', sa.Date(), nullable=True),
+        sa.Column('remaining_hours', sa.DECIMAL(5, 2), nullable=True),
+        sa.Column('expiry_date', sa.Date(), nullable=False),
+        sa.Column('extension_count', sa.Integer(), nullable=True),
+        sa.Column('notes', sa.String(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.Column('total_paid', sa.DECIMAL(10, 2), nullable=False),
+        sa.CheckConstraint('total_hours > 0', name='positive_hours'),
+        sa.CheckConstraint('package_cost >= 0', name='positive_cost'),
+    )
+    op.create_index('ix_packages_id', 'packages', ['id'])
+
+    op.create_table(
+        'package_students',
+        sa.Column('package_id', sa.Integer(), sa.ForeignKey('packages.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('student_id', sa.Integer(), sa.ForeignKey('students.id', ondelete='CASCADE'), primary_key=True),
+    )
+
+    op.create_table(
+        'package_payments',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('package_id', sa.Integer(), sa.ForeignKey('packages.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('amount', sa.DECIMAL(10, 2), nullable=False),
+        sa.Column('payment_date', sa.Date(), nullable=False),
+        sa.Column('notes', sa.String(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+    )
+    op.create_index('ix_package_payments_id', 'package_payments', ['id'])
+
+    op.create_table(
+        'lessons',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('professor_id', sa.Integer(), sa.ForeignKey('professors.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('student_id', sa.Integer(), sa.ForeignKey('students.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('lesson_date', sa.Date(), nullable=False),
+        sa.Column('duration', sa.DECIMAL(5, 2), nullable=False),
+        sa.Column('is_package', sa.Boolean(), nullable=True),
+        sa.Column('package_id', sa.Integer(), sa.ForeignKey('packages.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('hourly_rate', sa.DECIMAL(10, 2), nullable=False),
+        sa.Column('total_payment', sa.DECIMAL(10, 2), nullable=False),
+        sa.Column('is_paid', sa.Boolean(), nullable=True),
+        sa.Column('start_time', sa.Time(), nullable=True),
+        sa.Column('payment_date', sa.Date(), nullable=True),
+        sa.Column('price', sa.DECIMAL(10, 2), nullable=False),
+        sa.Column('is_online', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.CheckConstraint('duration > 0', name='positive_duration'),
+        sa.CheckConstraint('hourly_rate >= 0', name='positive_rate'),
+    )
+    op.create_index('ix_lessons_id', 'lessons', ['id'])
+
+    op.create_table(
+        'professor_weekly_payments',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('professor_id', sa.Integer(), sa.ForeignKey('professors.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('week_start_date', sa.Date(), nullable=False),
+        sa.Column('is_paid', sa.Boolean(), nullable=True),
+        sa.Column('marked_by', sa.Integer(), sa.ForeignKey('professors.id'), nullable=True),
+        sa.Column('marked_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.CheckConstraint('professor_id IS NOT NULL', name='professor_id_not_null'),
+    )
+    op.create_index('ix_professor_weekly_payments_id', 'professor_weekly_payments', ['id'])
+
+    op.create_table(
+        'activity_logs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('professor_id', sa.Integer(), sa.ForeignKey('professors.id'), nullable=True),
+        sa.Column('action_type', sa.String(), nullable=True),
+        sa.Column('entity_type', sa.String(), nullable=True),
+        sa.Column('entity_id', sa.Integer(), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+    op.create_index('ix_activity_logs_id', 'activity_logs', ['id'])
+    op.create_index('ix_activity_logs_action_type', 'activity_logs', ['action_type'])
+    op.create_index('ix_activity_logs_entity_type', 'activity_logs', ['entity_type'])
+
+
+def downgrade():
+    op.drop_table('activity_logs')
+    op.drop_table('professor_weekly_payments')
+    op.drop_table('lessons')
+    op.drop_table('package_payments')
+    op.drop_table('package_students')
+    op.drop_table('packages')
+    op.drop_table('students')
+    op.drop_table('professors')
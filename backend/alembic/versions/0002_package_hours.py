@@ -0,0 +1,47 @@
+"""Contatore hours_used sui pacchetti e tabella job_watermarks
+
+Revision ID: 0002_package_hours
+Revises: 0001_initial_schema
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_package_hours'
+down_revision = '0001_initial_schema'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # La tabella può esistere già se creata da create_all prima delle migrazioni
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS job_watermarks (
+            name VARCHAR PRIMARY KEY,
+            last_run_date DATE NOT NULL,
+            updated_at TIMESTAMP DEFAULT now()
+        )
+    """)
+
+    op.execute("ALTER TABLE packages ADD COLUMN IF NOT EXISTS hours_used NUMERIC(5, 2) NOT NULL DEFAULT 0")
+
+    # Inizializza il contatore a partire dalle lezioni esistenti
+    op.execute("""
+        UPDATE packages p
+        SET hours_used = l.hours_used
+        FROM (
+            SELECT package_id, SUM(duration) AS hours_used
+            FROM lessons
+            WHERE package_id IS NOT NULL AND is_package = true
+            GROUP BY package_id
+        ) l
+        WHERE p.id = l.package_id AND p.hours_used IS DISTINCT FROM l.hours_used
+    """)
+
+
+def downgrade():
+    op.drop_column('packages', 'hours_used')
+    op.drop_table('job_watermarks')
@@ -0,0 +1,60 @@
+"""Indici compositi per i filtri più frequenti
+
+Revision ID: 0003_query_indexes
+Revises: 0002_package_hours
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_query_indexes'
+down_revision = '0002_package_hours'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_lessons_package_id_is_package', 'lessons', ['package_id', 'is_package'])
+    op.create_index('ix_lessons_professor_id_lesson_date', 'lessons', ['professor_id', 'lesson_date'])
+    op.create_index('ix_lessons_student_id_lesson_date', 'lessons', ['student_id', 'lesson_date'])
+    op.create_index('ix_lessons_lesson_date_id', 'lessons', ['lesson_date', 'id'])
+    op.create_index('ix_package_students_student_id', 'package_students', ['student_id'])
+    op.create_index('ix_package_payments_package_id', 'package_payments', ['package_id'])
+    op.create_index('ix_activity_logs_timestamp', 'activity_logs', ['timestamp'])
+    op.create_index('ix_activity_logs_professor_id_timestamp', 'activity_logs', ['professor_id', 'timestamp'])
+
+    # Rimuovi eventuali record settimanali duplicati prima del vincolo di unicità: mantieni
+    # quello pagato, poi il pagamento registrato più di recente, poi il più vecchio
+    op.execute("""
+        DELETE FROM professor_weekly_payments
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY professor_id, week_start_date
+                    ORDER BY is_paid DESC NULLS LAST, marked_at DESC NULLS LAST, id
+                ) AS rank
+                FROM professor_weekly_payments
+            ) ranked
+            WHERE ranked.rank > 1
+        )
+    """)
+    op.create_unique_constraint(
+        'uq_professor_weekly_payments_professor_week',
+        'professor_weekly_payments',
+        ['professor_id', 'week_start_date']
+    )
+
+
+def downgrade():
+    op.drop_constraint('uq_professor_weekly_payments_professor_week', 'professor_weekly_payments', type_='unique')
+    op.drop_index('ix_activity_logs_professor_id_timestamp', table_name='activity_logs')
+    op.drop_index('ix_activity_logs_timestamp', table_name='activity_logs')
+    op.drop_index('ix_package_payments_package_id', table_name='package_payments')
+    op.drop_index('ix_package_students_student_id', table_name='package_students')
+    op.drop_index('ix_lessons_lesson_date_id', table_name='lessons')
+    op.drop_index('ix_lessons_student_id_lesson_date', table_name='lessons')
+    op.drop_index('ix_lessons_professor_id_lesson_date', table_name='lessons')
+    op.drop_index('ix_lessons_package_id_is_package', table_name='lessons')
@@ -0,0 +1,54 @@
+"""Aggregati economici mensili e coda dei mesi da ricalcolare
+
+Revision ID: 0004_finance_rollups
+Revises: 0003_query_indexes
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_finance_rollups'
+down_revision = '0003_query_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'finance_rollups',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('professor_id', sa.Integer(), sa.ForeignKey('professors.id', ondelete='CASCADE'), nullable=True),
+        sa.Column('lesson_kind', sa.String(), nullable=False),
+        sa.Column('lesson_count', sa.Integer(), nullable=False),
+        sa.Column('hours', sa.DECIMAL(10, 2), nullable=False),
+        sa.Column('professor_cost', sa.DECIMAL(12, 2), nullable=False),
+        sa.Column('student_revenue', sa.DECIMAL(12, 2), nullable=False),
+        sa.Column('student_unpaid', sa.DECIMAL(12, 2), nullable=False),
+        sa.Column('package_payments', sa.DECIMAL(12, 2), nullable=False),
+        sa.Column('refreshed_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+    )
+    op.create_index('ix_finance_rollups_id', 'finance_rollups', ['id'])
+    op.create_index('ix_finance_rollups_month', 'finance_rollups', ['month'])
+
+    op.create_table(
+        'finance_dirty_months',
+        sa.Column('month', sa.Date(), primary_key=True),
+        sa.Column('marked_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+    )
+
+    # Tutti i mesi esistenti vanno calcolati al primo aggiornamento
+    op.execute("""
+        INSERT INTO finance_dirty_months (month)
+        SELECT DISTINCT date_trunc('month', lesson_date)::date FROM lessons
+        UNION
+        SELECT DISTINCT date_trunc('month', payment_date)::date FROM package_payments
+    """)
+
+
+def downgrade():
+    op.drop_table('finance_dirty_months')
+    op.drop_table('finance_rollups')
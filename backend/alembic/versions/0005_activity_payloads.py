@@ -0,0 +1,30 @@
+"""Payload strutturato JSONB nel log delle attività
+
+Revision ID: 0005_activity_payloads
+Revises: 0004_finance_rollups
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_activity_payloads'
+down_revision = '0004_finance_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('activity_logs', sa.Column('payload', postgresql.JSONB(), nullable=True))
+    op.create_index(
+        'ix_activity_logs_payload', 'activity_logs', ['payload'],
+        postgresql_using='gin', postgresql_ops={'payload': 'jsonb_path_ops'}
+    )
+
+
+def downgrade():
+    op.drop_index('ix_activity_logs_payload', table_name='activity_logs')
+    op.drop_column('activity_logs', 'payload')
@@ -0,0 +1,114 @@
+"""Partizionamento mensile di activity_logs
+
+Revision ID: 0006_activity_log_partitions
+Revises: 0005_activity_payloads
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_activity_log_partitions'
+down_revision = '0005_activity_payloads'
+branch_labels = None
+depends_on = None
+
+# Partizioni mensili create in anticipo oltre il mese corrente
+MONTHS_AHEAD = 2
+
+
+def _create_indexes():
+    op.create_index('ix_activity_logs_id', 'activity_logs', ['id'])
+    op.create_index('ix_activity_logs_action_type', 'activity_logs', ['action_type'])
+    op.create_index('ix_activity_logs_entity_type', 'activity_logs', ['entity_type'])
+    op.create_index('ix_activity_logs_timestamp', 'activity_logs', ['timestamp'])
+    op.create_index('ix_activity_logs_professor_id_timestamp', 'activity_logs', ['professor_id', 'timestamp'])
+    op.create_index(
+        'ix_activity_logs_payload', 'activity_logs', ['payload'],
+        postgresql_using='gin', postgresql_ops={'payload': 'jsonb_path_ops'}
+    )
+
+
+def upgrade():
+    # La tabella esistente viene rinominata e copiata nella nuova tabella partizionata
+    op.execute("ALTER TABLE activity_logs RENAME TO activity_logs_unpartitioned")
+    op.execute("ALTER TABLE activity_logs_unpartitioned RENAME CONSTRAINT activity_logs_pkey TO activity_logs_unpartitioned_pkey")
+    op.execute("ALTER SEQUENCE activity_logs_id_seq OWNED BY NONE")
+
+    op.execute("""
+        CREATE TABLE activity_logs (
+            id INTEGER NOT NULL DEFAULT nextval('activity_logs_id_seq'),
+            professor_id INTEGER REFERENCES professors (id),
+            action_type VARCHAR,
+            entity_type VARCHAR,
+            entity_id INTEGER,
+            description TEXT,
+            payload JSONB,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT activity_logs_pkey PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+
+    # Una partizione per ogni mese dal log più vecchio fino a MONTHS_AHEAD mesi dopo quello corrente
+    op.execute(f"""
+        DO $$
+        DECLARE
+            month_start DATE;
+            last_month DATE := date_trunc('month', now())::date + interval '{MONTHS_AHEAD} months';
+        BEGIN
+            SELECT COALESCE(date_trunc('month', MIN(timestamp))::date, date_trunc('month', now())::date)
+            INTO month_start FROM activity_logs_unpartitioned;
+
+            WHILE month_start <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF activity_logs FOR VALUES FROM (%L) TO (%L)',
+                    'activity_logs_' || to_char(month_start, 'YYYY_MM'),
+                    month_start,
+                    (month_start + interval '1 month')::date
+                );
+                month_start := (month_start + interval '1 month')::date;
+            END LOOP;
+        END $$
+    """)
+    op.execute("CREATE TABLE activity_logs_default PARTITION OF activity_logs DEFAULT")
+
+    op.execute("""
+        INSERT INTO activity_logs (id, professor_id, action_type, entity_type, entity_id, description, payload, timestamp)
+        SELECT id, professor_id, action_type, entity_type, entity_id, description, payload, COALESCE(timestamp, now())
+        FROM activity_logs_unpartitioned
+    """)
+
+    op.execute("ALTER SEQUENCE activity_logs_id_seq OWNED BY activity_logs.id")
+    op.drop_table('activity_logs_unpartitioned')
+
+    _create_indexes()
+
+
+def downgrade():
+    op.execute("ALTER TABLE activity_logs RENAME TO activity_logs_partitioned")
+    op.execute("ALTER TABLE activity_logs_partitioned RENAME CONSTRAINT activity_logs_pkey TO activity_logs_partitioned_pkey")
+    op.execute("ALTER SEQUENCE activity_logs_id_seq OWNED BY NONE")
+    for index in ('ix_activity_logs_id', 'ix_activity_logs_action_type', 'ix_activity_logs_entity_type',
+                  'ix_activity_logs_timestamp', 'ix_activity_logs_professor_id_timestamp', 'ix_activity_logs_payload'):
+        op.drop_index(index, table_name='activity_logs_partitioned')
+
+    op.execute("""
+        CREATE TABLE activity_logs (
+            id INTEGER NOT NULL DEFAULT nextval('activity_logs_id_seq') PRIMARY KEY,
+            professor_id INTEGER REFERENCES professors (id),
+            action_type VARCHAR,
+            entity_type VARCHAR,
+            entity_id INTEGER,
+            description TEXT,
+            payload JSONB,
+            timestamp TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+    """)
+    op.execute("INSERT INTO activity_logs SELECT id, professor_id, action_type, entity_type, entity_id, description, payload, timestamp FROM activity_logs_partitioned")
+    op.execute("ALTER SEQUENCE activity_logs_id_seq OWNED BY activity_logs.id")
+    # Elimina la tabella partizionata con tutte le sue partizioni
+    op.execute("DROP TABLE activity_logs_partitioned CASCADE")
+
+    _create_indexes()
@@ -0,0 +1,46 @@
+"""Indici trigram e full-text per la ricerca
+
+Revision ID: 0007_search_indexes
+Revises: 0006_activity_log_partitions
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_search_indexes'
+down_revision = '0006_activity_log_partitions'
+branch_labels = None
+depends_on = None
+
+SEARCH_NAME_SQL = "lower(first_name || ' ' || last_name)"
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    for table in ('students', 'professors'):
+        op.add_column(table, sa.Column('search_name', sa.Text(), sa.Computed(SEARCH_NAME_SQL, persisted=True)))
+        op.create_index(
+            f'ix_{table}_search_name_trgm', table, ['search_name'],
+            postgresql_using='gin', postgresql_ops={'search_name': 'gin_trgm_ops'}
+        )
+
+    op.create_index(
+        'ix_activity_logs_description_trgm', 'activity_logs', ['description'],
+        postgresql_using='gin', postgresql_ops={'description': 'gin_trgm_ops'}
+    )
+    op.execute("""
+        CREATE INDEX ix_activity_logs_description_fts ON activity_logs
+        USING gin (to_tsvector('italian', coalesce(description, '')))
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_activity_logs_description_fts', table_name='activity_logs')
+    op.drop_index('ix_activity_logs_description_trgm', table_name='activity_logs')
+    for table in ('students', 'professors'):
+        op.drop_index(f'ix_{table}_search_name_trgm', table_name=table)
+        op.drop_column(table, 'search_name')
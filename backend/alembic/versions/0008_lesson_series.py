@@ -0,0 +1,55 @@
+"""Serie di lezioni ricorrenti
+
+Revision ID: 0008_lesson_series
+Revises: 0007_search_indexes
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_lesson_series'
+down_revision = '0007_search_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'lesson_series',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('professor_id', sa.Integer(), sa.ForeignKey('professors.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('student_id', sa.Integer(), sa.ForeignKey('students.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('weekday', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.Time(), nullable=True),
+        sa.Column('duration', sa.DECIMAL(5, 2), nullable=False),
+        sa.Column('hourly_rate', sa.DECIMAL(10, 2), nullable=False),
+        sa.Column('is_package', sa.Boolean(), nullable=True),
+        sa.Column('package_id', sa.Integer(), sa.ForeignKey('packages.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('price', sa.DECIMAL(10, 2), nullable=False),
+        sa.Column('is_online', sa.Boolean(), nullable=True),
+        sa.Column('start_date', sa.Date(), nullable=False),
+        sa.Column('end_date', sa.Date(), nullable=False),
+        sa.Column('created_by', sa.Integer(), sa.ForeignKey('professors.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.CheckConstraint('weekday BETWEEN 0 AND 6', name='lesson_series_valid_weekday'),
+        sa.CheckConstraint('duration > 0', name='lesson_series_positive_duration'),
+        sa.CheckConstraint('end_date >= start_date', name='lesson_series_valid_range'),
+    )
+    op.create_index('ix_lesson_series_id', 'lesson_series', ['id'])
+    op.create_index('ix_lesson_series_student_id', 'lesson_series', ['student_id'])
+    op.create_index('ix_lesson_series_professor_id', 'lesson_series', ['professor_id'])
+
+    op.add_column(
+        'lessons',
+        sa.Column('series_id', sa.Integer(), sa.ForeignKey('lesson_series.id', ondelete='SET NULL'), nullable=True)
+    )
+    op.create_index('ix_lessons_series_id', 'lessons', ['series_id'])
+
+
+def downgrade():
+    op.drop_index('ix_lessons_series_id', table_name='lessons')
+    op.drop_column('lessons', 'series_id')
+    op.drop_table('lesson_series')
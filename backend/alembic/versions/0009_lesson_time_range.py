@@ -0,0 +1,47 @@
+"""Intervallo orario delle lezioni con indici GiST per le sovrapposizioni
+
+Revision ID: 0009_lesson_time_range
+Revises: 0008_lesson_series
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_lesson_time_range'
+down_revision = '0008_lesson_series'
+branch_labels = None
+depends_on = None
+
+LESSON_TIME_RANGE_SQL = (
+    "CASE WHEN start_time IS NULL THEN NULL ELSE tsrange("
+    "lesson_date + start_time, "
+    "lesson_date + start_time + duration::double precision * interval '1 hour', '[)') END"
+)
+
+
+def upgrade():
+    # Indici GiST su colonne intere insieme all'intervallo
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+
+    op.add_column(
+        'lessons',
+        sa.Column('time_range', postgresql.TSRANGE(), sa.Computed(LESSON_TIME_RANGE_SQL, persisted=True))
+    )
+    op.create_index(
+        'ix_lessons_student_id_time_range', 'lessons', ['student_id', 'time_range'],
+        postgresql_using='gist'
+    )
+    op.create_index(
+        'ix_lessons_professor_id_time_range', 'lessons', ['professor_id', 'time_range'],
+        postgresql_using='gist'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_lessons_professor_id_time_range', table_name='lessons')
+    op.drop_index('ix_lessons_student_id_time_range', table_name='lessons')
+    op.drop_column('lessons', 'time_range')
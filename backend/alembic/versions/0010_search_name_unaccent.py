@@ -0,0 +1,41 @@
+"""search_name senza accenti per la ricerca approssimata degli studenti
+
+Revision ID: 0010_search_name_unaccent
+Revises: 0009_lesson_time_range
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_search_name_unaccent'
+down_revision = '0009_lesson_time_range'
+branch_labels = None
+depends_on = None
+
+SEARCH_ACCENTS_FROM = "àáâãäåèéêëìíîïòóôõöùúûüýÿñçÀÁÂÃÄÅÈÉÊËÌÍÎÏÒÓÔÕÖÙÚÛÜÝÑÇ"
+SEARCH_ACCENTS_TO = "aaaaaaeeeeiiiiooooouuuuyyncaaaaaaeeeeiiiiooooouuuuync"
+SEARCH_NAME_SQL = f"translate(lower(first_name || ' ' || last_name), '{SEARCH_ACCENTS_FROM}', '{SEARCH_ACCENTS_TO}')"
+PREVIOUS_SEARCH_NAME_SQL = "lower(first_name || ' ' || last_name)"
+
+
+def _replace_search_name(expression):
+    # L'espressione di una colonna generata non si può modificare: va ricreata con il suo indice
+    for table in ('students', 'professors'):
+        op.drop_index(f'ix_{table}_search_name_trgm', table_name=table)
+        op.drop_column(table, 'search_name')
+        op.add_column(table, sa.Column('search_name', sa.Text(), sa.Computed(expression, persisted=True)))
+        op.create_index(
+            f'ix_{table}_search_name_trgm', table, ['search_name'],
+            postgresql_using='gin', postgresql_ops={'search_name': 'gin_trgm_ops'}
+        )
+
+
+def upgrade():
+    _replace_search_name(SEARCH_NAME_SQL)
+
+
+def downgrade():
+    _replace_search_name(PREVIOUS_SEARCH_NAME_SQL)
@@ -0,0 +1,236 @@
+# app/activity_archive.py
+"""
+Partizioni mensili di activity_logs, retention e archivio compresso.
+
+activity_logs è partizionata per mese su timestamp (partizioni activity_logs_YYYY_MM
+più la partizione activity_logs_default di sicurezza). Il job di manutenzione:
+- crea in anticipo le partizioni dei prossimi mesi;
+- esporta le partizioni più vecchie dell'orizzonte di retention in file NDJSON
+  compressi (gzip), poi le stacca e le elimina.
+
+Gli archivi possono essere reimportati per gli audit: la partizione del mese
+viene ricreata e le righe reinserite con i loro id originali.
+"""
+import asyncio
+import gzip
+import json
+import os
+import re
+from datetime import date, datetime
+from typing import Optional, List, Dict, Any, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+from .finance_rollups import month_start
+
+# Mesi di log da mantenere nel database (0 = nessuna retention, i log non vengono archiviati)
+ACTIVITY_LOG_RETENTION_MONTHS = int(os.environ.get("ACTIVITY_LOG_RETENTION_MONTHS", "0"))
+# Cartella dei file di archivio
+ACTIVITY_LOG_ARCHIVE_DIR = os.environ.get("ACTIVITY_LOG_ARCHIVE_DIR", "archives/activity_logs")
+# Partizioni create in anticipo oltre il mese corrente
+ACTIVITY_LOG_PARTITIONS_AHEAD = int(os.environ.get("ACTIVITY_LOG_PARTITIONS_AHEAD", "2"))
+
+PARENT_TABLE = "activity_logs"
+DEFAULT_PARTITION = "activity_logs_default"
+PARTITION_PATTERN = re.compile(r"^activity_logs_(\d{4})_(\d{2})$")
+ARCHIVE_PATTERN = re.compile(r"activity_logs_(\d{4})_(\d{2})\.ndjson\.gz$")
+IMPORT_BATCH_SIZE = 1000
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month.year:04d}_{month.month:02d}"
+
+def list_partitions(db: Session) -> Dict[date, str]:
+    """Partizioni mensili esistenti, per mese."""
+    names = db.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'activity_logs'::regclass
+    """)).scalars().all()
+    partitions = {}
+    for name in names:
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+def _table_exists(db: Session, name: str) -> bool:
+    return db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None
+
+def create_month_partition(db: Session, month: date) -> bool:
+    """
+    Crea la partizione di un mese se non esiste, nella transazione del chiamante.
+    Le righe del mese finite nella partizione di default vengono spostate nella nuova partizione.
+
+    Returns:
+        True se la partizione è stata creata
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    if _table_exists(db, name):
+        return False
+
+    bounds = {"start": month, "end": add_months(month, 1)}
+    moved = []
+    if _table_exists(db, DEFAULT_PARTITION):
+        moved = db.execute(text(f"""
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE timestamp >= :start AND timestamp < :end
+            RETURNING *
+        """), bounds).mappings().all()
+
+    # I limiti della partizione devono essere letterali: sono date generate qui, non input utente
+    db.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{bounds['start'].isoformat()}') TO ('{bounds['end'].isoformat()}')"
+    ))
+    if moved:
+        db.execute(pg_insert(models.ActivityLog), [dict(row) for row in moved])
+    return True
+
+def ensure_activity_partitions(db: Session, today: Optional[date] = None, months_ahead: Optional[int] = None) -> List[str]:
+    """Crea le partizioni dal mese corrente a months_ahead mesi dopo. Restituisce quelle create."""
+    today = today or date.today()
+    months_ahead = ACTIVITY_LOG_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    created = []
+    current = month_start(today)
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_month_partition(db, month):
+            created.append(partition_name(month))
+    db.commit()
+    return created
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+
+def export_partition(db: Session, name: str, archive_dir: str) -> Tuple[str, int]:
+    """
+    Esporta una partizione in <archive_dir>/<name>.ndjson.gz, una riga JSON per attività.
+    Il file viene scritto in un file temporaneo e rinominato solo a scrittura completata.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.ndjson.gz")
+    tmp_path = path + ".tmp"
+
+    result = db.connection().execution_options(stream_results=True, yield_per=IMPORT_BATCH_SIZE).execute(
+        text(f"SELECT * FROM {name} ORDER BY timestamp, id")
+    )
+    count = 0
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+            for row in result.mappings():
+                archive.write(json.dumps(dict(row), default=_json_default, ensure_ascii=False).encode("utf-8"))
+                archive.write(b"\n")
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+    return path, count
+
+def archive_old_partitions(
+    db: Session,
+    retention_months: Optional[int] = None,
+    archive_dir: Optional[str] = None,
+    today: Optional[date] = None,
+    dry_run: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Archivia le partizioni dei mesi precedenti all'orizzonte di retention:
+    export NDJSON compresso, poi DETACH e DROP della partizione in una transazione breve.
+    Se il numero di righe della partizione non coincide con quello esportato, la partizione non viene eliminata.
+    """
+    retention_months = ACTIVITY_LOG_RETENTION_MONTHS if retention_months is None else retention_months
+    archive_dir = archive_dir or ACTIVITY_LOG_ARCHIVE_DIR
+    if retention_months <= 0:
+        return []
+
+    cutoff = add_months(month_start(today or date.today()), -retention_months)
+    expired = sorted((month, name) for month, name in list_partitions(db).items() if month < cutoff)
+
+    report = []
+    for month, name in expired:
+        if dry_run:
+            report.append({"partition": name, "month": month, "path": None, "rows": None})
+            continue
+
+        path, exported = export_partition(db, name, archive_dir)
+        db.commit()
+
+        db.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        rows = db.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+        if rows != exported:
+            db.rollback()
+            raise RuntimeError(f"La partizione {name} contiene {rows} righe ma ne sono state esportate {exported}")
+        db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+
+        report.append({"partition": name, "month": month, "path": path, "rows": exported})
+    return report
+
+def import_archive(db: Session, path: str) -> int:
+    """
+    Reimporta un archivio NDJSON compresso: ricrea la partizione del mese e reinserisce le righe
+    (le righe già presenti vengono ignorate, quindi l'import può essere ripetuto).
+
+    Returns:
+        Numero di righe lette dall'archivio
+    """
+    match = ARCHIVE_PATTERN.search(os.path.basename(path))
+    if not match:
+        raise ValueError(f"Nome file non valido (atteso activity_logs_YYYY_MM.ndjson.gz): {path}")
+    create_month_partition(db, date(int(match.group(1)), int(match.group(2)), 1))
+
+    statement = pg_insert(models.ActivityLog).on_conflict_do_nothing(index_elements=["id", "timestamp"])
+    count = 0
+    batch = []
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                db.execute(statement, batch)
+                count += len(batch)
+                batch = []
+    if batch:
+        db.execute(statement, batch)
+        count += len(batch)
+    db.commit()
+    return count
+
+def run_activity_log_maintenance() -> Dict[str, Any]:
+    """Crea le partizioni future e archivia quelle oltre la retention, in una sessione dedicata."""
+    db = SessionLocal()
+    try:
+        created = ensure_activity_partitions(db)
+        archived = archive_old_partitions(db)
+        return {"created": created, "archived": archived}
+    finally:
+        db.close()
+
+async def activity_log_maintenance_loop():
+    """Loop in-process: manutenzione delle partizioni all'avvio e poi ogni notte."""
+    from .package_maintenance import seconds_until_next_run
+
+    while True:
+        try:
+            result = await asyncio.to_thread(run_activity_log_maintenance)
+            if result["created"]:
+                print(f"Log attività: create le partizioni {', '.join(result['created'])}")
+            for item in result["archived"]:
+                print(f"Log attività: archiviata {item['partition']} ({item['rows']} righe) in {item['path']}")
+        except Exception as e:
+            print(f"Errore durante la manutenzione del log attività: {e}")
+        await asyncio.sleep(seconds_until_next_run())
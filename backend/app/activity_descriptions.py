@@ -0,0 +1,271 @@
+# app/activity_descriptions.py
+"""
+Payload strutturati del log delle attività e rendering delle descrizioni.
+
+Le attività non salvano più una descrizione testuale: salvano un payload JSONB
+con il template da usare e i dati dell'operazione (id delle entità coinvolte,
+ore, importi, date). La descrizione viene costruita in lettura, risolvendo i
+nomi di studenti e professori con una query per tipo di entità.
+
+Chiavi del payload indicizzate (GIN, jsonb_path_ops) e usate nei filtri:
+student_ids, professor_ids, package_ids.
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Optional, List, Dict, Any, Iterable
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from . import models
+
+def activity_payload(
+    template: str,
+    student_ids: Optional[Iterable[int]] = None,
+    professor_ids: Optional[Iterable[int]] = None,
+    package_ids: Optional[Iterable[int]] = None,
+    **data
+) -> Dict[str, Any]:
+    """
+    Costruisce il payload di un'attività convertendo i valori in tipi JSON
+    (Decimal -> float, date -> stringa ISO) e scartando i valori None.
+    """
+    payload = {"template": template}
+    for key, ids in (("student_ids", student_ids), ("professor_ids", professor_ids), ("package_ids", package_ids)):
+        if ids:
+            payload[key] = [int(entity_id) for entity_id in ids]
+    for key, value in data.items():
+        if value is None:
+            continue
+        if isinstance(value, Decimal):
+            value = float(value)
+        elif isinstance(value, date):
+            value = value.isoformat()
+        payload[key] = value
+    return payload
+
+def payload_contains(**ids) -> Any:
+    """Condizione di contenimento (@>) sul payload, servita dall'indice GIN: es. student_ids=5."""
+    return models.ActivityLog.payload.contains({key: [value] for key, value in ids.items()})
+
+def payload_matches_any(key: str, ids: Iterable[int]) -> Any:
+    """OR di condizioni di contenimento per un elenco di id (es. studenti trovati per nome)."""
+    return or_(*[models.ActivityLog.payload.contains({key: [entity_id]}) for entity_id in ids])
+
+# Formattazione dei valori del payload
+
+def _hours(value) -> str:
+    return f"{float(value):g}"
+
+def _money(value) -> str:
+    return f"{float(value):.2f}"
+
+def _day(value) -> str:
+    return date.fromisoformat(value[:10]).strftime('%d/%m/%Y')
+
+def _names(ids, names: Dict[int, str], label: str, empty: str) -> str:
+    if not ids:
+        return empty
+    return ", ".join(names.get(entity_id) or f"{label} #{entity_id}" for entity_id in ids)
+
+def _students(p, names) -> str:
+    return _names(p.get("student_ids"), names["students"], "Studente", "nessuno studente")
+
+def _subject(p, lookup: Dict[int, str], ids_key: str, name_key: str, label: str, empty: str) -> str:
+    # Nome attuale se l'entità esiste ancora, altrimenti quello salvato nel payload (es. dopo un'eliminazione)
+    ids = p.get(ids_key) or []
+    if ids and ids[0] in lookup:
+        return lookup[ids[0]]
+    if p.get(name_key):
+        return p[name_key]
+    return f"{label} #{ids[0]}" if ids else empty
+
+def _professor(p, names) -> str:
+    return _subject(p, names["professors"], "professor_ids", "professor_name", "Professore", "Professore sconosciuto")
+
+def _student(p, names) -> str:
+    return _subject(p, names["students"], "student_ids", "student_name", "Studente", "studente sconosciuto")
+
+def _lesson_kind(p) -> str:
+    return "da pacchetto" if p.get("is_package") else "singola"
+
+def _payment_change(p, price_key: str) -> str:
+    if "paid" in p:
+        return f" - impostata come pagata (€{_money(p[price_key])})" if p["paid"] else " - impostata come non pagata"
+    if "new_price" in p:
+        return f" - aggiornato importo pagamento a €{_money(p['new_price'])}"
+    return ""
+
+def _render_lesson_created(p, names):
+    overflow = p.get("overflow")
+    if overflow == "single":
+        return f"Lezione singola per {_students(p, names)} di {_hours(p['hours'])} ore (overflow da pacchetto)"
+    if overflow == "new_package":
+        return f"Lezione in nuovo pacchetto per {_students(p, names)} di {_hours(p['hours'])} ore"
+    if overflow == "package":
+        return f"Lezione da pacchetto per {_students(p, names)} di {_hours(p['hours'])} ore"
+    return f"Creata lezione {_lesson_kind(p)} per {_students(p, names)} di {_hours(p['hours'])} ore"
+
+def _render_lesson_updated(p, names):
+    description = f"Lezione {_lesson_kind(p)} per {_students(p, names)} di {_hours(p['hours'])} ore"
+    return description + _payment_change(p, "price")
+
+def _render_package_updated(p, names):
+    description = f"Modificato pacchetto di {_hours(p['hours'])} ore per {_students(p, names)}"
+    if "paid" in p:
+        return description + (f" - impostato come pagato (€{_money(p['cost'])})" if p["paid"] else " - impostato come non pagato")
+    if "new_price" in p:
+        return description + f" - aggiornato importo pagamento a €{_money(p['new_price'])}"
+    return description
+
+def _render_package_created(p, names):
+    if p.get("overflow"):
+        return f"Nuovo pacchetto creato per {_students(p, names)} di {_hours(p['hours'])} ore (overflow)"
+    return f"Creato pacchetto di {_hours(p['hours'])} ore per {_students(p, names)}"
+
+def _render_payment_added(p, names):
+    description = f"Aggiunto pagamento di €{_money(p['amount'])} al pacchetto per {_students(p, names)}"
+    return description + (" (pacchetto aperto)" if p.get("open_package") else "")
+
+def _render_professor(verb):
+    def render(p, names):
+        description = f"{verb} professore {_professor(p, names)}"
+        if verb != "Aggiornato":
+            return description + (" (admin)" if p.get("is_admin") else "")
+        if p.get("password_changed"):
+            description += " (modificata password)"
+        if "is_admin" in p:
+            description += f" (status admin: {p['is_admin']})"
+        if p.get("notes_changed"):
+            description += " (modificate note)"
+        return description
+    return render
+
+def _render_weekly_payment(p, names):
+    status_text = "pagato" if p.get("paid") else "non pagato"
+    date_info = f" in data {_day(p['marked_at'])}" if p.get("paid") and p.get("marked_at") else ""
+    return f"Marcato {_professor(p, names)} come {status_text}{date_info} per la settimana del {_day(p['week_start_date'])}"
+
+WEEKDAY_NAMES = ["lunedì", "martedì", "mercoledì", "giovedì", "venerdì", "sabato", "domenica"]
+
+PACKAGE_STATUS_LABELS = {"expired": "scaduto", "completed": "completato"}
+
+TEMPLATES = {
+    "lesson_created": _render_lesson_created,
+    "lesson_updated": _render_lesson_updated,
+    "lesson_deleted": lambda p, n: f"Lezione {_lesson_kind(p)} per {_students(p, n)} di {_hours(p['hours'])} ore",
+    "lesson_import": lambda p, n: (
+        f"Importate da CSV {p['lesson_count']} lezioni ({_hours(p['hours'])} ore)"
+        + (f", {p['rejected']} righe scartate" if p.get("rejected") else "")
+    ),
+    "lesson_series_created": lambda p, n: (
+        f"Creata serie di {p['lesson_count']} lezioni ogni {WEEKDAY_NAMES[p['weekday']]} per {_students(p, n)} "
+        f"dal {_day(p['start_date'])} al {_day(p['end_date'])}"
+        + (f" ({p['skipped']} date saltate per conflitti)" if p.get("skipped") else "")
+    ),
+    "lesson_series_updated": lambda p, n: f"Modificate {p['lesson_count']} lezioni della serie per {_students(p, n)} dal {_day(p['from_date'])}",
+    "lesson_series_cancelled": lambda p, n: f"Annullate {p['lesson_count']} lezioni della serie per {_students(p, n)} dal {_day(p['from_date'])}",
+    "package_created": _render_package_created,
+    "package_updated": _render_package_updated,
+    "package_extended": lambda p, n: f"Estesa scadenza del pacchetto per {_students(p, n)} a {_day(p['expiry_date'])}",
+    "package_extension_cancelled": lambda p, n: f"Annullata estensione del pacchetto per {_students(p, n)}, nuova scadenza: {_day(p['expiry_date'])}",
+    "package_deleted": lambda p, n: f"Eliminato pacchetto di {_hours(p['hours'])} ore per {_students(p, n)}",
+    "package_status_auto": lambda p, n: f"Pacchetto impostato automaticamente come {PACKAGE_STATUS_LABELS.get(p['status'], p['status'])}",
+    "package_payment_added": _render_payment_added,
+    "package_payment_deleted": lambda p, n: f"Eliminato pagamento di €{_money(p['amount'])} dal pacchetto per {_students(p, n)}",
+    "student_created": lambda p, n: f"Creato studente {_student(p, n)}",
+    "student_updated": lambda p, n: f"Aggiornato studente {_student(p, n)}",
+    "student_deleted": lambda p, n: f"Eliminato studente {_student(p, n)}",
+    "students_merged": lambda p, n: (
+        f"Uniti a {_student(p, n)} i duplicati {', '.join(p['merged_names'])}: "
+        f"spostate {p['lesson_count']} lezioni e {p['package_count']} pacchetti"
+    ),
+    "professor_created": _render_professor("Creato"),
+    "professor_updated": _render_professor("Aggiornato"),
+    "professor_deleted": _render_professor("Eliminato"),
+    "professor_weekly_payment": _render_weekly_payment,
+    "professor_weekly_payment_deleted": lambda p, n: f"Eliminato record pagamento settimanale per {_professor(p, n)} della settimana del {_day(p['week_start_date'])}",
+}
+
+def _lookup_names(db: Session, model, ids: set) -> Dict[int, str]:
+    if not ids:
+        return {}
+    rows = db.query(model.id, model.first_name, model.last_name).filter(model.id.in_(ids)).all()
+    return {row.id: f"{row.first_name} {row.last_name}" for row in rows}
+
+# Nomi salvati nei payload quando un'entità sparisce: (template, chiave degli id, chiave dei nomi)
+NAME_SNAPSHOTS = {
+    "students": [("student_deleted", "student_ids", "student_name"), ("students_merged", "merged_ids", "merged_names")],
+    "professors": [("professor_deleted", "professor_ids", "professor_name")],
+}
+
+def _snapshot_names(payload: Dict[str, Any], kind: str) -> Dict[int, str]:
+    for template, ids_key, names_key in NAME_SNAPSHOTS[kind]:
+        if payload.get("template") == template:
+            names = payload.get(names_key)
+            if isinstance(names, str):
+                names = [names]
+            return dict(zip(payload.get(ids_key) or [], names or []))
+    return {}
+
+def _fallback_names(db: Session, activities: List[models.ActivityLog], kind: str, missing: set) -> Dict[int, str]:
+    """
+    Nomi di studenti o professori non più esistenti (eliminati o uniti), presi dalle istantanee
+    nei payload: prima dalle attività già lette, poi con una query servita dall'indice GIN.
+    """
+    found = {}
+    for activity in activities:
+        if activity.payload:
+            found.update({k: v for k, v in _snapshot_names(activity.payload, kind).items() if k in missing})
+    remaining = missing - found.keys()
+    if remaining:
+        conditions = [
+            models.ActivityLog.payload.contains({"template": template, ids_key: [entity_id]})
+            for template, ids_key, _ in NAME_SNAPSHOTS[kind]
+            for entity_id in remaining
+        ]
+        for (payload,) in db.query(models.ActivityLog.payload).filter(or_(*conditions)):
+            found.update({k: v for k, v in _snapshot_names(payload, kind).items() if k in remaining})
+    return found
+
+def render_activity_description(payload: Optional[Dict[str, Any]], names: Dict[str, Dict[int, str]]) -> Optional[str]:
+    render = TEMPLATES.get((payload or {}).get("template"))
+    if render is None:
+        return None
+    return render(payload, names)
+
+def render_activities(db: Session, activities: List[models.ActivityLog]) -> List[Dict[str, Any]]:
+    """
+    Converte le attività in dizionari per ActivityLogResponse, con la descrizione
+    resa dal payload. I nomi vengono risolti con una query per studenti e una per professori;
+    per le entità eliminate o unite si usano i nomi salvati nei payload.
+    Le attività precedenti ai payload mantengono la descrizione salvata.
+    """
+    student_ids, professor_ids = set(), set()
+    for activity in activities:
+        if activity.payload:
+            student_ids.update(activity.payload.get("student_ids", []))
+            professor_ids.update(activity.payload.get("professor_ids", []))
+
+    names = {
+        "students": _lookup_names(db, models.Student, student_ids),
+        "professors": _lookup_names(db, models.Professor, professor_ids),
+    }
+    for kind, ids in (("students", student_ids), ("professors", professor_ids)):
+        missing = ids - names[kind].keys()
+        if missing:
+            names[kind].update(_fallback_names(db, activities, kind, missing))
+
+    return [
+        {
+            "id": activity.id,
+            "professor_id": activity.professor_id,
+            "action_type": activity.action_type,
+            "entity_type": activity.entity_type,
+            "entity_id": activity.entity_id,
+            "description": render_activity_description(activity.payload, names) or activity.description or "",
+            "payload": activity.payload,
+            "timestamp": activity.timestamp,
+        }
+        for activity in activities
+    ]
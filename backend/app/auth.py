@@ -1,8 +1,11 @@
 # app/auth.py
 from datetime import datetime, timedelta
-from typing import Optional
+from dataclasses import dataclass
+from typing import Optional, Dict, Tuple
 import os
 import secrets
+import threading
+import time
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -11,7 +14,8 @@ from sqlalchemy.orm import Session
 
 from . import models
 from .database import get_db
-from .utils import verify_password
+from .utils import password_needs_rehash
+from .password_pool import verify_password_async, get_password_hash_async
 
 # Configurazione JWT
 SECRET_KEY = os.environ.get("JWT_SECRET_KEY")
@@ -26,6 +30,72 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 ore
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Cache in-process dei professori autenticati, per username (subject del token).
+# Le modifiche ai professori la invalidano; negli altri worker le modifiche
+# (es. revoca dei privilegi admin) hanno effetto al più dopo PRINCIPAL_CACHE_TTL_SECONDS.
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_SIZE = 1024
+
+@dataclass(frozen=True)
+class Principal:
+    """Dati del professore autenticato, con gli stessi campi usati da ProfessorResponse."""
+    id: int
+    username: str
+    first_name: str
+    last_name: str
+    is_admin: bool
+    notes: Optional[str]
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_professor(cls, professor: models.Professor) -> "Principal":
+        return cls(
+            id=professor.id,
+            username=professor.username,
+            first_name=professor.first_name,
+            last_name=professor.last_name,
+            is_admin=bool(professor.is_admin),
+            notes=professor.notes,
+            created_at=professor.created_at,
+        )
+
+_principal_cache: Dict[str, Tuple[float, Principal]] = {}
+_principal_cache_lock = threading.Lock()
+
+def _get_cached_principal(username: str) -> Optional[Principal]:
+    with _principal_cache_lock:
+        entry = _principal_cache.get(username)
+        if entry is None:
+            return None
+        expires_at, principal = entry
+        if expires_at <= time.monotonic():
+            del _principal_cache[username]
+            return None
+        return principal
+
+def _cache_principal(principal: Principal):
+    if PRINCIPAL_CACHE_TTL_SECONDS <= 0:
+        return
+    with _principal_cache_lock:
+        if len(_principal_cache) >= PRINCIPAL_CACHE_MAX_SIZE:
+            # Elimina la voce più vicina alla scadenza
+            oldest = min(_principal_cache, key=lambda key: _principal_cache[key][0])
+            del _principal_cache[oldest]
+        _principal_cache[principal.username] = (time.monotonic() + PRINCIPAL_CACHE_TTL_SECONDS, principal)
+
+def invalidate_principal(*usernames: Optional[str]):
+    """
+    Rimuove i professori indicati dalla cache (senza argomenti la svuota).
+    Da chiamare dopo ogni modifica a username, privilegi, dati o password di un professore.
+    """
+    with _principal_cache_lock:
+        if not usernames:
+            _principal_cache.clear()
+            return
+        for username in usernames:
+            if username:
+                _principal_cache.pop(username, None)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Crea un token JWT con i dati forniti."""
     to_encode = data.copy()
@@ -37,17 +107,27 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def authenticate_professor(db: Session, username: str, password: str):
-    """Autentica un professore per username e password."""
+async def authenticate_professor(db: Session, username: str, password: str):
+    """
+    Autentica un professore per username e password.
+    La verifica bcrypt avviene nel pool dedicato; se l'hash salvato usa un costo
+    diverso da BCRYPT_ROUNDS viene rigenerato con la password appena verificata.
+    """
     professor = db.query(models.Professor).filter(models.Professor.username == username).first()
     if not professor:
         return False
-    if not verify_password(password, professor.password):
+    if not await verify_password_async(password, professor.password):
         return False
+    if password_needs_rehash(professor.password):
+        professor.password = await get_password_hash_async(password)
+        db.commit()
     return professor
 
 async def get_current_professor(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Ottiene il professore corrente dal token JWT."""
+    """
+    Ottiene il professore corrente dal token JWT.
+    Restituisce un Principal (id, username, nome, is_admin...), servito dalla cache quando possibile.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Credenziali non valide",
@@ -61,11 +141,17 @@ async def get_current_professor(token: str = Depends(oauth2_scheme), db: Session
     except JWTError:
         raise credentials_exception
     
+    principal = _get_cached_principal(username)
+    if principal is not None:
+        return principal
+    
     professor = db.query(models.Professor).filter(models.Professor.username == username).first()
     if professor is None:
         raise credentials_exception
     
-    return professor
+    principal = Principal.from_professor(professor)
+    _cache_principal(principal)
+    return principal
 
 async def get_current_admin(current_user: models.Professor = Depends(get_current_professor)):
     """Verifica che il professore corrente sia un amministratore."""
@@ -1,8 +1,14 @@
 # database.py
 import os
+import functools
 from sqlalchemy import create_engine # type: ignore
 from sqlalchemy.ext.declarative import declarative_base # type: ignore
-from sqlalchemy.orm import sessionmaker # type: ignore
+from sqlalchemy.orm import sessionmaker, Session # type: ignore
+from starlette.concurrency import run_in_threadpool
+
+from .pool_metrics import (
+    InstrumentedQueuePool, InstrumentedAsyncQueuePool, sync_pool_metrics, async_pool_metrics
+)
 
 # Configurazione del database con variabili d'ambiente
 DB_USER = os.environ.get('DB_USER')
@@ -11,18 +17,63 @@ DB_HOST = os.environ.get('DB_HOST', 'localhost')
 DB_PORT = os.environ.get('DB_PORT', '5432')
 DB_NAME = os.environ.get('DB_NAME', 'school_management')
 
+# Pool di connessioni (per processo/worker) e parametri di sessione
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))  # secondi di attesa per una connessione libera
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '0'))  # 0 = nessun limite
+DB_APPLICATION_NAME = os.environ.get('DB_APPLICATION_NAME', 'school_management_api')
+
+# Modalità async opzionale (asyncpg + AsyncSession) per gli endpoint di lettura
+DB_ASYNC = os.environ.get('DB_ASYNC', 'false').lower() == 'true'
+
 # Costruisci l'URL di connessione
 SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+POOL_OPTIONS = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=True,  # Verifica la connessione prima di usarla
+    pool_recycle=3600,   # Rinnova le connessioni dopo un'ora
+)
+
+# application_name e statement_timeout impostati all'apertura di ogni connessione
+sync_connect_args = {"application_name": DB_APPLICATION_NAME}
+if DB_STATEMENT_TIMEOUT_MS > 0:
+    sync_connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
 
 # Opzioni di connessione più sicure
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,  # Verifica la connessione prima di usarla
-    pool_recycle=3600,   # Rinnova le connessioni dopo un'ora
+    poolclass=InstrumentedQueuePool,
+    connect_args=sync_connect_args,
+    **POOL_OPTIONS
 )
+sync_pool_metrics.attach(engine.pool)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    server_settings = {"application_name": DB_APPLICATION_NAME}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=InstrumentedAsyncQueuePool,
+        connect_args={"server_settings": server_settings},
+        **POOL_OPTIONS
+    )
+    async_pool_metrics.attach(async_engine.sync_engine.pool)
+    # expire_on_commit=False: gli oggetti restano leggibili dopo la sessione senza nuovo I/O
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 # Dependency
@@ -31,4 +82,33 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Sessione degli endpoint di lettura: AsyncSession con DB_ASYNC=true, altrimenti la sessione sync
+get_read_db = get_async_db if DB_ASYNC else get_db
+
+async def run_db(db, fn, *args, **kwargs):
+    """
+    Esegue fn(session, *args, **kwargs) con la sessione fornita da get_read_db.
+    Con una AsyncSession il codice sync gira tramite run_sync (I/O asyncpg sull'event loop,
+    senza thread); con una Session sync gira nel threadpool, come un endpoint def.
+    """
+    if isinstance(db, Session):
+        return await run_in_threadpool(fn, db, *args, **kwargs)
+    return await db.run_sync(fn, *args, **kwargs)
+
+def async_db_route(endpoint):
+    """
+    Rende async un endpoint di lettura scritto in stile sync che riceve la sessione
+    nel parametro db = Depends(get_read_db). Il corpo dell'endpoint (query, conversione
+    della risposta e lazy load compresi) viene eseguito con run_db.
+    """
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        db = kwargs.pop("db")
+        return await run_db(db, lambda session: endpoint(*args, db=session, **kwargs))
+    return wrapper
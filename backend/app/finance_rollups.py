@@ -0,0 +1,137 @@
+# app/finance_rollups.py
+import asyncio
+import os
+from datetime import date
+from typing import List, Union
+
+from sqlalchemy import select, delete, insert, func, case, literal, union_all, and_, cast, Date, Integer
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+FINANCE_ROLLUP_REFRESH_SECONDS = int(os.environ.get("FINANCE_ROLLUP_REFRESH_SECONDS", "300"))
+
+def month_start(value: Union[date, str]) -> date:
+    """Primo giorno del mese della data (accetta anche stringhe ISO come quelle dei payload JSON)."""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return value.replace(day=1)
+
+def sql_month(column):
+    """Espressione SQL del primo giorno del mese di una colonna data."""
+    return cast(func.date_trunc("month", column), Date)
+
+def mark_finance_months_dirty(db: Session, *dates):
+    """
+    Segna come da ricalcolare i mesi delle date indicate, nella transazione del chiamante.
+    Da chiamare per ogni scrittura di lezioni, pagamenti di pacchetti o pacchetti.
+    """
+    months = {month_start(d) for d in dates if d}
+    if not months:
+        return
+    db.execute(
+        pg_insert(models.FinanceDirtyMonth).values(
+            [{"month": m} for m in sorted(months)]
+        ).on_conflict_do_nothing(index_elements=["month"])
+    )
+
+def mark_finance_months_dirty_from(db: Session, dates_select):
+    """Come mark_finance_months_dirty, per le date restituite da una select (una sola colonna)."""
+    dates = dates_select.subquery()
+    db.execute(
+        pg_insert(models.FinanceDirtyMonth).from_select(
+            ["month"],
+            select(sql_month(list(dates.c)[0])).distinct()
+        ).on_conflict_do_nothing(index_elements=["month"])
+    )
+
+def _rollup_source(months=None):
+    """Aggregati per mese x professore x tipo calcolati da lezioni e pagamenti dei pacchetti."""
+    zero = literal(0)
+    is_single = models.Lesson.is_package == False
+    lesson_month = sql_month(models.Lesson.lesson_date)
+    lesson_kind = case((is_single, "single"), else_="package")
+
+    lessons = select(
+        lesson_month.label("month"),
+        models.Lesson.professor_id.label("professor_id"),
+        lesson_kind.label("lesson_kind"),
+        func.count(models.Lesson.id).label("lesson_count"),
+        func.sum(models.Lesson.duration).label("hours"),
+        func.sum(models.Lesson.total_payment).label("professor_cost"),
+        func.coalesce(func.sum(models.Lesson.price).filter(and_(is_single, models.Lesson.is_paid == True)), 0).label("student_revenue"),
+        func.coalesce(func.sum(models.Lesson.price).filter(and_(is_single, models.Lesson.is_paid == False)), 0).label("student_unpaid"),
+        zero.label("package_payments"),
+    ).group_by(lesson_month, models.Lesson.professor_id, lesson_kind)
+
+    payment_month = sql_month(models.PackagePayment.payment_date)
+    payments = select(
+        payment_month.label("month"),
+        cast(literal(None), Integer).label("professor_id"),
+        literal("package_payment").label("lesson_kind"),
+        zero.label("lesson_count"),
+        zero.label("hours"),
+        zero.label("professor_cost"),
+        zero.label("student_revenue"),
+        zero.label("student_unpaid"),
+        func.sum(models.PackagePayment.amount).label("package_payments"),
+    ).group_by(payment_month)
+
+    if months is not None:
+        lessons = lessons.where(lesson_month.in_(months))
+        payments = payments.where(payment_month.in_(months))
+
+    return union_all(lessons, payments)
+
+ROLLUP_COLUMNS = [
+    "month", "professor_id", "lesson_kind", "lesson_count", "hours",
+    "professor_cost", "student_revenue", "student_unpaid", "package_payments",
+]
+
+def refresh_finance_rollups(db: Session, full: bool = False) -> List[date]:
+    """
+    Ricalcola i finance_rollups dei soli mesi nella coda finance_dirty_months
+    (o di tutti i mesi con full=True).
+
+    Returns:
+        Mesi ricalcolati (vuoto per la ricostruzione completa)
+    """
+    if full:
+        db.execute(delete(models.FinanceDirtyMonth))
+        db.execute(delete(models.FinanceRollup))
+        db.execute(insert(models.FinanceRollup).from_select(ROLLUP_COLUMNS, _rollup_source()))
+        db.commit()
+        return []
+
+    # Preleva i mesi dalla coda: una scrittura concorrente li rimetterà in coda per il giro successivo
+    months = db.execute(
+        delete(models.FinanceDirtyMonth).returning(models.FinanceDirtyMonth.month)
+    ).scalars().all()
+    if not months:
+        db.commit()
+        return []
+
+    db.execute(delete(models.FinanceRollup).where(models.FinanceRollup.month.in_(months)))
+    db.execute(insert(models.FinanceRollup).from_select(ROLLUP_COLUMNS, _rollup_source(months)))
+    db.commit()
+
+    return sorted(months)
+
+def run_finance_rollup_refresh(full: bool = False) -> List[date]:
+    """Esegue il ricalcolo in una sessione dedicata."""
+    db = SessionLocal()
+    try:
+        return refresh_finance_rollups(db, full=full)
+    finally:
+        db.close()
+
+async def finance_rollup_loop():
+    """Loop in-process: ricalcola periodicamente i mesi modificati."""
+    while True:
+        try:
+            await asyncio.to_thread(run_finance_rollup_refresh)
+        except Exception as e:
+            print(f"Errore durante l'aggiornamento dei finance_rollups: {e}")
+        await asyncio.sleep(FINANCE_ROLLUP_REFRESH_SECONDS)
@@ -0,0 +1,137 @@
+# app/lesson_conflicts.py
+"""
+Controllo delle sovrapposizioni di orario tra lezioni.
+
+Ogni lezione con orario di inizio ha nella colonna generata lessons.time_range l'intervallo
+[inizio, fine) calcolato da lesson_date, start_time e duration. Gli indici GiST
+(student_id, time_range) e (professor_id, time_range) rendono il controllo un singolo probe
+indicizzato, senza scaricare le lezioni nel client.
+
+Con LESSON_OVERLAP_ENFORCED=true create_lesson e update_lesson rifiutano (409) le lezioni
+che si sovrappongono a un'altra dello stesso studente o dello stesso professore; lo stesso
+controllo vale per le serie di lezioni (una sola query per tutte le date) e per l'import CSV.
+Non c'è un vincolo EXCLUDE sul database perché i dati storici possono già contenere
+sovrapposizioni.
+"""
+import os
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, func, or_, literal, text, DateTime
+from sqlalchemy.orm import Session
+
+from . import models
+
+LESSON_OVERLAP_ENFORCED = os.environ.get("LESSON_OVERLAP_ENFORCED", "false").lower() == "true"
+# Numero massimo di lezioni in conflitto restituite
+MAX_CONFLICTS = 20
+
+# Probe di più intervalli in un'unica query: ogni candidato è unito alle lezioni con &&
+SERIES_CONFLICTS_SQL = """
+    SELECT c.candidate_date, l.id, l.professor_id, l.student_id, l.lesson_date, l.start_time, l.duration
+    FROM unnest(CAST(:dates AS date[]), CAST(:starts AS timestamp[]), CAST(:ends AS timestamp[]))
+         AS c(candidate_date, range_start, range_end)
+    JOIN lessons l ON l.time_range && tsrange(c.range_start, c.range_end, '[)')
+    WHERE (l.student_id = :student_id OR l.professor_id = :professor_id)
+      AND l.id <> ALL(CAST(:exclude_ids AS integer[]))
+    ORDER BY c.candidate_date, l.lesson_date, l.start_time, l.id
+"""
+
+def lesson_time_range(lesson_date: date, start_time: Optional[time], duration) -> Optional[Tuple[datetime, datetime]]:
+    """Intervallo [inizio, fine) della lezione, come LESSON_TIME_RANGE_SQL; None senza orario."""
+    if start_time is None or duration is None:
+        return None
+    start = datetime.combine(lesson_date, start_time)
+    return start, start + timedelta(hours=float(Decimal(str(duration))))
+
+def _with_conflict_on(row, student_id: Optional[int], professor_id: Optional[int]) -> Dict[str, Any]:
+    """Riga della lezione in conflitto con conflict_on: studente, professore o entrambi."""
+    conflict = dict(row._mapping)
+    conflict["conflict_on"] = [
+        owner for owner, owner_id, row_id in (
+            ("student", student_id, row.student_id),
+            ("professor", professor_id, row.professor_id),
+        ) if owner_id is not None and owner_id == row_id
+    ]
+    return conflict
+
+def find_lesson_conflicts(
+    db: Session,
+    lesson_date: date,
+    start_time: Optional[time],
+    duration,
+    student_id: Optional[int] = None,
+    professor_id: Optional[int] = None,
+    exclude_lesson_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Lezioni dello studente e/o del professore che si sovrappongono all'intervallo indicato.
+    Ogni risultato riporta in conflict_on se il conflitto riguarda lo studente, il professore
+    o entrambi.
+    """
+    time_range = lesson_time_range(lesson_date, start_time, duration)
+    owners = []
+    if student_id is not None:
+        owners.append(models.Lesson.student_id == student_id)
+    if professor_id is not None:
+        owners.append(models.Lesson.professor_id == professor_id)
+    if time_range is None or not owners:
+        return []
+
+    probe = func.tsrange(literal(time_range[0], DateTime), literal(time_range[1], DateTime), "[)")
+    query = select(
+        models.Lesson.id,
+        models.Lesson.professor_id,
+        models.Lesson.student_id,
+        models.Lesson.lesson_date,
+        models.Lesson.start_time,
+        models.Lesson.duration,
+    ).where(
+        models.Lesson.time_range.op("&&")(probe),
+        or_(*owners),
+    ).order_by(models.Lesson.lesson_date, models.Lesson.start_time, models.Lesson.id).limit(MAX_CONFLICTS)
+    if exclude_lesson_id is not None:
+        query = query.where(models.Lesson.id != exclude_lesson_id)
+
+    return [_with_conflict_on(row, student_id, professor_id) for row in db.execute(query)]
+
+def find_series_conflicts(
+    db: Session,
+    candidates: Iterable[Tuple[date, Optional[time], Any]],
+    student_id: int,
+    professor_id: int,
+    exclude_lesson_ids: Iterable[int] = (),
+) -> Dict[date, List[Dict[str, Any]]]:
+    """
+    Come find_lesson_conflicts per più lezioni dello stesso studente e professore, con una
+    sola query: candidates è un elenco di (lesson_date, start_time, duration). Restituisce
+    le lezioni in conflitto per data del candidato (al massimo MAX_CONFLICTS per data);
+    i candidati senza orario sono ignorati.
+    """
+    dates, starts, ends = [], [], []
+    for lesson_date, start_time, duration in candidates:
+        time_range = lesson_time_range(lesson_date, start_time, duration)
+        if time_range is not None:
+            dates.append(lesson_date)
+            starts.append(time_range[0])
+            ends.append(time_range[1])
+    if not dates:
+        return {}
+
+    rows = db.execute(text(SERIES_CONFLICTS_SQL), {
+        "dates": dates,
+        "starts": starts,
+        "ends": ends,
+        "student_id": student_id,
+        "professor_id": professor_id,
+        "exclude_ids": list(exclude_lesson_ids),
+    })
+    conflicts: Dict[date, List[Dict[str, Any]]] = {}
+    for row in rows:
+        found = conflicts.setdefault(row.candidate_date, [])
+        if len(found) < MAX_CONFLICTS:
+            conflict = _with_conflict_on(row, student_id, professor_id)
+            del conflict["candidate_date"]
+            found.append(conflict)
+    return conflicts
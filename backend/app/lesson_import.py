@@ -0,0 +1,350 @@
+# app/lesson_import.py
+"""
+Import massivo di lezioni da CSV.
+
+Il file viene caricato con COPY in una tabella temporanea di staging (tutte colonne testo),
+poi convertito e validato con poche istruzioni SQL sull'intero insieme di righe:
+tipi e campi obbligatori, esistenza di professori e studenti, appartenenza dello studente
+al pacchetto, sovrapposizioni di orario (con LESSON_OVERLAP_ENFORCED), scadenza e ore
+disponibili del pacchetto (in ordine di riga). Le righe valide
+vengono inserite con un'unica INSERT ... SELECT; le ore dei pacchetti coinvolti sono
+aggiornate una volta per pacchetto alla fine. Le righe non valide vengono restituite
+con i relativi errori e non bloccano le altre.
+
+Colonne del CSV (intestazione obbligatoria, ordine libero):
+professor_id, student_id, lesson_date, duration, hourly_rate (obbligatorie),
+start_time, is_package, package_id, is_paid, payment_date, price, is_online.
+Con is_package=true e package_id vuoto si usa il pacchetto in corso dello studente.
+"""
+import csv
+import psycopg2
+from typing import IO, Dict, Any, List, Optional
+
+from sqlalchemy import text, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .activity_descriptions import activity_payload
+from .finance_rollups import mark_finance_months_dirty_from
+from .lesson_conflicts import LESSON_OVERLAP_ENFORCED
+from .routes.activity import log_activity
+
+# (colonna, tipo di conversione, obbligatoria)
+IMPORT_COLUMNS = [
+    ("professor_id", "int", True),
+    ("student_id", "int", True),
+    ("lesson_date", "date", True),
+    ("duration", "numeric", True),
+    ("hourly_rate", "numeric", True),
+    ("start_time", "time", False),
+    ("is_package", "bool", False),
+    ("package_id", "int", False),
+    ("is_paid", "bool", False),
+    ("payment_date", "date", False),
+    ("price", "numeric", False),
+    ("is_online", "bool", False),
+]
+SQL_TYPES = {"int": "integer", "date": "date", "numeric": "numeric", "time": "time", "bool": "boolean"}
+STAGING_TABLE = "lesson_import_staging"
+ROWS_TABLE = "lesson_import_rows"
+# Limiti delle colonne DECIMAL di lessons (duration 5,2 e importi 10,2)
+MAX_DURATION = 1000
+MAX_AMOUNT = 100000000
+
+def _create_cast_functions(db: Session):
+    """Funzioni temporanee che convertono un testo nel tipo richiesto, restituendo NULL se non valido."""
+    for name, sql_type in SQL_TYPES.items():
+        db.execute(text(f"""
+            CREATE OR REPLACE FUNCTION pg_temp.lesson_import_{name}(value text) RETURNS {sql_type} AS $$
+            BEGIN
+                RETURN value::{sql_type};
+            EXCEPTION WHEN others THEN
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql STABLE
+        """))
+
+def _read_header(stream: IO[str]) -> List[str]:
+    header_line = stream.readline()
+    if not header_line.strip():
+        raise ValueError("Il file CSV è vuoto")
+    header = [column.strip().lower() for column in next(csv.reader([header_line]))]
+
+    known = {name for name, _, _ in IMPORT_COLUMNS}
+    unknown = [column for column in header if column not in known]
+    if unknown:
+        raise ValueError(f"Colonne sconosciute: {', '.join(unknown)}")
+    missing = [name for name, _, required in IMPORT_COLUMNS if required and name not in header]
+    if missing:
+        raise ValueError(f"Colonne obbligatorie mancanti: {', '.join(missing)}")
+    if len(set(header)) != len(header):
+        raise ValueError("Colonne duplicate nell'intestazione")
+    return header
+
+def _copy_to_staging(db: Session, stream: IO[str], header: List[str]):
+    columns = ", ".join(f"{name} TEXT" for name, _, _ in IMPORT_COLUMNS)
+    db.execute(text(f"CREATE TEMP TABLE {STAGING_TABLE} (row_no SERIAL, {columns}) ON COMMIT DROP"))
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {STAGING_TABLE} ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)", stream)
+    except (psycopg2.DataError, UnicodeDecodeError) as e:
+        # Struttura del CSV non valida (numero di colonne, virgolette, codifica)
+        raise ValueError(f"CSV non valido: {getattr(e, 'pgerror', None) or e}")
+    finally:
+        cursor.close()
+
+def _build_rows(db: Session):
+    """Righe convertite nei tipi di lessons, con gli errori di formato e dei campi obbligatori."""
+    values = []
+    errors = []
+    for name, kind, required in IMPORT_COLUMNS:
+        raw = f"NULLIF(trim({name}), '')"
+        cast = f"pg_temp.lesson_import_{kind}({raw})"
+        values.append(f"{cast} AS {name}")
+        missing = f"'{name}: valore obbligatorio'" if required else "NULL"
+        errors.append(f"CASE WHEN {raw} IS NULL THEN {missing} WHEN {cast} IS NULL THEN '{name}: valore non valido' END")
+
+    db.execute(text(f"""
+        CREATE TEMP TABLE {ROWS_TABLE} ON COMMIT DROP AS
+        SELECT row_no, {', '.join(values)},
+               array_remove(ARRAY[{', '.join(errors)}]::text[], NULL) AS errors
+        FROM {STAGING_TABLE}
+    """))
+
+    # Valori di default come in POST /lessons/ e pacchetto in corso dello studente se non indicato
+    db.execute(text(f"""
+        UPDATE {ROWS_TABLE} SET
+            is_package = COALESCE(is_package, false),
+            is_paid = COALESCE(is_paid, false),
+            is_online = COALESCE(is_online, false)
+    """))
+    db.execute(text(f"""
+        UPDATE {ROWS_TABLE} r SET package_id = CASE WHEN r.is_package THEN COALESCE(r.package_id, (
+            SELECT p.id FROM packages p
+            JOIN package_students ps ON ps.package_id = p.id
+            WHERE ps.student_id = r.student_id AND p.status = 'in_progress'
+            ORDER BY p.start_date DESC, p.id DESC
+            LIMIT 1
+        )) END
+    """))
+
+def _validate_references(db: Session):
+    db.execute(text(f"""
+        UPDATE {ROWS_TABLE} r SET errors = r.errors || array_remove(ARRAY[
+            CASE WHEN r.duration <= 0 THEN 'duration: deve essere maggiore di zero' END,
+            CASE WHEN r.duration >= {MAX_DURATION} THEN 'duration: valore troppo grande' END,
+            CASE WHEN r.hourly_rate < 0 THEN 'hourly_rate: non può essere negativo' END,
+            CASE WHEN r.hourly_rate >= {MAX_AMOUNT} OR r.price >= {MAX_AMOUNT}
+                 OR r.duration * r.hourly_rate >= {MAX_AMOUNT} THEN 'importo troppo grande' END,
+            CASE WHEN r.price < 0 THEN 'price: non può essere negativo' END,
+            CASE WHEN r.professor_id IS NOT NULL
+                 AND NOT EXISTS (SELECT 1 FROM professors WHERE id = r.professor_id) THEN 'professore inesistente' END,
+            CASE WHEN r.student_id IS NOT NULL
+                 AND NOT EXISTS (SELECT 1 FROM students WHERE id = r.student_id) THEN 'studente inesistente' END,
+            CASE WHEN r.is_package AND r.package_id IS NULL AND r.student_id IS NOT NULL
+                 THEN 'nessun pacchetto in corso per lo studente' END,
+            CASE WHEN r.package_id IS NOT NULL
+                 AND NOT EXISTS (SELECT 1 FROM packages WHERE id = r.package_id) THEN 'pacchetto inesistente' END,
+            CASE WHEN r.package_id IS NOT NULL AND r.student_id IS NOT NULL
+                 AND EXISTS (SELECT 1 FROM packages WHERE id = r.package_id)
+                 AND NOT EXISTS (SELECT 1 FROM package_students
+                                 WHERE package_id = r.package_id AND student_id = r.student_id)
+                 THEN 'lo studente non è associato a questo pacchetto' END,
+            CASE WHEN EXISTS (SELECT 1 FROM packages WHERE id = r.package_id AND r.lesson_date > expiry_date)
+                 THEN 'la data della lezione è successiva alla scadenza del pacchetto' END
+        ]::text[], NULL)
+    """))
+
+def _validate_overlaps(db: Session):
+    """
+    Righe altrimenti valide che si sovrappongono a una lezione esistente o a un'altra riga del
+    file dello stesso studente o dello stesso professore. Le lezioni esistenti si confrontano
+    con gli indici GiST su time_range; tra le righe del file, ordinate per inizio, una riga è
+    in conflitto se inizia prima della fine più tardiva delle righe precedenti.
+    """
+    db.execute(text(f"""
+        WITH ranges AS (
+            SELECT row_no, student_id, professor_id, {models.LESSON_TIME_RANGE_SQL} AS time_range
+            FROM {ROWS_TABLE}
+            WHERE cardinality(errors) = 0 AND start_time IS NOT NULL
+        ),
+        in_file AS (
+            SELECT row_no,
+                   COALESCE(lower(time_range) < MAX(upper(time_range)) OVER (
+                       PARTITION BY student_id ORDER BY lower(time_range), row_no
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                   ), false)
+                   OR COALESCE(lower(time_range) < MAX(upper(time_range)) OVER (
+                       PARTITION BY professor_id ORDER BY lower(time_range), row_no
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                   ), false) AS with_rows
+            FROM ranges
+        ),
+        overlapping AS (
+            SELECT r.row_no, f.with_rows,
+                   EXISTS (
+                       SELECT 1 FROM lessons l
+                       WHERE l.time_range && r.time_range
+                         AND (l.student_id = r.student_id OR l.professor_id = r.professor_id)
+                   ) AS with_lessons
+            FROM ranges r
+            JOIN in_file f ON f.row_no = r.row_no
+        )
+        UPDATE {ROWS_TABLE} r SET errors = r.errors || array_remove(ARRAY[
+            CASE WHEN o.with_lessons
+                 THEN 'la lezione si sovrappone a un''altra lezione dello studente o del professore' END,
+            CASE WHEN o.with_rows
+                 THEN 'la lezione si sovrappone a un''altra riga del file dello stesso studente o professore' END
+        ]::text[], NULL)
+        FROM overlapping o
+        WHERE o.row_no = r.row_no AND (o.with_lessons OR o.with_rows)
+    """))
+
+def _validate_package_capacity(db: Session):
+    """Ore disponibili dei pacchetti, consumate in ordine di riga dalle sole righe altrimenti valide."""
+    # Blocca i pacchetti coinvolti: le ore rimanenti non devono cambiare fino al commit
+    db.execute(text(f"""
+        SELECT id FROM packages
+        WHERE id IN (SELECT package_id FROM {ROWS_TABLE} WHERE cardinality(errors) = 0)
+        ORDER BY id
+        FOR UPDATE
+    """))
+    db.execute(text(f"""
+        WITH consumed AS (
+            SELECT r.row_no, p.remaining_hours,
+                   SUM(r.duration) OVER (PARTITION BY r.package_id ORDER BY r.row_no) AS cumulative_hours
+            FROM {ROWS_TABLE} r
+            JOIN packages p ON p.id = r.package_id
+            WHERE r.is_package AND cardinality(r.errors) = 0
+        )
+        UPDATE {ROWS_TABLE} r
+        SET errors = ARRAY['ore insufficienti nel pacchetto (rimanenti: ' || consumed.remaining_hours::text || ')']
+        FROM consumed
+        WHERE consumed.row_no = r.row_no AND consumed.cumulative_hours > consumed.remaining_hours
+    """))
+
+def _insert_valid_rows(db: Session) -> List[int]:
+    """
+    Inserisce le righe valide con gli stessi valori calcolati da POST /lessons/:
+    le lezioni da pacchetto sono pagate, con prezzo 0 e data di pagamento
+    pari all'inizio del pacchetto se questo è pagato.
+    """
+    return db.execute(text(f"""
+        INSERT INTO lessons (
+            professor_id, student_id, lesson_date, duration, is_package, package_id, hourly_rate,
+            total_payment, is_paid, start_time, payment_date, price, is_online
+        )
+        SELECT r.professor_id, r.student_id, r.lesson_date, r.duration, r.is_package, r.package_id, r.hourly_rate,
+               r.duration * r.hourly_rate,
+               r.is_package OR r.is_paid,
+               r.start_time,
+               CASE
+                   WHEN r.is_package THEN CASE WHEN p.is_paid THEN p.start_date END
+                   WHEN r.is_paid THEN COALESCE(r.payment_date, CURRENT_DATE)
+               END,
+               CASE WHEN r.is_package THEN 0 ELSE COALESCE(r.price, 0) END,
+               r.is_online
+        FROM {ROWS_TABLE} r
+        LEFT JOIN packages p ON p.id = r.package_id
+        WHERE cardinality(r.errors) = 0
+        ORDER BY r.row_no
+        RETURNING id
+    """)).scalars().all()
+
+def _update_package_hours(db: Session) -> List[int]:
+    """Aggiorna ore usate, ore rimanenti e stato una sola volta per ogni pacchetto coinvolto."""
+    from .routes.packages import refresh_packages_status
+
+    package_ids = db.execute(text(f"""
+        UPDATE packages p SET hours_used = p.hours_used + imported.hours
+        FROM (
+            SELECT package_id, SUM(duration) AS hours
+            FROM {ROWS_TABLE}
+            WHERE is_package AND cardinality(errors) = 0
+            GROUP BY package_id
+        ) imported
+        WHERE p.id = imported.package_id
+        RETURNING p.id
+    """)).scalars().all()
+    if package_ids:
+        refresh_packages_status(db, package_ids, commit=False)
+    return package_ids
+
+def import_lessons_csv(db: Session, stream: IO[str], professor_id: Optional[int], dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Importa le lezioni di un CSV (stream di testo) in un'unica transazione.
+
+    Args:
+        professor_id: autore dell'import registrato nel log attività
+        dry_run: valida soltanto, senza inserire nulla
+
+    Returns:
+        Riepilogo con righe lette, lezioni importate, pacchetti aggiornati ed errori per riga
+        (row = numero del record nel file, intestazione esclusa)
+    """
+    header = _read_header(stream)
+    try:
+        _create_cast_functions(db)
+        _copy_to_staging(db, stream, header)
+        _build_rows(db)
+        _validate_references(db)
+        if LESSON_OVERLAP_ENFORCED:
+            _validate_overlaps(db)
+        _validate_package_capacity(db)
+
+        total_rows = db.execute(text(f"SELECT count(*) FROM {ROWS_TABLE}")).scalar()
+        errors = [
+            {"row": row.row_no, "errors": list(row.errors)}
+            for row in db.execute(text(
+                f"SELECT row_no, errors FROM {ROWS_TABLE} WHERE cardinality(errors) > 0 ORDER BY row_no"
+            ))
+        ]
+        report = {
+            "total_rows": total_rows,
+            "valid_rows": total_rows - len(errors),
+            "imported": 0,
+            "packages_updated": [],
+            "dry_run": dry_run,
+            "errors": errors,
+        }
+        if dry_run or report["valid_rows"] == 0:
+            db.rollback()
+            return report
+
+        lesson_ids = _insert_valid_rows(db)
+        report["imported"] = len(lesson_ids)
+        report["packages_updated"] = _update_package_hours(db)
+        mark_finance_months_dirty_from(
+            db, select(models.Lesson.lesson_date).where(models.Lesson.id.in_(lesson_ids))
+        )
+
+        involved = db.execute(text(f"""
+            SELECT array_agg(DISTINCT student_id) AS student_ids,
+                   array_agg(DISTINCT professor_id) AS professor_ids,
+                   array_remove(array_agg(DISTINCT package_id), NULL) AS package_ids,
+                   SUM(duration) AS hours
+            FROM {ROWS_TABLE}
+            WHERE cardinality(errors) = 0
+        """)).one()
+        log_activity(
+            db=db,
+            professor_id=professor_id,
+            action_type="import",
+            entity_type="lesson",
+            entity_id=min(lesson_ids),
+            payload=activity_payload(
+                "lesson_import",
+                student_ids=involved.student_ids,
+                professor_ids=involved.professor_ids,
+                package_ids=involved.package_ids,
+                lesson_count=len(lesson_ids),
+                hours=involved.hours,
+                rejected=len(errors) or None
+            )
+        )
+        db.commit()
+        return report
+    except Exception:
+        db.rollback()
+        raise
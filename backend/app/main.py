@@ -1,26 +1,36 @@
 # main.py
 import os
+import asyncio
+import secrets
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from datetime import timedelta
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import Dict
+from typing import Dict, Optional
 
 from app import models, database
 from app.database import get_db
-from app.routes import professors, students, packages, lessons, activity, professor_weekly_payments
+from app.routes import professors, students, packages, lessons, lesson_series, activity, professor_weekly_payments, stats, diagnostics
 from app.auth import (
     authenticate_professor, 
     create_access_token, 
     ACCESS_TOKEN_EXPIRE_MINUTES, 
-    get_current_professor
+    get_current_professor,
+    invalidate_principal
 )
-from app.utils import verify_password, get_password_hash
+from app.password_pool import verify_password_async, get_password_hash_async, password_pool
 from app.auth import get_current_admin
+from app.package_maintenance import package_sweeper_loop
+from app.finance_rollups import finance_rollup_loop
+from app.activity_archive import activity_log_maintenance_loop
+from app.pool_metrics import pool_metrics_log_loop, DB_POOL_LOG_SECONDS
+from app.request_metrics import MetricsMiddleware, instrument_engine, registry as metrics_registry, METRICS_TOKEN
+from app.slow_queries import ServerTimingMiddleware, instrument_slow_queries
 
 # Creazione dell'app FastAPI
 app = FastAPI(
@@ -40,13 +50,51 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-# Crea tabelle database
-models.Base.metadata.create_all(bind=database.engine)
+# Metriche per route (richieste, latenza, dimensione delle risposte, query SQL) esposte su /metrics.
+# ServerTimingMiddleware va aggiunto prima: resta interno a MetricsMiddleware e ne legge le statistiche.
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(MetricsMiddleware)
+instrumented_engines = [database.engine]
+if database.async_engine is not None:
+    instrumented_engines.append(database.async_engine.sync_engine)
+for instrumented_engine in instrumented_engines:
+    instrument_engine(instrumented_engine)
+    # Log delle query lente (attivabile a runtime da /diagnostics/slow-queries)
+    instrument_slow_queries(instrumented_engine)
+
+# Lo schema del database è gestito dalle migrazioni Alembic (alembic upgrade head)
+
+# Job in background: sweeper notturno dei pacchetti scaduti, ricalcolo dei finance_rollups e
+# partizioni/retention del log attività (disattivabili con PACKAGE_SWEEPER_ENABLED=false,
+# FINANCE_ROLLUP_ENABLED=false e ACTIVITY_LOG_MAINTENANCE_ENABLED=false)
+PACKAGE_SWEEPER_ENABLED = os.environ.get("PACKAGE_SWEEPER_ENABLED", "true").lower() == "true"
+FINANCE_ROLLUP_ENABLED = os.environ.get("FINANCE_ROLLUP_ENABLED", "true").lower() == "true"
+ACTIVITY_LOG_MAINTENANCE_ENABLED = os.environ.get("ACTIVITY_LOG_MAINTENANCE_ENABLED", "true").lower() == "true"
+background_tasks = []
+
+@app.on_event("startup")
+async def start_background_jobs():
+    if PACKAGE_SWEEPER_ENABLED:
+        background_tasks.append(asyncio.create_task(package_sweeper_loop()))
+    if FINANCE_ROLLUP_ENABLED:
+        background_tasks.append(asyncio.create_task(finance_rollup_loop()))
+    if ACTIVITY_LOG_MAINTENANCE_ENABLED:
+        background_tasks.append(asyncio.create_task(activity_log_maintenance_loop()))
+    if DB_POOL_LOG_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(pool_metrics_log_loop()))
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    for task in background_tasks:
+        task.cancel()
+    password_pool.shutdown()
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
 
 # Endpoint per ottenere un token di accesso
 @app.post("/token")
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    professor = authenticate_professor(db, form_data.username, form_data.password)
+    professor = await authenticate_professor(db, form_data.username, form_data.password)
     if not professor:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -77,117 +125,23 @@ def read_root():
 def health_check():
     return {"status": "ok"}
 
+# Metriche in formato Prometheus (con METRICS_TOKEN impostato serve Authorization: Bearer <token>)
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and not secrets.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token delle metriche non valido")
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 # Include i router delle varie entità
 app.include_router(professors.router)
 app.include_router(students.router)
 app.include_router(packages.router)
 app.include_router(lessons.router)
+app.include_router(lesson_series.router)
 app.include_router(activity.router)
 app.include_router(professor_weekly_payments.router)
-
-# Endpoint per le statistiche
-@app.get("/stats/finance", tags=["statistics"])
-def get_finance_stats(db: Session = Depends(get_db)):
-    # Entrate dai pacchetti pagati
-    packages_income = db.query(models.Package).filter(
-        models.Package.is_paid == True
-    ).with_entities(
-        db.func.sum(models.Package.package_cost)
-    ).scalar() or 0
-    
-    # Entrate dalle lezioni singole
-    single_lessons_income = db.query(models.Lesson).filter(
-        models.Lesson.is_package == False
-    ).with_entities(
-        db.func.sum(models.Lesson.total_payment)
-    ).scalar() or 0
-    
-    # Uscite (pagamenti ai professori)
-    expenses = db.query(models.Lesson).with_entities(
-        db.func.sum(models.Lesson.total_payment)
-    ).scalar() or 0
-    
-    # Calcolo del netto
-    total_income = packages_income + single_lessons_income
-    net_profit = total_income - expenses
-    
-    return {
-        "total_income": total_income,
-        "packages_income": packages_income,
-        "single_lessons_income": single_lessons_income,
-        "expenses": expenses,
-        "net_profit": net_profit
-    }
-
-@app.get("/stats/students", tags=["statistics"])
-def get_student_stats(db: Session = Depends(get_db)):
-    # Numero totale di studenti
-    total_students = db.query(models.Student).count()
-    
-    # Numero di studenti con pacchetti attivi
-    active_students = db.query(models.Package).filter(
-        models.Package.status == "in_progress"
-    ).with_entities(
-        models.Package.student_id
-    ).distinct().count()
-    
-    # Studenti più attivi
-    top_students = db.query(
-        models.Student.id,
-        models.Student.first_name,
-        models.Student.last_name,
-        db.func.count(models.Lesson.id).label('lesson_count')
-    ).join(
-        models.Lesson, models.Student.id == models.Lesson.student_id
-    ).group_by(
-        models.Student.id
-    ).order_by(
-        db.func.count(models.Lesson.id).desc()
-    ).limit(5).all()
-    
-    return {
-        "total_students": total_students,
-        "active_students": active_students,
-        "top_students": [
-            {
-                "id": student.id,
-                "name": f"{student.first_name} {student.last_name}",
-                "lesson_count": student.lesson_count
-            } for student in top_students
-        ]
-    }
-
-@app.get("/stats/professors", tags=["statistics"])
-def get_professor_stats(db: Session = Depends(get_db)):
-    # Numero totale di professori
-    total_professors = db.query(models.Professor).count()
-    
-    # Professori più attivi
-    top_professors = db.query(
-        models.Professor.id,
-        models.Professor.first_name,
-        models.Professor.last_name,
-        db.func.count(models.Lesson.id).label('lesson_count'),
-        db.func.sum(models.Lesson.total_payment).label('total_earnings')
-    ).join(
-        models.Lesson, models.Professor.id == models.Lesson.professor_id
-    ).group_by(
-        models.Professor.id
-    ).order_by(
-        db.func.count(models.Lesson.id).desc()
-    ).limit(5).all()
-    
-    return {
-        "total_professors": total_professors,
-        "top_professors": [
-            {
-                "id": professor.id,
-                "name": f"{professor.first_name} {professor.last_name}",
-                "lesson_count": professor.lesson_count,
-                "total_earnings": professor.total_earnings
-            } for professor in top_professors
-        ]
-    }
+app.include_router(stats.router)
+app.include_router(diagnostics.router)
 
 # Endpoint per gestione password
 @app.post("/change-password", tags=["auth"])
@@ -212,14 +166,15 @@ async def change_password(
             detail="Utente non trovato"
         )
     
-    if not verify_password(old_password, professor.password):
+    if not await verify_password_async(old_password, professor.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Password attuale non corretta"
         )
     
-    professor.password = get_password_hash(new_password)
+    professor.password = await get_password_hash_async(new_password)
     db.commit()
+    invalidate_principal(professor.username)
     
     return {"message": "Password aggiornata con successo"}
 
@@ -251,7 +206,8 @@ async def admin_reset_password(
             detail="La nuova password deve essere di almeno 4 caratteri"
         )
     
-    professor.password = get_password_hash(new_password)
+    professor.password = await get_password_hash_async(new_password)
     db.commit()
+    invalidate_principal(professor.username)
     
     return {"message": "Password resettata con successo"}
\ No newline at end of file
@@ -1,18 +1,39 @@
 # models.py
 from datetime import date, datetime, time
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from decimal import Decimal
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Date, Time, DateTime, Text, DECIMAL, TIMESTAMP, CheckConstraint
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Date, Time, DateTime, Text, DECIMAL, TIMESTAMP, CheckConstraint, Index, UniqueConstraint, DDL, event, Computed
+from sqlalchemy.dialects.postgresql import JSONB, TSRANGE
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.sql import func, literal_column
 
 # Updated import section to correctly import Pydantic v2 validators
 from pydantic import BaseModel, field_validator, model_validator, ConfigDict
 
 Base = declarative_base()
 
+# Gli indici trigram (gin_trgm_ops) richiedono pg_trgm: la migrazione 0007 la installa,
+# questo listener la rende disponibile anche agli schemi creati con create_all
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+# Gli indici GiST su (id intero, intervallo) richiedono btree_gist (migrazione 0009)
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+
+# Nome normalizzato per la ricerca (vedi app/search.py), calcolato dal database:
+# minuscolo e senza accenti (translate è IMMUTABLE, a differenza di unaccent)
+SEARCH_ACCENTS_FROM = "àáâãäåèéêëìíîïòóôõöùúûüýÿñçÀÁÂÃÄÅÈÉÊËÌÍÎÏÒÓÔÕÖÙÚÛÜÝÑÇ"
+SEARCH_ACCENTS_TO = "aaaaaaeeeeiiiiooooouuuuyyncaaaaaaeeeeiiiiooooouuuuync"
+SEARCH_NAME_SQL = f"translate(lower(first_name || ' ' || last_name), '{SEARCH_ACCENTS_FROM}', '{SEARCH_ACCENTS_TO}')"
+
+# Intervallo effettivo di una lezione [inizio, fine), calcolato dal database per i controlli
+# di sovrapposizione (vedi app/lesson_conflicts.py). Senza orario di inizio resta NULL.
+LESSON_TIME_RANGE_SQL = (
+    "CASE WHEN start_time IS NULL THEN NULL ELSE tsrange("
+    "lesson_date + start_time, "
+    "lesson_date + start_time + duration::double precision * interval '1 hour', '[)') END"
+)
+
 # SQLAlchemy Models
 class Professor(Base):
     __tablename__ = "professors"
@@ -25,10 +46,18 @@ class Professor(Base):
     is_admin = Column(Boolean, default=False)
     notes = Column(String, nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
+    search_name = Column(Text, Computed(SEARCH_NAME_SQL, persisted=True))
     
     lessons = relationship("Lesson", back_populates="professor")
     activities = relationship("ActivityLog", back_populates="professor")
     
+    __table_args__ = (
+        Index(
+            "ix_professors_search_name_trgm", "search_name",
+            postgresql_using="gin", postgresql_ops={"search_name": "gin_trgm_ops"}
+        ),
+    )
+    
     """
     Nota sul modello di business:
     - Un professore può essere admin, il che gli dà accesso a funzionalità aggiuntive.
@@ -46,9 +75,17 @@ class Student(Base):
     email = Column(String, nullable=True)
     phone = Column(String, nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
+    search_name = Column(Text, Computed(SEARCH_NAME_SQL, persisted=True))
     # Aggiornare la relazione:
     packages = relationship("Package", secondary="package_students", back_populates="students")
     lessons = relationship("Lesson", back_populates="student")
+    
+    __table_args__ = (
+        Index(
+            "ix_students_search_name_trgm", "search_name",
+            postgresql_using="gin", postgresql_ops={"search_name": "gin_trgm_ops"}
+        ),
+    )
 
 class Lesson(Base):
     __tablename__ = "lessons"
@@ -67,18 +104,55 @@ class Lesson(Base):
     payment_date = Column(Date, nullable=True)  # Nuovo campo
     price = Column(DECIMAL(10, 2), nullable=False, default=0)  # New field for student payment
     is_online = Column(Boolean, default=False)  # Nuovo campo per lezioni online
+    series_id = Column(Integer, ForeignKey("lesson_series.id", ondelete="SET NULL"), nullable=True, index=True)  # Serie ricorrente di origine
+    time_range = deferred(Column(TSRANGE, Computed(LESSON_TIME_RANGE_SQL, persisted=True)))
 
     created_at = Column(TIMESTAMP, server_default=func.now())
     
     __table_args__ = (
         CheckConstraint("duration > 0", name="positive_duration"),
         CheckConstraint("hourly_rate >= 0", name="positive_rate"),
+        Index("ix_lessons_package_id_is_package", "package_id", "is_package"),
+        Index("ix_lessons_professor_id_lesson_date", "professor_id", "lesson_date"),
+        Index("ix_lessons_student_id_lesson_date", "student_id", "lesson_date"),
+        Index("ix_lessons_lesson_date_id", "lesson_date", "id"),  # Paginazione a cursore
+        # Controllo sovrapposizioni: un probe per studente e uno per professore
+        Index("ix_lessons_student_id_time_range", "student_id", "time_range", postgresql_using="gist"),
+        Index("ix_lessons_professor_id_time_range", "professor_id", "time_range", postgresql_using="gist"),
     )
     
     professor = relationship("Professor", back_populates="lessons")
     student = relationship("Student", back_populates="lessons")
     package = relationship("Package", back_populates="lessons")
 
+# Serie di lezioni ricorrenti (stesso giorno della settimana e orario), materializzate in lessons
+class LessonSeries(Base):
+    __tablename__ = "lesson_series"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    professor_id = Column(Integer, ForeignKey("professors.id", ondelete="CASCADE"), nullable=False)
+    student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"), nullable=False)
+    weekday = Column(Integer, nullable=False)  # 0 = lunedì ... 6 = domenica
+    start_time = Column(Time, nullable=True)
+    duration = Column(DECIMAL(5, 2), nullable=False)
+    hourly_rate = Column(DECIMAL(10, 2), nullable=False)
+    is_package = Column(Boolean, default=False)
+    package_id = Column(Integer, ForeignKey("packages.id", ondelete="SET NULL"), nullable=True)
+    price = Column(DECIMAL(10, 2), nullable=False, default=0)  # Prezzo delle lezioni singole
+    is_online = Column(Boolean, default=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)  # Ultima data possibile (calcolata anche quando si indica il numero di lezioni)
+    created_by = Column(Integer, ForeignKey("professors.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    
+    __table_args__ = (
+        CheckConstraint("weekday BETWEEN 0 AND 6", name="lesson_series_valid_weekday"),
+        CheckConstraint("duration > 0", name="lesson_series_positive_duration"),
+        CheckConstraint("end_date >= start_date", name="lesson_series_valid_range"),
+        Index("ix_lesson_series_student_id", "student_id"),
+        Index("ix_lesson_series_professor_id", "professor_id"),
+    )
+
 # Pydantic Models for API
 class ProfessorBase(BaseModel):
     first_name: str
@@ -124,6 +198,7 @@ class ProfessorWeeklyPayment(Base):
     # Constraint per evitare duplicati (un professore può avere solo un record per settimana)
     __table_args__ = (
         CheckConstraint("professor_id IS NOT NULL", name="professor_id_not_null"),
+        UniqueConstraint("professor_id", "week_start_date", name="uq_professor_weekly_payments_professor_week"),
     )
 
 # Aggiungi anche i modelli Pydantic per l'API
@@ -147,6 +222,17 @@ class ProfessorWeeklyPaymentResponse(ProfessorWeeklyPaymentBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+# Riepilogo settimanale dei compensi di un professore
+class ProfessorWeeklyPayrollResponse(BaseModel):
+    professor_id: int
+    professor_name: str
+    week_start_date: date
+    lesson_count: int
+    total_hours: Decimal
+    total_earnings: Decimal
+    is_paid: bool = False
+    marked_at: Optional[datetime] = None
+
     
 # Modifica agli schemi Pydantic
 class StudentBase(BaseModel):
@@ -178,6 +264,44 @@ class StudentResponse(StudentBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+# Risultato della ricerca studenti (autocompletamento e controllo omonimi)
+class StudentSearchResult(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    birth_date: Optional[date] = None
+    score: float
+
+class HomonymCheckResponse(BaseModel):
+    has_homonyms: bool
+    message: Optional[str] = None
+    # Studenti con nome quasi uguale (refusi, accenti, nome e cognome invertiti)
+    near_duplicates: List[StudentSearchResult] = []
+
+# Coppie di studenti probabilmente duplicati e loro unione
+class StudentDuplicateSummary(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    birth_date: Optional[date] = None
+    lesson_count: int
+    package_count: int
+
+class StudentDuplicatePair(BaseModel):
+    score: float
+    student_a: StudentDuplicateSummary
+    student_b: StudentDuplicateSummary
+
+class StudentMergeRequest(BaseModel):
+    keep_id: int  # Studente che resta, riceve lezioni e pacchetti
+    merge_ids: List[int]  # Duplicati da eliminare
+
+class StudentMergeResponse(BaseModel):
+    student_id: int
+    merged_ids: List[int]
+    lessons_moved: int
+    packages_moved: List[int]
+
 class PackagePayment(Base):
     __tablename__ = "package_payments"
     
@@ -190,6 +314,10 @@ class PackagePayment(Base):
     
     # Relazione con il pacchetto
     package = relationship("Package", back_populates="payments")
+    
+    __table_args__ = (
+        Index("ix_package_payments_package_id", "package_id"),
+    )
 
 # Modelli per i pagamenti dei pacchetti
 class PackagePaymentBase(BaseModel):
@@ -219,6 +347,7 @@ class Package(Base):
     is_paid = Column(Boolean, default=False)
     payment_date = Column(Date, nullable=True)
     remaining_hours = Column(DECIMAL(5, 2))
+    hours_used = Column(DECIMAL(5, 2), nullable=False, default=0, server_default="0")  # Ore usate, aggiornate dalle scritture delle lezioni
     expiry_date = Column(Date, nullable=False)
     extension_count = Column(Integer, default=0)  # Nuovo campo per tenere traccia delle estensioni
     notes = Column(String, nullable=True)  # Campo per annotazioni generali
@@ -235,12 +364,54 @@ class Package(Base):
     )
     
 
+# Stato dei job di manutenzione (es. ultima data elaborata dallo sweeper dei pacchetti)
+class JobWatermark(Base):
+    __tablename__ = "job_watermarks"
+    
+    name = Column(String, primary_key=True)
+    last_run_date = Column(Date, nullable=False)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+
+# Aggregati economici mensili (mese x professore x tipo), ricalcolati in modo incrementale
+class FinanceRollup(Base):
+    __tablename__ = "finance_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(Date, nullable=False)  # Primo giorno del mese
+    professor_id = Column(Integer, ForeignKey("professors.id", ondelete="CASCADE"), nullable=True)  # None per i pagamenti dei pacchetti
+    lesson_kind = Column(String, nullable=False)  # Values: package, single, package_payment
+    lesson_count = Column(Integer, nullable=False, default=0)
+    hours = Column(DECIMAL(10, 2), nullable=False, default=0)
+    professor_cost = Column(DECIMAL(12, 2), nullable=False, default=0)  # Somma di total_payment
+    student_revenue = Column(DECIMAL(12, 2), nullable=False, default=0)  # Prezzo delle lezioni singole pagate
+    student_unpaid = Column(DECIMAL(12, 2), nullable=False, default=0)  # Prezzo delle lezioni singole non pagate
+    package_payments = Column(DECIMAL(12, 2), nullable=False, default=0)
+    refreshed_at = Column(TIMESTAMP, server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_finance_rollups_month", "month"),
+    )
+
+# Coda dei mesi da ricalcolare nei finance_rollups
+class FinanceDirtyMonth(Base):
+    __tablename__ = "finance_dirty_months"
+    
+    month = Column(Date, primary_key=True)  # Primo giorno del mese
+    marked_at = Column(TIMESTAMP, server_default=func.now())
+
+
 # Tabella di giunzione per la relazione many-to-many
 class PackageStudent(Base):
     __tablename__ = "package_students"
     
     package_id = Column(Integer, ForeignKey("packages.id", ondelete="CASCADE"), primary_key=True)
     student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"), primary_key=True)
+    
+    # La chiave primaria copre (package_id, student_id): serve un indice per le ricerche per studente
+    __table_args__ = (
+        Index("ix_package_students_student_id", "student_id"),
+    )
 
 
 # Update Pydantic models for package
@@ -488,6 +659,7 @@ class LessonResponse(BaseModel):
     payment_date: Optional[date] = None
     price: Decimal  # New field in response
     is_online: bool = False  # Nuovo campo nella risposta
+    series_id: Optional[int] = None  # Serie ricorrente di origine
     
     model_config = ConfigDict(from_attributes=True)
     
@@ -501,24 +673,204 @@ class LessonResponse(BaseModel):
             return v.strftime('%H:%M:%S')
         return v
     
+# Pagina di lezioni per la paginazione a cursore (lesson_date, id)
+class LessonPageResponse(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+# Lezione esistente che si sovrappone all'intervallo richiesto
+class LessonConflict(BaseModel):
+    id: int
+    professor_id: int
+    student_id: int
+    lesson_date: date
+    start_time: Optional[time] = None
+    duration: Decimal
+    conflict_on: List[str]  # "student" e/o "professor"
+
+class LessonConflictResponse(BaseModel):
+    has_conflict: bool
+    conflicts: List[LessonConflict]
+
+# Serie di lezioni ricorrenti
+class LessonSeriesCreate(BaseModel):
+    professor_id: int
+    student_id: int
+    weekday: int  # 0 = lunedì ... 6 = domenica
+    start_time: Optional[str] = None
+    duration: Decimal
+    hourly_rate: Decimal
+    is_package: bool = False
+    package_id: Optional[int] = None
+    price: Optional[Decimal] = Decimal('0')
+    is_online: bool = False
+    start_date: date
+    end_date: Optional[date] = None  # Fine della serie, in alternativa a occurrences
+    occurrences: Optional[int] = None  # Numero di lezioni da creare
+    skip_conflicts: bool = False  # Crea solo le lezioni senza conflitti invece di rifiutare la serie
+    
+    @field_validator('weekday')
+    @classmethod
+    def check_weekday(cls, v):
+        if not 0 <= v <= 6:
+            raise ValueError('weekday must be between 0 (Monday) and 6 (Sunday)')
+        return v
+    
+    @field_validator('duration')
+    @classmethod
+    def check_positive_duration(cls, v):
+        if v <= 0:
+            raise ValueError('duration must be positive')
+        return v
+    
+    @field_validator('hourly_rate')
+    @classmethod
+    def check_positive_rate(cls, v):
+        if v < 0:
+            raise ValueError('hourly_rate must be non-negative')
+        return v
+    
+    @field_validator('start_time')
+    @classmethod
+    def validate_time(cls, v):
+        if isinstance(v, str) and v:
+            from app.utils import parse_time_string
+            if parse_time_string(v) is None:
+                raise ValueError("Invalid time format. Use HH:MM or HH:MM:SS")
+        return v
+    
+    @model_validator(mode='after')
+    def check_range(self):
+        if (self.end_date is None) == (self.occurrences is None):
+            raise ValueError('Specify either end_date or occurrences')
+        if self.end_date is not None and self.end_date < self.start_date:
+            raise ValueError('end_date must not precede start_date')
+        if self.occurrences is not None and not 1 <= self.occurrences <= 260:
+            raise ValueError('occurrences must be between 1 and 260')
+        if self.end_date is not None:
+            # Stesso limite per l'intervallo: lezioni dal primo giorno della settimana indicato
+            first_offset = (self.weekday - self.start_date.weekday()) % 7
+            if ((self.end_date - self.start_date).days - first_offset) // 7 + 1 > 260:
+                raise ValueError('end_date must not yield more than 260 occurrences')
+        return self
+
+# Modifica delle lezioni future di una serie (da from_date in poi)
+class LessonSeriesUpdate(BaseModel):
+    from_date: Optional[date] = None  # Default: oggi
+    professor_id: Optional[int] = None
+    start_time: Optional[str] = None
+    duration: Optional[Decimal] = None
+    hourly_rate: Optional[Decimal] = None
+    price: Optional[Decimal] = None
+    is_online: Optional[bool] = None
+    
+    @field_validator('professor_id', 'duration', 'hourly_rate', 'price', 'is_online')
+    @classmethod
+    def check_not_null(cls, v, info):
+        # Un campo omesso resta invariato; null esplicito violerebbe il NOT NULL delle colonne
+        if v is None:
+            raise ValueError(f'{info.field_name} cannot be null')
+        return v
+    
+    @field_validator('duration')
+    @classmethod
+    def check_positive_duration(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError('duration must be positive')
+        return v
+    
+    @field_validator('hourly_rate')
+    @classmethod
+    def check_positive_rate(cls, v):
+        if v is not None and v < 0:
+            raise ValueError('hourly_rate must be non-negative')
+        return v
+    
+    @field_validator('start_time')
+    @classmethod
+    def validate_time(cls, v):
+        if isinstance(v, str) and v:
+            from app.utils import parse_time_string
+            if parse_time_string(v) is None:
+                raise ValueError("Invalid time format. Use HH:MM or HH:MM:SS")
+        return v
+
+class LessonSeriesResponse(BaseModel):
+    id: int
+    professor_id: int
+    student_id: int
+    weekday: int
+    start_time: Optional[str] = None
+    duration: Decimal
+    hourly_rate: Decimal
+    is_package: bool
+    package_id: Optional[int] = None
+    price: Decimal
+    is_online: bool = False
+    start_date: date
+    end_date: date
+    created_by: Optional[int] = None
+    created_at: Optional[datetime] = None
+    lesson_ids: List[int] = []
+    skipped: List[Dict[str, Any]] = []  # Date non create per conflitti (con skip_conflicts)
+    
+    model_config = ConfigDict(from_attributes=True)
+    
+    @field_validator('start_time', mode='before')
+    @classmethod
+    def convert_time_to_string(cls, v):
+        if isinstance(v, time):
+            return v.strftime('%H:%M:%S')
+        return v
+    
 # Modello SQLAlchemy per il database
 class ActivityLog(Base):
     __tablename__ = "activity_logs"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Tabella partizionata per mese su timestamp (vedi app/activity_archive.py):
+    # la chiave primaria deve includere la colonna di partizionamento
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     professor_id = Column(Integer, ForeignKey("professors.id"))
     action_type = Column(String, index=True)  # create, update, delete
     entity_type = Column(String, index=True)  # lesson, package, student, professor
     entity_id = Column(Integer)
-    description = Column(Text)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    description = Column(Text)  # Solo attività precedenti ai payload: le nuove usano payload
+    payload = Column(JSONB)  # Template e dati dell'attività, descrizione resa in lettura
+    timestamp = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     
     # Relazione con il professore
     professor = relationship("Professor", back_populates="activities")
+    
+    __table_args__ = (
+        Index("ix_activity_logs_timestamp", "timestamp"),
+        Index("ix_activity_logs_professor_id_timestamp", "professor_id", "timestamp"),
+        Index(
+            "ix_activity_logs_payload", "payload",
+            postgresql_using="gin", postgresql_ops={"payload": "jsonb_path_ops"}
+        ),
+        Index(
+            "ix_activity_logs_description_trgm", "description",
+            postgresql_using="gin", postgresql_ops={"description": "gin_trgm_ops"}
+        ),
+        Index(
+            "ix_activity_logs_description_fts",
+            func.to_tsvector(literal_column("'italian'"), func.coalesce(description, "")),
+            postgresql_using="gin"
+        ),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+# Con create_all (benchmark, ambienti di prova) la tabella partizionata nasce senza partizioni:
+# la partizione di default raccoglie le righe finché non vengono create quelle mensili
+event.listen(
+    ActivityLog.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS activity_logs_default PARTITION OF activity_logs DEFAULT")
+)
 
 # Modelli Pydantic per l'API
 class ActivityLogBase(BaseModel):
-    professor_id: int
+    professor_id: Optional[int] = None  # None per le attività di sistema (es. sweeper)
     action_type: str
     entity_type: str
     entity_id: int
@@ -529,6 +881,7 @@ class ActivityLogCreate(ActivityLogBase):
 
 class ActivityLogResponse(ActivityLogBase):
     id: int
+    payload: Optional[Dict[str, Any]] = None
     timestamp: datetime
     
     class Config:
@@ -540,4 +893,9 @@ class UserActivitySummary(BaseModel):
     professor_name: str
     last_activity_time: Optional[datetime] = None
     activities_count: int
-    recent_activities: List[ActivityLogResponse]
\ No newline at end of file
+    recent_activities: List[ActivityLogResponse]
+# Impostazioni runtime del log delle query lente (endpoint di diagnostica)
+class SlowQuerySettingsUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    threshold_ms: Optional[float] = None
+    explain_sample_rate: Optional[float] = None
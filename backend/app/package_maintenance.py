@@ -0,0 +1,169 @@
+# app/package_maintenance.py
+import asyncio
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Optional, List, Dict, Any
+
+from sqlalchemy import insert, update, select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+from .activity_descriptions import activity_payload
+
+PACKAGE_SWEEPER_JOB = "package_expiry_sweeper"
+
+def sweep_expired_packages(db: Session, today: Optional[date] = None) -> int:
+    """
+    Aggiorna lo stato dei pacchetti la cui expiry_date è stata superata dall'ultima esecuzione.
+
+    Usa un watermark salvato (job_watermarks) per elaborare solo i pacchetti scaduti
+    nell'intervallo [ultima esecuzione, oggi), con un'unica UPDATE e un unico inserimento
+    multiplo nel log delle attività.
+
+    Returns:
+        Numero di pacchetti aggiornati
+    """
+    from app.routes.packages import package_status_expression
+
+    today = today or date.today()
+
+    # Crea il watermark se non esiste, poi bloccalo per serializzare più worker
+    db.execute(
+        pg_insert(models.JobWatermark).values(
+            name=PACKAGE_SWEEPER_JOB,
+            last_run_date=date.min
+        ).on_conflict_do_nothing(index_elements=["name"])
+    )
+    watermark = db.query(models.JobWatermark).filter(
+        models.JobWatermark.name == PACKAGE_SWEEPER_JOB
+    ).with_for_update().one()
+
+    if watermark.last_run_date >= today:
+        db.commit()
+        return 0
+
+    new_status = package_status_expression(models.Package.remaining_hours, today)
+
+    # Solo i pacchetti scaduti dopo l'ultima esecuzione
+    transitioned = db.execute(
+        update(models.Package).where(
+            models.Package.expiry_date >= watermark.last_run_date,
+            models.Package.expiry_date < today,
+            models.Package.status.is_distinct_from(new_status)
+        ).values(
+            status=new_status
+        ).returning(
+            models.Package.id, models.Package.status
+        ).execution_options(synchronize_session=False)
+    ).all()
+
+    if transitioned:
+        db.execute(
+            insert(models.ActivityLog),
+            [
+                {
+                    "professor_id": None,
+                    "action_type": "update",
+                    "entity_type": "package",
+                    "entity_id": package_id,
+                    "payload": activity_payload("package_status_auto", package_ids=[package_id], status=status)
+                }
+                for package_id, status in transitioned
+            ]
+        )
+
+    watermark.last_run_date = today
+    db.commit()
+
+    return len(transitioned)
+
+def reconcile_package_hours(db: Session, repair: bool = False) -> List[Dict[str, Any]]:
+    """
+    Confronta il contatore hours_used di ogni pacchetto con la somma delle sue lezioni,
+    calcolata con un'unica query raggruppata.
+
+    Args:
+        repair: se True riallinea hours_used (e remaining_hours/status) dei pacchetti divergenti
+
+    Returns:
+        Elenco dei pacchetti divergenti con valore salvato e valore reale
+    """
+    from app.routes.packages import refresh_packages_status
+
+    lesson_hours = select(
+        models.Lesson.package_id.label("package_id"),
+        func.sum(models.Lesson.duration).label("hours_used"),
+    ).where(
+        models.Lesson.package_id.isnot(None),
+        models.Lesson.is_package == True
+    ).group_by(models.Lesson.package_id).subquery()
+
+    actual_hours = func.coalesce(lesson_hours.c.hours_used, 0)
+
+    drift = db.query(
+        models.Package.id,
+        models.Package.hours_used,
+        actual_hours.label("actual_hours")
+    ).outerjoin(
+        lesson_hours, lesson_hours.c.package_id == models.Package.id
+    ).filter(
+        models.Package.hours_used != actual_hours
+    ).order_by(models.Package.id).all()
+
+    report = [
+        {
+            "package_id": package_id,
+            "stored_hours_used": Decimal(stored),
+            "actual_hours_used": Decimal(actual),
+        }
+        for package_id, stored, actual in drift
+    ]
+
+    if repair and report:
+        package_ids = [row["package_id"] for row in report]
+        actual = select(
+            models.Package.id.label("id"),
+            actual_hours.label("actual_hours")
+        ).outerjoin(
+            lesson_hours, lesson_hours.c.package_id == models.Package.id
+        ).where(models.Package.id.in_(package_ids)).subquery()
+
+        db.execute(
+            update(models.Package).where(
+                models.Package.id == actual.c.id
+            ).values(
+                hours_used=actual.c.actual_hours
+            ).execution_options(synchronize_session=False)
+        )
+        # Ricalcola ore rimanenti e stato dei soli pacchetti corretti
+        refresh_packages_status(db, package_ids, commit=False)
+        db.commit()
+
+    return report
+
+def run_package_sweeper() -> int:
+    """Esegue lo sweeper in una sessione dedicata."""
+    db = SessionLocal()
+    try:
+        return sweep_expired_packages(db)
+    finally:
+        db.close()
+
+def seconds_until_next_run(now: Optional[datetime] = None) -> float:
+    """Secondi mancanti alla prossima esecuzione (poco dopo la mezzanotte)."""
+    now = now or datetime.now()
+    next_run = datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) + timedelta(seconds=5)
+    return (next_run - now).total_seconds()
+
+async def package_sweeper_loop():
+    """Loop in-process: esegue lo sweeper all'avvio e poi ogni notte."""
+    while True:
+        try:
+            updated = await asyncio.to_thread(run_package_sweeper)
+            if updated:
+                print(f"Sweeper pacchetti: aggiornati {updated} pacchetti scaduti")
+        except Exception as e:
+            print(f"Errore durante l'esecuzione dello sweeper dei pacchetti: {e}")
+        await asyncio.sleep(seconds_until_next_run())
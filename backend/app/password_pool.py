@@ -0,0 +1,68 @@
+# app/password_pool.py
+"""
+Pool dedicato per hash e verifica delle password bcrypt.
+
+bcrypt impiega centinaia di millisecondi per chiamata: eseguito direttamente in un
+endpoint async blocca l'intero event loop. Le chiamate passano quindi da un
+ThreadPoolExecutor di dimensione fissa (bcrypt rilascia il GIL durante il calcolo),
+con un limite alle richieste in attesa: oltre il limite si risponde subito 429
+invece di accumulare login che scadrebbero comunque.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+
+from .utils import verify_password, get_password_hash
+
+# Thread dedicati a bcrypt (default: numero di CPU, massimo 4)
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Richieste in coda oltre a quelle in esecuzione prima di rispondere 429
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", "32"))
+# Secondi suggeriti al client nell'header Retry-After
+PASSWORD_HASH_RETRY_AFTER = 1
+
+class PasswordHashPool:
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # Richieste in esecuzione o in coda; aggiornato solo dall'event loop
+        self.pending = 0
+        self.rejected = 0
+
+    async def run(self, func, *args):
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Troppe richieste di accesso in corso, riprova tra poco",
+                headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+password_pool = PasswordHashPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password eseguita nel pool dedicato."""
+    return await password_pool.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash eseguita nel pool dedicato."""
+    return await password_pool.run(get_password_hash, password)
@@ -0,0 +1,172 @@
+# app/pool_metrics.py
+"""
+Metriche del pool di connessioni al database.
+
+Checkout, checkin, nuove connessioni, invalidazioni e tempo di utilizzo delle
+connessioni sono raccolti con gli eventi del pool di SQLAlchemy. L'attesa per
+ottenere una connessione e i timeout di checkout non hanno un evento dedicato:
+li misurano le sottoclassi InstrumentedQueuePool / InstrumentedAsyncQueuePool
+attorno al prelievo dalla coda.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# Secondi tra due righe di log con lo stato del pool (0 = nessun log periodico)
+DB_POOL_LOG_SECONDS = int(os.environ.get("DB_POOL_LOG_SECONDS", "0"))
+# Campioni recenti usati per i percentili di attesa e utilizzo
+SAMPLE_SIZE = 1000
+
+def _percentile(samples, fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 2)
+
+class PoolMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waits = deque(maxlen=SAMPLE_SIZE)
+        self.holds = deque(maxlen=SAMPLE_SIZE)
+
+    def record_wait(self, seconds: float):
+        with self.lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.waits.append(seconds)
+
+    def record_timeout(self):
+        with self.lock:
+            self.timeouts += 1
+        print(f"Pool {self.name}: timeout in attesa di una connessione ({self.summary()})")
+
+    def attach(self, pool):
+        """Registra gli eventi di SQLAlchemy sul pool."""
+        self.pool = pool
+
+        @event.listens_for(pool, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            with self.lock:
+                self.connects += 1
+
+        @event.listens_for(pool, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            connection_record.info["checked_out_at"] = time.perf_counter()
+            with self.lock:
+                self.checkouts += 1
+
+        @event.listens_for(pool, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            started = connection_record.info.pop("checked_out_at", None)
+            with self.lock:
+                self.checkins += 1
+                if started is not None:
+                    self.holds.append(time.perf_counter() - started)
+
+        @event.listens_for(pool, "invalidate")
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            with self.lock:
+                self.invalidations += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Stato attuale del pool e contatori dall'avvio del processo."""
+        pool = self.pool
+        with self.lock:
+            waits = list(self.waits)
+            holds = list(self.holds)
+            result = {
+                "name": self.name,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "checkout_timeouts": self.timeouts,
+                "wait_total_ms": _ms(self.wait_total),
+                "wait_max_ms": _ms(self.wait_max),
+            }
+        result.update({
+            "pool_size": pool.size() if pool is not None else None,
+            "max_overflow": getattr(pool, "_max_overflow", None),
+            "timeout_seconds": pool.timeout() if pool is not None else None,
+            "checked_out": pool.checkedout() if pool is not None else None,
+            "idle": pool.checkedin() if pool is not None else None,
+            "overflow": max(pool.overflow(), 0) if pool is not None else None,
+            "wait_p50_ms": _ms(_percentile(waits, 0.5)),
+            "wait_p95_ms": _ms(_percentile(waits, 0.95)),
+            "hold_p50_ms": _ms(_percentile(holds, 0.5)),
+            "hold_p95_ms": _ms(_percentile(holds, 0.95)),
+        })
+        return result
+
+    def summary(self) -> str:
+        pool = self.pool
+        if pool is None:
+            return "pool non inizializzato"
+        return (
+            f"in uso {pool.checkedout()}, inattive {pool.checkedin()}, overflow {max(pool.overflow(), 0)}, "
+            f"timeout {self.timeouts}, attesa max {_ms(self.wait_max)} ms"
+        )
+
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool che misura l'attesa di checkout e i timeout in sync_pool_metrics."""
+    metrics = sync_pool_metrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        finally:
+            self.metrics.record_wait(time.perf_counter() - started)
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Variante per il motore async (asyncpg), con le metriche in async_pool_metrics."""
+    metrics = async_pool_metrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        finally:
+            self.metrics.record_wait(time.perf_counter() - started)
+
+def pool_metrics_snapshot() -> Dict[str, Any]:
+    """Metriche dei pool attivi (il pool async solo con DB_ASYNC=true)."""
+    result = {"sync": sync_pool_metrics.snapshot()}
+    if async_pool_metrics.pool is not None:
+        result["async"] = async_pool_metrics.snapshot()
+    return result
+
+async def pool_metrics_log_loop():
+    """Loop in-process: stampa lo stato dei pool ogni DB_POOL_LOG_SECONDS secondi."""
+    while True:
+        await asyncio.sleep(DB_POOL_LOG_SECONDS)
+        for metrics in (sync_pool_metrics, async_pool_metrics):
+            if metrics.pool is not None:
+                print(f"Pool {metrics.name}: {metrics.summary()}")
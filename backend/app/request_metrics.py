@@ -0,0 +1,203 @@
+# app/request_metrics.py
+"""
+Metriche per route in formato Prometheus (esposte su /metrics).
+
+Il middleware MetricsMiddleware misura per ogni richiesta durata, dimensione della
+risposta, numero e tempo delle query SQL. Le query sono contate dagli hook
+before_cursor_execute/after_cursor_execute dei motori SQLAlchemy e attribuite alla
+richiesta tramite una ContextVar (propagata anche al threadpool e a run_sync).
+
+Le route sono etichettate con il template del percorso (es. /packages/{package_id})
+per non creare una serie per ogni id. Le metriche sono per processo: con più worker
+uvicorn ogni worker espone le proprie.
+"""
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Tuple, Optional, List
+
+from sqlalchemy import event
+
+# Token opzionale richiesto da /metrics (Authorization: Bearer <token>); vuoto = accesso libero
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000, 10000)
+QUERY_TIME_BUCKETS = LATENCY_BUCKETS
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "scope")
+
+    def __init__(self, scope=None):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.scope = scope
+
+    @property
+    def route(self) -> str:
+        """Template della route (disponibile dopo il routing), altrimenti "unmatched"."""
+        route = (self.scope or {}).get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+# Statistiche della richiesta in corso (None fuori da una richiesta, es. job in background)
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _format_bound(bound) -> str:
+    return str(int(bound)) if float(bound).is_integer() else str(bound)
+
+class MetricsRegistry:
+    HISTOGRAMS = {
+        "http_request_duration_seconds": ("Durata delle richieste HTTP", LATENCY_BUCKETS),
+        "http_response_size_bytes": ("Dimensione del corpo delle risposte HTTP", SIZE_BUCKETS),
+        "http_request_db_queries": ("Query SQL eseguite per richiesta", QUERY_COUNT_BUCKETS),
+        "http_request_db_seconds": ("Tempo speso nelle query SQL per richiesta", QUERY_TIME_BUCKETS),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.histograms: Dict[str, Dict[Tuple[str, str], Histogram]] = {name: {} for name in self.HISTOGRAMS}
+
+    def _observe(self, name: str, key: Tuple[str, str], value: float):
+        series = self.histograms[name]
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self.HISTOGRAMS[name][1])
+        histogram.observe(value)
+
+    def record(self, method: str, route: str, status: int, seconds: float, size: int, stats: RequestStats):
+        key = (method, route)
+        with self.lock:
+            request_key = (method, route, str(status))
+            self.requests[request_key] = self.requests.get(request_key, 0) + 1
+            self._observe("http_request_duration_seconds", key, seconds)
+            self._observe("http_response_size_bytes", key, size)
+            self._observe("http_request_db_queries", key, stats.queries)
+            self._observe("http_request_db_seconds", key, stats.db_seconds)
+
+    def render(self) -> str:
+        """Metriche nel formato testuale di Prometheus (text/plain; version=0.0.4)."""
+        lines: List[str] = [
+            "# HELP http_requests_total Richieste HTTP per metodo, route e stato",
+            "# TYPE http_requests_total counter",
+        ]
+        with self.lock:
+            for (method, route, status), value in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {value}")
+            for name, (description, buckets) in self.HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+                for (method, route), histogram in sorted(self.histograms[name].items()):
+                    for bound, count in zip(buckets, histogram.counts):
+                        labels = _labels(method=method, route=route, le=_format_bound(bound))
+                        lines.append(f"{name}_bucket{labels} {count}")
+                    lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(method=method, route=route)} {histogram.total}")
+                    lines.append(f"{name}_count{_labels(method=method, route=route)} {histogram.count}")
+        lines.extend(_pool_lines())
+        return "\n".join(lines) + "\n"
+
+def _pool_lines() -> List[str]:
+    from .pool_metrics import pool_metrics_snapshot
+
+    gauges = {
+        "db_pool_checked_out": ("checked_out", "gauge", "Connessioni del pool in uso"),
+        "db_pool_idle": ("idle", "gauge", "Connessioni del pool inattive"),
+        "db_pool_overflow": ("overflow", "gauge", "Connessioni aperte oltre pool_size"),
+        "db_pool_checkout_timeouts_total": ("checkout_timeouts", "counter", "Timeout in attesa di una connessione"),
+    }
+    snapshot = pool_metrics_snapshot()
+    lines = []
+    for name, (field, kind, description) in gauges.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for pool_name, values in snapshot.items():
+            if values.get(field) is not None:
+                lines.append(f"{name}{_labels(pool=pool_name)} {values[field]}")
+    return lines
+
+registry = MetricsRegistry()
+
+def instrument_engine(engine):
+    """Conta numero e durata delle query del motore (sync) nella richiesta corrente."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        _record_query(conn)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # Le query fallite non passano da after_cursor_execute
+        if exception_context.connection is not None and exception_context.cursor is not None:
+            _record_query(exception_context.connection)
+
+def _record_query(conn):
+    pending = conn.info.get("query_started_at")
+    if not pending:
+        return
+    started = pending.pop()
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+class MetricsMiddleware:
+    """Middleware ASGI che registra le metriche di ogni richiesta HTTP."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request_stats.set(stats)
+        started = time.perf_counter()
+        response = {"status": 500, "size": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request_stats.reset(token)
+            # Il router di FastAPI aggiunge la route trovata allo scope
+            registry.record(
+                scope["method"], stats.route, response["status"],
+                time.perf_counter() - started, response["size"], stats
+            )
@@ -1,13 +1,15 @@
 # routes/activity.py
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func, and_, or_
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import desc, func, and_, or_, select, false
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 
 from .. import models
-from ..database import get_db
+from ..database import get_read_db, async_db_route
 from ..auth import get_current_admin
+from ..activity_descriptions import render_activities, payload_contains, payload_matches_any
+from ..search import search_names, description_condition as search_description_condition
 
 router = APIRouter(
     prefix="/activities",
@@ -15,7 +17,43 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# Numero massimo di studenti/professori trovati per nome usati nella ricerca (i più pertinenti)
+ACTIVITY_SEARCH_MAX_MATCHES = 50
+SEARCH_TYPES = ("all", "professor", "description", "entity")
+
+def activity_search_condition(db: Session, search: str, search_type: str = "all"):
+    """
+    Ricerca testuale nelle attività tramite app/search.py (indici trigram e full-text):
+    - description: descrizioni salvate (attività precedenti ai payload);
+    - entity: attività che coinvolgono studenti/professori il cui nome corrisponde (indice GIN sul payload);
+    - professor: attività eseguite da professori il cui nome corrisponde;
+    - all: una qualsiasi delle precedenti.
+    """
+    if search_type not in SEARCH_TYPES:
+        raise HTTPException(status_code=400, detail=f"search_type deve essere uno tra: {', '.join(SEARCH_TYPES)}")
+    
+    conditions = []
+    if search_type in ("all", "description"):
+        conditions.append(search_description_condition(db, search))
+    
+    professor_ids = []
+    if search_type in ("all", "entity", "professor"):
+        professor_ids = [entity_id for entity_id, _ in search_names(db, models.Professor, search, ACTIVITY_SEARCH_MAX_MATCHES)]
+    
+    if search_type in ("all", "entity"):
+        student_ids = [entity_id for entity_id, _ in search_names(db, models.Student, search, ACTIVITY_SEARCH_MAX_MATCHES)]
+        if student_ids:
+            conditions.append(payload_matches_any("student_ids", student_ids))
+        if professor_ids:
+            conditions.append(payload_matches_any("professor_ids", professor_ids))
+    
+    if search_type in ("all", "professor") and professor_ids:
+        conditions.append(models.ActivityLog.professor_id.in_(professor_ids))
+    
+    return or_(*conditions) if conditions else false()
+
 @router.get("/", response_model=List[models.ActivityLogResponse])
+@async_db_route
 def get_all_activities(
     skip: int = 0, 
     limit: int = 100, 
@@ -23,12 +61,16 @@ def get_all_activities(
     action_type: Optional[str] = Query(None, description="Filter by action type (create, update, delete)"),
     entity_type: Optional[str] = Query(None, description="Filter by entity type (lesson, package, student, professor)"),
     professor_id: Optional[int] = Query(None, description="Filter by professor ID"),
-    search: Optional[str] = Query(None, description="Search in description"),
-    db: Session = Depends(get_db), 
+    student_id: Optional[int] = Query(None, description="Filter by student involved"),
+    package_id: Optional[int] = Query(None, description="Filter by package involved"),
+    search: Optional[str] = Query(None, description="Search in description or names"),
+    search_type: Optional[str] = Query("all", description="Search scope: all, professor, description, entity"),
+    db: Session = Depends(get_read_db), 
     current_user: models.Professor = Depends(get_current_admin)
 ):
     """
     Ottiene tutte le attività con filtri mirati per performance ottimali.
+    I filtri per studente e pacchetto usano l'indice GIN sul payload.
     """
     # Calcola la data di inizio per il filtro
     start_date = datetime.now() - timedelta(days=days)
@@ -48,20 +90,24 @@ def get_all_activities(
     if entity_type:
         query = query.filter(models.ActivityLog.entity_type == entity_type)
     
+    if student_id:
+        query = query.filter(payload_contains(student_ids=student_id))
+    
+    if package_id:
+        query = query.filter(payload_contains(package_ids=package_id))
+    
     if search:
-        search_term = f"%{search.lower()}%"
-        query = query.filter(
-            models.ActivityLog.description.ilike(search_term)
-        )
+        query = query.filter(activity_search_condition(db, search, search_type))
     
     # Ordina e applica paginazione
     activities = query.order_by(
         desc(models.ActivityLog.timestamp)
     ).offset(skip).limit(limit).all()
     
-    return activities
+    return render_activities(db, activities)
 
 @router.get("/users", response_model=List[models.UserActivitySummary])
+@async_db_route
 def get_user_activities(
     days: int = 30,
     action_type: Optional[str] = Query(None, description="Filter by action type"),
@@ -69,87 +115,80 @@ def get_user_activities(
     search: Optional[str] = Query(None, description="Search in description or professor name"),
     search_type: Optional[str] = Query("all", description="Search scope: all, professor, description, entity"),
     limit_per_user: int = 50,
-    db: Session = Depends(get_db), 
+    db: Session = Depends(get_read_db), 
     current_user: models.Professor = Depends(get_current_admin)
 ):
     """
     Ottiene un riepilogo delle attività aggregato per utente con filtri efficienti.
+    Una sola query: ROW_NUMBER() limita le attività recenti per professore e
+    COUNT(*) OVER fornisce il totale filtrato senza query aggiuntive.
     """
     # Calcola la data di inizio per il filtro
     start_date = datetime.now() - timedelta(days=days)
     
-    # Query base per le attività filtrate
-    activities_query = db.query(models.ActivityLog).filter(
-        models.ActivityLog.timestamp >= start_date
-    )
+    filters = [models.ActivityLog.timestamp >= start_date]
     
     # Applica filtri per tipo di azione ed entità
     if action_type:
-        activities_query = activities_query.filter(models.ActivityLog.action_type == action_type)
+        filters.append(models.ActivityLog.action_type == action_type)
     
     if entity_type:
-        activities_query = activities_query.filter(models.ActivityLog.entity_type == entity_type)
+        filters.append(models.ActivityLog.entity_type == entity_type)
     
-    # Applica filtro di ricerca nella descrizione se specificato
-    if search and search_type in ['all', 'description']:
-        search_term = f"%{search.lower()}%"
-        activities_query = activities_query.filter(
-            models.ActivityLog.description.ilike(search_term)
-        )
+    # Applica filtro di ricerca (descrizione, entità coinvolte o nome del professore)
+    if search:
+        filters.append(activity_search_condition(db, search, search_type))
     
-    # Ottieni tutti i professori
-    professors_query = db.query(models.Professor)
-    
-    # Applica filtro di ricerca nel nome professore se specificato
-    if search and search_type in ['all', 'professor']:
-        search_term = f"%{search.lower()}%"
-        professors_query = professors_query.filter(
-            or_(
-                models.Professor.first_name.ilike(search_term),
-                models.Professor.last_name.ilike(search_term),
-                func.concat(models.Professor.first_name, ' ', models.Professor.last_name).ilike(search_term)
-            )
-        )
+    ranked = select(
+        models.ActivityLog,
+        models.Professor.first_name.label("professor_first_name"),
+        models.Professor.last_name.label("professor_last_name"),
+        func.row_number().over(
+            partition_by=models.ActivityLog.professor_id,
+            order_by=(desc(models.ActivityLog.timestamp), desc(models.ActivityLog.id))
+        ).label("rn"),
+        func.count().over(partition_by=models.ActivityLog.professor_id).label("activities_count"),
+    ).join(
+        models.Professor, models.Professor.id == models.ActivityLog.professor_id
+    ).where(*filters).subquery()
     
-    professors = professors_query.all()
+    activity = aliased(models.ActivityLog, ranked)
+    
+    # Professori ordinati per conteggio attività (decrescente), attività dalla più recente
+    rows = db.query(
+        activity,
+        ranked.c.professor_first_name,
+        ranked.c.professor_last_name,
+        ranked.c.activities_count
+    ).filter(
+        ranked.c.rn <= limit_per_user
+    ).order_by(
+        desc(ranked.c.activities_count), activity.professor_id, ranked.c.rn
+    ).all()
+    
+    # Descrizioni rese dal payload con una sola risoluzione dei nomi per tutta la pagina
+    rendered = render_activities(db, [row[0] for row in rows])
     
     result = []
-    for professor in professors:
-        # Query specifica per questo professore
-        professor_activities_query = activities_query.filter(
-            models.ActivityLog.professor_id == professor.id
-        )
-        
-        # Conta le attività filtrate per questo professore
-        activities_count = professor_activities_query.count()
-        
-        # Se non ci sono attività dopo i filtri, salta questo professore
-        if activities_count == 0:
-            continue
-        
-        # Ottieni le attività recenti per questo professore
-        recent_activities = professor_activities_query.order_by(
-            desc(models.ActivityLog.timestamp)
-        ).limit(limit_per_user).all()
-        
-        # Ottieni l'ultima attività
-        last_activity = recent_activities[0] if recent_activities else None
-        
-        # Aggiungi al risultato
-        result.append({
-            "professor_id": professor.id,
-            "professor_name": f"{professor.first_name} {professor.last_name}",
-            "last_activity_time": last_activity.timestamp if last_activity else None,
-            "activities_count": activities_count,
-            "recent_activities": recent_activities
-        })
-    
-    # Ordina il risultato per conteggio attività (decrescente)
-    result.sort(key=lambda x: x["activities_count"], reverse=True)
+    summaries = {}
+    for (log, first_name, last_name, activities_count), activity_data in zip(rows, rendered):
+        summary = summaries.get(log.professor_id)
+        if summary is None:
+            summary = {
+                "professor_id": log.professor_id,
+                "professor_name": f"{first_name} {last_name}",
+                "last_activity_time": log.timestamp,
+                "activities_count": activities_count,
+                "recent_activities": []
+            }
+            summaries[log.professor_id] = summary
+            result.append(summary)
+        summary["recent_activities"].append(activity_data)
     
     return result
 
 @router.get("/user/{professor_id}", response_model=List[models.ActivityLogResponse])
+@async_db_route
 def get_professor_activities(
     professor_id: int, 
     skip: int = 0, 
@@ -157,8 +196,9 @@ def get_professor_activities(
     days: int = 30,
     action_type: Optional[str] = Query(None, description="Filter by action type"),
     entity_type: Optional[str] = Query(None, description="Filter by entity type"),
-    search: Optional[str] = Query(None, description="Search in description"),
-    db: Session = Depends(get_db), 
+    search: Optional[str] = Query(None, description="Search in description or names"),
+    search_type: Optional[str] = Query("all", description="Search scope: all, description, entity"),
+    db: Session = Depends(get_read_db), 
     current_user: models.Professor = Depends(get_current_admin)
 ):
     """
@@ -188,22 +228,20 @@ def get_professor_activities(
         query = query.filter(models.ActivityLog.entity_type == entity_type)
     
     if search:
-        search_term = f"%{search.lower()}%"
-        query = query.filter(
-            models.ActivityLog.description.ilike(search_term)
-        )
+        query = query.filter(activity_search_condition(db, search, search_type))
     
     # Ottieni le attività ordinate
     activities = query.order_by(
         desc(models.ActivityLog.timestamp)
     ).offset(skip).limit(limit).all()
     
-    return activities
+    return render_activities(db, activities)
 
 @router.get("/stats/summary")
+@async_db_route
 def get_activity_stats_summary(
     days: int = 30,
-    db: Session = Depends(get_db), 
+    db: Session = Depends(get_read_db), 
     current_user: models.Professor = Depends(get_current_admin)
 ):
     """
@@ -260,27 +298,33 @@ def get_activity_stats_summary(
         ]
     }
 
-# Funzione helper per registrare le attività (mantieni uguale)
+# Funzione helper per registrare le attività
 def log_activity(
     db: Session, 
     professor_id: int, 
     action_type: str,
     entity_type: str,
     entity_id: int,
-    description: str
+    payload: Optional[Dict[str, Any]] = None,
+    description: Optional[str] = None
 ):
     """
-    Registra un'attività nel database.
+    Registra un'attività nella transazione del chiamante.
+    Non esegue commit: il log viene scritto insieme alle modifiche che descrive
+    (e annullato con esse in caso di rollback), quindi va chiamata prima del db.commit().
+    
+    Il payload (vedi activity_descriptions.activity_payload) contiene gli id e i dati
+    dell'operazione: la descrizione viene resa in lettura, senza cercare nomi qui.
     """
     activity_log = models.ActivityLog(
         professor_id=professor_id,
         action_type=action_type,
         entity_type=entity_type,
         entity_id=entity_id,
-        description=description
+        description=description,
+        payload=payload
     )
     
     db.add(activity_log)
-    db.commit()
     
     return activity_log
\ No newline at end of file
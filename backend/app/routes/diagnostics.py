@@ -0,0 +1,46 @@
+# routes/diagnostics.py
+from fastapi import APIRouter, Depends, HTTPException
+
+from .. import models
+from ..auth import get_current_admin
+from ..pool_metrics import pool_metrics_snapshot
+from ..slow_queries import slow_query_log
+
+router = APIRouter(
+    prefix="/diagnostics",
+    tags=["diagnostics"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/pool")
+def get_pool_metrics(current_user: models.Professor = Depends(get_current_admin)):
+    """
+    Stato del pool di connessioni di questo worker: connessioni in uso, inattive e in overflow,
+    tempi di attesa e di utilizzo (mediana e p95 sugli ultimi campioni) e timeout di checkout.
+    """
+    return pool_metrics_snapshot()
+
+@router.get("/slow-queries")
+def get_slow_queries(current_user: models.Professor = Depends(get_current_admin)):
+    """Impostazioni del log delle query lente di questo worker e ultime query registrate."""
+    return {**slow_query_log.settings(), "recent": list(slow_query_log.recent)}
+
+@router.put("/slow-queries")
+def update_slow_queries(
+    settings: models.SlowQuerySettingsUpdate,
+    current_user: models.Professor = Depends(get_current_admin)
+):
+    """Attiva/disattiva il log delle query lente o ne cambia soglia e campionamento, senza riavvio."""
+    if settings.threshold_ms is not None and settings.threshold_ms < 0:
+        raise HTTPException(status_code=400, detail="threshold_ms non può essere negativo")
+    if settings.explain_sample_rate is not None and not 0 <= settings.explain_sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="explain_sample_rate deve essere compreso tra 0 e 1")
+    
+    if settings.threshold_ms is not None:
+        slow_query_log.threshold_ms = settings.threshold_ms
+    if settings.explain_sample_rate is not None:
+        slow_query_log.explain_sample_rate = settings.explain_sample_rate
+    if settings.enabled is not None:
+        slow_query_log.enabled = settings.enabled
+    
+    return slow_query_log.settings()
@@ -0,0 +1,461 @@
+# routes/lesson_series.py
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, update, delete, func
+from typing import List, Optional, Dict, Any
+from datetime import date, timedelta
+from decimal import Decimal
+
+from ..auth import get_current_professor
+from app.routes.activity import log_activity
+from ..activity_descriptions import activity_payload
+
+from .. import models
+from ..database import get_db, get_read_db, async_db_route
+from ..utils import parse_time_string, determine_payment_date
+from ..finance_rollups import mark_finance_months_dirty, mark_finance_months_dirty_from
+from ..lesson_conflicts import find_series_conflicts, LESSON_OVERLAP_ENFORCED
+
+router = APIRouter(
+    prefix="/lesson-series",
+    tags=["lesson-series"],
+    responses={404: {"description": "Not found"}},
+)
+
+def series_dates(start_date: date, weekday: int, end_date: Optional[date] = None, occurrences: Optional[int] = None) -> List[date]:
+    """Date delle lezioni: il primo giorno della settimana indicato da start_date in poi, ogni 7 giorni."""
+    first = start_date + timedelta(days=(weekday - start_date.weekday()) % 7)
+    dates = []
+    current = first
+    while (occurrences is None or len(dates) < occurrences) and (end_date is None or current <= end_date):
+        dates.append(current)
+        current += timedelta(days=7)
+    return dates
+
+def _series_tail(series_id: int, from_date: date):
+    """Condizione sulle lezioni della serie da from_date in poi."""
+    return (models.Lesson.series_id == series_id) & (models.Lesson.lesson_date >= from_date)
+
+def _serialize_conflicts(conflicts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {key: value.isoformat() if isinstance(value, date) else value for key, value in conflict.items()}
+        for conflict in conflicts
+    ]
+
+def _overlap_lessons(conflicts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [models.LessonConflict(**c).model_dump(mode="json") for c in conflicts]
+
+def _series_lesson_ids(db: Session, series_id: int) -> List[int]:
+    return db.execute(
+        select(models.Lesson.id).where(models.Lesson.series_id == series_id).order_by(models.Lesson.lesson_date)
+    ).scalars().all()
+
+def _series_response(db: Session, series: models.LessonSeries, skipped: Optional[List[Dict[str, Any]]] = None):
+    response = models.LessonSeriesResponse.model_validate(series)
+    response.lesson_ids = _series_lesson_ids(db, series.id)
+    response.skipped = skipped or []
+    return response
+
+def _ensure_no_tail_overlap(db: Session, db_series: models.LessonSeries, tail, update_data: Dict[str, Any]):
+    """
+    Con LESSON_OVERLAP_ENFORCED rifiuta (409) la modifica se una lezione della serie, con i
+    nuovi orario, durata o professore, si sovrappone a un'altra lezione. Le lezioni modificate
+    sono escluse dal confronto.
+    """
+    lessons = db.execute(
+        select(models.Lesson.id, models.Lesson.lesson_date, models.Lesson.start_time, models.Lesson.duration).where(tail)
+    ).all()
+    overlaps = find_series_conflicts(
+        db,
+        [
+            (lesson.lesson_date, update_data.get("start_time", lesson.start_time), update_data.get("duration", lesson.duration))
+            for lesson in lessons
+        ],
+        db_series.student_id,
+        update_data.get("professor_id", db_series.professor_id),
+        exclude_lesson_ids=[lesson.id for lesson in lessons]
+    )
+    if overlaps:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "code": "lesson_overlap",
+                "message": "Alcune lezioni della serie si sovrappongono ad altre lezioni dello studente o del professore",
+                "conflicts": [
+                    {"lesson_date": lesson_date.isoformat(), "reason": "overlap", "lessons": _overlap_lessons(found)}
+                    for lesson_date, found in sorted(overlaps.items())
+                ]
+            }
+        )
+
+def _resolve_package(db: Session, series: models.LessonSeriesCreate) -> models.Package:
+    """Pacchetto della serie (indicato o quello in corso dello studente), bloccato fino al commit."""
+    if series.package_id:
+        package = db.query(models.Package).filter(models.Package.id == series.package_id).with_for_update().first()
+        if not package:
+            raise HTTPException(status_code=404, detail="Package not found")
+    else:
+        package = db.query(models.Package).join(
+            models.PackageStudent
+        ).filter(
+            models.PackageStudent.student_id == series.student_id,
+            models.Package.status == "in_progress"
+        ).order_by(models.Package.start_date.desc(), models.Package.id.desc()).with_for_update(of=models.Package).first()
+        if not package:
+            raise HTTPException(status_code=400, detail="Nessun pacchetto in corso per lo studente")
+
+    student_in_package = db.query(models.PackageStudent).filter(
+        models.PackageStudent.package_id == package.id,
+        models.PackageStudent.student_id == series.student_id
+    ).first()
+    if not student_in_package:
+        raise HTTPException(status_code=400, detail="Lo studente non è associato a questo pacchetto")
+    return package
+
+def _find_conflicts(db: Session, series: models.LessonSeriesCreate, dates: List[date], start_time, package) -> List[Dict[str, Any]]:
+    """
+    Conflitti di tutte le date in un solo passaggio: lezione già presente per lo studente
+    (stessa data e orario), sovrapposizione con altre lezioni dello studente o del professore
+    (con LESSON_OVERLAP_ENFORCED), data oltre la scadenza del pacchetto, ore del pacchetto esaurite.
+    """
+    existing = set(db.execute(
+        select(models.Lesson.lesson_date).where(
+            models.Lesson.student_id == series.student_id,
+            models.Lesson.lesson_date.in_(dates),
+            (models.Lesson.start_time == start_time) if start_time else models.Lesson.start_time.is_(None)
+        )
+    ).scalars().all())
+    overlaps = find_series_conflicts(
+        db, [(lesson_date, start_time, series.duration) for lesson_date in dates],
+        series.student_id, series.professor_id
+    ) if LESSON_OVERLAP_ENFORCED else {}
+
+    conflicts = []
+    available = package.remaining_hours if package else None
+    for lesson_date in dates:
+        if lesson_date in existing:
+            conflicts.append({"lesson_date": lesson_date, "reason": "duplicate"})
+        elif lesson_date in overlaps:
+            conflicts.append({"lesson_date": lesson_date, "reason": "overlap", "lessons": _overlap_lessons(overlaps[lesson_date])})
+        elif package and lesson_date > package.expiry_date:
+            conflicts.append({"lesson_date": lesson_date, "reason": "package_expired", "expiry_date": package.expiry_date})
+        elif package and series.duration > available:
+            conflicts.append({
+                "lesson_date": lesson_date, "reason": "package_overflow",
+                "remaining_hours": float(available), "lesson_duration": float(series.duration)
+            })
+        elif package:
+            available -= series.duration
+    return conflicts
+
+@router.post("/", response_model=models.LessonSeriesResponse, status_code=status.HTTP_201_CREATED)
+def create_lesson_series(
+    series: models.LessonSeriesCreate,
+    db: Session = Depends(get_db),
+    current_user: models.Professor = Depends(get_current_professor)
+):
+    """
+    Crea una serie settimanale e ne materializza tutte le lezioni con un'unica INSERT.
+    Le ore del pacchetto vengono verificate prima di inserire: con conflitti la serie viene
+    rifiutata (409, elenco completo dei conflitti) oppure, con skip_conflicts, create solo
+    le lezioni senza conflitti.
+    """
+    from app.routes.packages import update_package_status, adjust_package_hours
+
+    if not db.query(models.Professor.id).filter(models.Professor.id == series.professor_id).first():
+        raise HTTPException(status_code=404, detail="Professor not found")
+    if not db.query(models.Student.id).filter(models.Student.id == series.student_id).first():
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    start_time_obj = parse_time_string(series.start_time) if series.start_time else None
+    package = _resolve_package(db, series) if series.is_package else None
+
+    dates = series_dates(series.start_date, series.weekday, series.end_date, series.occurrences)
+    if not dates:
+        raise HTTPException(status_code=400, detail="Nessuna data della serie nell'intervallo indicato")
+
+    conflicts = _find_conflicts(db, series, dates, start_time_obj, package)
+    if conflicts and not series.skip_conflicts:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "Alcune lezioni della serie sono in conflitto",
+                "conflicts": _serialize_conflicts(conflicts),
+                "remaining_hours": float(package.remaining_hours) if package else None
+            }
+        )
+    conflict_dates = {c["lesson_date"] for c in conflicts}
+    lesson_dates = [d for d in dates if d not in conflict_dates]
+    if not lesson_dates:
+        raise HTTPException(status_code=400, detail="Tutte le lezioni della serie sono in conflitto")
+
+    db_series = models.LessonSeries(
+        professor_id=series.professor_id,
+        student_id=series.student_id,
+        weekday=series.weekday,
+        start_time=start_time_obj,
+        duration=series.duration,
+        hourly_rate=series.hourly_rate,
+        is_package=series.is_package,
+        package_id=package.id if package else None,
+        price=Decimal('0') if package else (series.price or Decimal('0')),
+        is_online=series.is_online,
+        start_date=series.start_date,
+        end_date=series.end_date or dates[-1],
+        created_by=current_user.id
+    )
+    db.add(db_series)
+    db.flush()
+
+    # Stessi valori di POST /lessons/: le lezioni da pacchetto sono pagate, le singole future no
+    payment_date = determine_payment_date(is_paid=package.is_paid, reference_date=package.start_date) if package else None
+    lesson_values = {
+        "professor_id": series.professor_id,
+        "student_id": series.student_id,
+        "duration": series.duration,
+        "is_package": series.is_package,
+        "package_id": db_series.package_id,
+        "hourly_rate": series.hourly_rate,
+        "total_payment": series.duration * series.hourly_rate,
+        "is_paid": bool(package),
+        "start_time": start_time_obj,
+        "payment_date": payment_date,
+        "price": db_series.price,
+        "is_online": series.is_online,
+        "series_id": db_series.id,
+    }
+    db.execute(
+        insert(models.Lesson),
+        [{**lesson_values, "lesson_date": lesson_date} for lesson_date in lesson_dates]
+    )
+
+    total_hours = series.duration * len(lesson_dates)
+    if package:
+        adjust_package_hours(db, package.id, total_hours)
+        update_package_status(db, package.id, commit=False)
+    mark_finance_months_dirty(db, *lesson_dates)
+
+    log_activity(
+        db=db,
+        professor_id=current_user.id,
+        action_type="create",
+        entity_type="lesson_series",
+        entity_id=db_series.id,
+        payload=activity_payload(
+            "lesson_series_created",
+            student_ids=[series.student_id],
+            professor_ids=[series.professor_id],
+            package_ids=[package.id] if package else None,
+            lesson_count=len(lesson_dates),
+            hours=total_hours,
+            weekday=series.weekday,
+            start_date=lesson_dates[0],
+            end_date=lesson_dates[-1],
+            skipped=len(conflicts) or None
+        )
+    )
+    db.commit()
+    db.refresh(db_series)
+
+    return _series_response(db, db_series, _serialize_conflicts(conflicts))
+
+@router.get("/", response_model=List[models.LessonSeriesResponse])
+@async_db_route
+def read_lesson_series(
+    student_id: Optional[int] = None,
+    professor_id: Optional[int] = None,
+    db: Session = Depends(get_read_db)
+):
+    query = db.query(models.LessonSeries)
+    if student_id is not None:
+        query = query.filter(models.LessonSeries.student_id == student_id)
+    if professor_id is not None:
+        query = query.filter(models.LessonSeries.professor_id == professor_id)
+    series_list = query.order_by(models.LessonSeries.id).all()
+
+    # Id delle lezioni di tutte le serie con una sola query
+    lesson_ids: Dict[int, List[int]] = {}
+    if series_list:
+        rows = db.execute(
+            select(models.Lesson.series_id, models.Lesson.id).where(
+                models.Lesson.series_id.in_([s.id for s in series_list])
+            ).order_by(models.Lesson.lesson_date)
+        ).all()
+        for series_id, lesson_id in rows:
+            lesson_ids.setdefault(series_id, []).append(lesson_id)
+
+    responses = []
+    for db_series in series_list:
+        response = models.LessonSeriesResponse.model_validate(db_series)
+        response.lesson_ids = lesson_ids.get(db_series.id, [])
+        responses.append(response)
+    return responses
+
+@router.get("/{series_id}", response_model=models.LessonSeriesResponse)
+@async_db_route
+def read_lesson_series_detail(series_id: int, db: Session = Depends(get_read_db)):
+    db_series = db.query(models.LessonSeries).filter(models.LessonSeries.id == series_id).first()
+    if db_series is None:
+        raise HTTPException(status_code=404, detail="Lesson series not found")
+    return _series_response(db, db_series)
+
+@router.put("/{series_id}", response_model=models.LessonSeriesResponse)
+def update_lesson_series(
+    series_id: int,
+    changes: models.LessonSeriesUpdate,
+    db: Session = Depends(get_db),
+    current_user: models.Professor = Depends(get_current_professor)
+):
+    """
+    Modifica le lezioni della serie da from_date (default oggi) in poi con un'unica UPDATE,
+    e aggiorna la serie. Un aumento della durata delle lezioni da pacchetto viene verificato
+    sulle ore rimanenti del pacchetto prima di scrivere; con LESSON_OVERLAP_ENFORCED un cambio
+    di orario, durata o professore viene rifiutato (409) se crea sovrapposizioni.
+    """
+    from app.routes.packages import update_package_status, adjust_package_hours
+
+    db_series = db.query(models.LessonSeries).filter(models.LessonSeries.id == series_id).first()
+    if db_series is None:
+        raise HTTPException(status_code=404, detail="Lesson series not found")
+
+    update_data = changes.model_dump(exclude_unset=True)
+    from_date = update_data.pop("from_date", None) or date.today()
+    if not update_data:
+        raise HTTPException(status_code=400, detail="Nessuna modifica indicata")
+    if "price" in update_data and db_series.is_package:
+        raise HTTPException(status_code=400, detail="Il prezzo non si applica alle lezioni da pacchetto")
+    if "professor_id" in update_data and not db.query(models.Professor.id).filter(
+        models.Professor.id == update_data["professor_id"]
+    ).first():
+        raise HTTPException(status_code=404, detail="Professor not found")
+    if "start_time" in update_data:
+        update_data["start_time"] = parse_time_string(update_data["start_time"]) if update_data["start_time"] else None
+
+    tail = _series_tail(series_id, from_date)
+    if LESSON_OVERLAP_ENFORCED and {"start_time", "duration", "professor_id"} & update_data.keys():
+        _ensure_no_tail_overlap(db, db_series, tail, update_data)
+
+    # Differenza di ore delle lezioni da pacchetto coinvolte, calcolata prima dell'UPDATE
+    hours_delta = Decimal('0')
+    package_id = db_series.package_id if db_series.is_package else None
+    if package_id and "duration" in update_data:
+        count, current_hours = db.execute(
+            select(func.count(), func.coalesce(func.sum(models.Lesson.duration), 0)).where(
+                tail, models.Lesson.is_package == True, models.Lesson.package_id == package_id
+            )
+        ).one()
+        hours_delta = update_data["duration"] * count - current_hours
+        if hours_delta > 0:
+            package = db.query(models.Package).filter(models.Package.id == package_id).with_for_update().first()
+            if package and hours_delta > package.remaining_hours:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail={
+                        "message": "Ore del pacchetto insufficienti per la nuova durata",
+                        "package_id": package_id,
+                        "remaining_hours": float(package.remaining_hours),
+                        "additional_hours": float(hours_delta)
+                    }
+                )
+
+    lesson_values = dict(update_data)
+    if "duration" in update_data or "hourly_rate" in update_data:
+        lesson_values["total_payment"] = (
+            update_data.get("duration", models.Lesson.duration) * update_data.get("hourly_rate", models.Lesson.hourly_rate)
+        )
+    updated_dates = select(models.Lesson.lesson_date).where(tail)
+    mark_finance_months_dirty_from(db, updated_dates)
+    result = db.execute(
+        update(models.Lesson).where(tail).values(**lesson_values).execution_options(synchronize_session=False)
+    )
+
+    if hours_delta:
+        adjust_package_hours(db, package_id, hours_delta)
+        update_package_status(db, package_id, commit=False)
+
+    for key, value in update_data.items():
+        setattr(db_series, key, value)
+
+    log_activity(
+        db=db,
+        professor_id=current_user.id,
+        action_type="update",
+        entity_type="lesson_series",
+        entity_id=series_id,
+        payload=activity_payload(
+            "lesson_series_updated",
+            student_ids=[db_series.student_id],
+            professor_ids=[db_series.professor_id],
+            package_ids=[package_id] if package_id else None,
+            lesson_count=result.rowcount,
+            from_date=from_date,
+            changed=sorted(update_data)
+        )
+    )
+    db.commit()
+    db.refresh(db_series)
+    return _series_response(db, db_series)
+
+@router.delete("/{series_id}", response_model=Dict[str, Any])
+def cancel_lesson_series(
+    series_id: int,
+    from_date: Optional[date] = Query(None, description="Elimina le lezioni da questa data in poi (default: oggi)"),
+    db: Session = Depends(get_db),
+    current_user: models.Professor = Depends(get_current_professor)
+):
+    """
+    Annulla la serie da from_date in poi: elimina le lezioni future con un'unica DELETE,
+    restituisce le ore al pacchetto e accorcia la serie. Se non restano lezioni la serie viene eliminata.
+    """
+    from app.routes.packages import update_package_status, adjust_package_hours
+
+    db_series = db.query(models.LessonSeries).filter(models.LessonSeries.id == series_id).first()
+    if db_series is None:
+        raise HTTPException(status_code=404, detail="Lesson series not found")
+    from_date = from_date or date.today()
+    tail = _series_tail(series_id, from_date)
+
+    mark_finance_months_dirty_from(db, select(models.Lesson.lesson_date).where(tail))
+    deleted = db.execute(
+        delete(models.Lesson).where(tail).returning(
+            models.Lesson.package_id, models.Lesson.is_package, models.Lesson.duration
+        ).execution_options(synchronize_session=False)
+    ).all()
+
+    # Ore restituite a ciascun pacchetto, una sola volta per pacchetto
+    released: Dict[int, Decimal] = {}
+    for package_id, is_package, duration in deleted:
+        if is_package and package_id:
+            released[package_id] = released.get(package_id, Decimal('0')) + duration
+    for package_id, hours in released.items():
+        adjust_package_hours(db, package_id, -hours)
+        update_package_status(db, package_id, commit=False)
+
+    remaining = db.execute(
+        select(func.count()).select_from(models.Lesson).where(models.Lesson.series_id == series_id)
+    ).scalar()
+    series_deleted = remaining == 0
+
+    log_activity(
+        db=db,
+        professor_id=current_user.id,
+        action_type="delete",
+        entity_type="lesson_series",
+        entity_id=series_id,
+        payload=activity_payload(
+            "lesson_series_cancelled",
+            student_ids=[db_series.student_id],
+            professor_ids=[db_series.professor_id],
+            package_ids=list(released) or None,
+            lesson_count=len(deleted),
+            hours=sum((row.duration for row in deleted), Decimal('0')),
+            from_date=from_date
+        )
+    )
+    if series_deleted:
+        db.delete(db_series)
+    elif from_date <= db_series.end_date:
+        db_series.end_date = max(db_series.start_date, from_date - timedelta(days=1))
+    db.commit()
+
+    return {"deleted_lessons": len(deleted), "series_deleted": series_deleted}
@@ -1,17 +1,24 @@
 # routes/lessons.py
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query, UploadFile, File
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from sqlalchemy import tuple_
+from typing import List, Dict, Any, Optional
 from decimal import Decimal, InvalidOperation
 from datetime import date, time
+import base64
+import io
 
-from ..auth import get_current_professor  # Importato per ottenere l'utente corrente
+from ..auth import get_current_professor, get_current_admin  # Importato per ottenere l'utente corrente
 from app.routes.activity import log_activity  # Importato per registrare le attività
+from ..activity_descriptions import activity_payload
 
 from .. import models
-from ..database import get_db
+from ..database import get_db, get_read_db, async_db_route
 from ..utils import parse_time_string, determine_payment_date
+from ..finance_rollups import mark_finance_months_dirty
+from ..lesson_import import import_lessons_csv
+from ..lesson_conflicts import find_lesson_conflicts, LESSON_OVERLAP_ENFORCED
 
 router = APIRouter(
     prefix="/lessons",
@@ -27,11 +34,29 @@ class PackageOverflowError(HTTPException):
             detail=detail
         )
 
+def _ensure_no_overlap(db, lesson_date, start_time, duration, student_id, professor_id, exclude_lesson_id=None):
+    """Con LESSON_OVERLAP_ENFORCED attivo rifiuta (409) le lezioni sovrapposte per studente o professore."""
+    if not LESSON_OVERLAP_ENFORCED:
+        return
+    conflicts = find_lesson_conflicts(
+        db, lesson_date, start_time, duration,
+        student_id=student_id, professor_id=professor_id, exclude_lesson_id=exclude_lesson_id
+    )
+    if conflicts:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "code": "lesson_overlap",
+                "message": "La lezione si sovrappone a un'altra lezione dello studente o del professore",
+                "conflicts": [models.LessonConflict(**c).model_dump(mode="json") for c in conflicts],
+            }
+        )
+
 # Funzioni ausiliarie per gestire l'overflow
 def _handle_use_package_option(db, values, lesson_data, package_id, lesson_hours_in_package, overflow_hours, current_user):
     """Gestisce l'opzione di usare un pacchetto esistente con una lezione singola aggiuntiva per le ore in eccesso."""
     from .. import models
-    from app.routes.packages import update_package_status
+    from app.routes.packages import update_package_status, adjust_package_hours
     from ..utils import parse_time_string, determine_payment_date
     from decimal import Decimal
     
@@ -85,8 +110,10 @@ def _handle_use_package_option(db, values, lesson_data, package_id, lesson_hours
     db.add(lesson_single)
     db.flush()
     
-    # Aggiorna le ore rimanenti del pacchetto
+    # Aggiorna le ore usate e lo stato del pacchetto
+    adjust_package_hours(db, package_id, lesson_hours_in_package)
     update_package_status(db, package_id, commit=False)
+    mark_finance_months_dirty(db, lesson_data["lesson_date"])
     package = db.query(models.Package).filter(models.Package.id == package_id).first()
     
     # Prepara i risultati
@@ -105,10 +132,6 @@ def _handle_use_package_option(db, values, lesson_data, package_id, lesson_hours
         }
     ]
 
-        # Log delle attività
-    student = db.query(models.Student).filter(models.Student.id == lesson_data["student_id"]).first()
-    student_full_name = f"{student.first_name} {student.last_name}" if student else f"Studente #{lesson_data['student_id']}"
-
     # Log per la lezione da pacchetto
     log_activity(
         db=db,
@@ -116,7 +139,16 @@ def _handle_use_package_option(db, values, lesson_data, package_id, lesson_hours
         action_type="create",
         entity_type="lesson",
         entity_id=lesson_in_package.id,
-        description=f"Lezione da pacchetto per {student_full_name} di {lesson_hours_in_package} ore"
+        payload=activity_payload(
+            "lesson_created",
+            student_ids=[lesson_data["student_id"]],
+            professor_ids=[lesson_data["professor_id"]],
+            package_ids=[package_id],
+            hours=lesson_hours_in_package,
+            is_package=True,
+            lesson_date=lesson_data["lesson_date"],
+            overflow="package"
+        )
     )
 
     # Log per la lezione singola
@@ -126,7 +158,15 @@ def _handle_use_package_option(db, values, lesson_data, package_id, lesson_hours
         action_type="create",
         entity_type="lesson",
         entity_id=lesson_single.id,
-        description=f"Lezione singola per {student_full_name} di {overflow_hours} ore (overflow da pacchetto)"
+        payload=activity_payload(
+            "lesson_created",
+            student_ids=[lesson_data["student_id"]],
+            professor_ids=[lesson_data["professor_id"]],
+            hours=overflow_hours,
+            is_package=False,
+            lesson_date=lesson_data["lesson_date"],
+            overflow="single"
+        )
     )
     
     return {
@@ -141,7 +181,7 @@ def _handle_use_package_option(db, values, lesson_data, package_id, lesson_hours
 def _handle_create_new_package_option(db, values, lesson_data, package_id, lesson_hours_in_package, overflow_hours, current_user):
     """Gestisce l'opzione di creare un nuovo pacchetto per le ore in eccesso."""
     from .. import models
-    from app.routes.packages import update_package_status, calculate_expiry_date
+    from app.routes.packages import update_package_status, calculate_expiry_date, adjust_package_hours
     from ..utils import parse_time_string, determine_payment_date
     from decimal import Decimal
     from datetime import timedelta
@@ -234,8 +274,11 @@ def _handle_create_new_package_option(db, values, lesson_data, package_id, lesso
     db.add(lesson_in_new_package)
     db.flush()
     
-    # Aggiorna le ore rimanenti di entrambi i pacchetti
+    # Aggiorna le ore usate e rimanenti di entrambi i pacchetti
+    adjust_package_hours(db, package_id, lesson_hours_in_package)
+    adjust_package_hours(db, new_package.id, overflow_hours)
     update_package_status(db, package_id, commit=False)
+    mark_finance_months_dirty(db, lesson_data["lesson_date"])
     update_package_status(db, new_package.id, commit=False)
     
     # Aggiorna le referenze per la risposta
@@ -259,10 +302,6 @@ def _handle_create_new_package_option(db, values, lesson_data, package_id, lesso
         }
     ]
 
-    # Log delle attività
-    student = db.query(models.Student).filter(models.Student.id == lesson_data["student_id"]).first()
-    student_full_name = f"{student.first_name} {student.last_name}" if student else f"Studente #{lesson_data['student_id']}"
-
     # Log per la lezione nel pacchetto originale
     log_activity(
         db=db,
@@ -270,7 +309,16 @@ def _handle_create_new_package_option(db, values, lesson_data, package_id, lesso
         action_type="create",
         entity_type="lesson",
         entity_id=lesson_in_original_package.id,
-        description=f"Lezione da pacchetto per {student_full_name} di {lesson_hours_in_package} ore"
+        payload=activity_payload(
+            "lesson_created",
+            student_ids=[student_id],
+            professor_ids=[lesson_data["professor_id"]],
+            package_ids=[package_id],
+            hours=lesson_hours_in_package,
+            is_package=True,
+            lesson_date=lesson_data["lesson_date"],
+            overflow="package"
+        )
     )
 
     # Log per la lezione nel nuovo pacchetto
@@ -280,7 +328,16 @@ def _handle_create_new_package_option(db, values, lesson_data, package_id, lesso
         action_type="create",
         entity_type="lesson",
         entity_id=lesson_in_new_package.id,
-        description=f"Lezione in nuovo pacchetto per {student_full_name} di {overflow_hours} ore"
+        payload=activity_payload(
+            "lesson_created",
+            student_ids=[student_id],
+            professor_ids=[lesson_data["professor_id"]],
+            package_ids=[new_package.id],
+            hours=overflow_hours,
+            is_package=True,
+            lesson_date=lesson_data["lesson_date"],
+            overflow="new_package"
+        )
     )
 
     # Log per la creazione del nuovo pacchetto
@@ -290,7 +347,13 @@ def _handle_create_new_package_option(db, values, lesson_data, package_id, lesso
         action_type="create",
         entity_type="package",
         entity_id=new_package.id,
-        description=f"Nuovo pacchetto creato per {student_full_name} di {overflow_hours} ore (overflow)"
+        payload=activity_payload(
+            "package_created",
+            student_ids=[student_id],
+            package_ids=[new_package.id],
+            hours=overflow_hours,
+            overflow=True
+        )
     )
     
     return {
@@ -312,8 +375,8 @@ def create_lesson(
     db: Session = Depends(get_db),
     current_user: models.Professor = Depends(get_current_professor)
 ):
-    # Importa la funzione update_package_remaining_hours
-    from app.routes.packages import update_package_status
+    # Importa le funzioni per aggiornare ore e stato del pacchetto
+    from app.routes.packages import update_package_status, adjust_package_hours
     
     # Controlla se il professore esiste
     professor = db.query(models.Professor).filter(models.Professor.id == lesson.professor_id).first()
@@ -332,6 +395,8 @@ def create_lesson(
         if start_time_obj is None:
             raise HTTPException(status_code=400, detail="Invalid time format. Use HH:MM or HH:MM:SS")
     
+    _ensure_no_overlap(db, lesson.lesson_date, start_time_obj, lesson.duration, lesson.student_id, lesson.professor_id)
+    
     # Gestione del pacchetto (se applicabile)
     if lesson.is_package:
         if not lesson.package_id:
@@ -422,22 +487,33 @@ def create_lesson(
         )
         
         db.add(db_lesson)
-        db.commit()
-        db.refresh(db_lesson)
         
-        # Aggiorna le ore rimanenti del pacchetto usando la nostra funzione helper
-        update_package_status(db, package_id)
+        # Incrementa le ore usate del pacchetto nella stessa transazione della lezione
+        adjust_package_hours(db, package_id, lesson.duration)
+        mark_finance_months_dirty(db, lesson.lesson_date)
+        
+        # Aggiorna lo stato del pacchetto usando la nostra funzione helper
+        update_package_status(db, package_id, commit=False)
 
-        # Log dell'attività
-        student_full_name = f"{student.first_name} {student.last_name}"
+        # Log dell'attività (nella stessa transazione)
         log_activity(
             db=db,
             professor_id=current_user.id,
             action_type="create",
             entity_type="lesson",
             entity_id=db_lesson.id,
-            description=f"Creata lezione da pacchetto per {student_full_name} di {lesson.duration} ore"
+            payload=activity_payload(
+                "lesson_created",
+                student_ids=[lesson.student_id],
+                professor_ids=[lesson.professor_id],
+                package_ids=[package_id],
+                hours=lesson.duration,
+                is_package=True,
+                lesson_date=lesson.lesson_date
+            )
         )
+        db.commit()
+        db.refresh(db_lesson)
         
         return db_lesson
     
@@ -465,21 +541,48 @@ def create_lesson(
         )
         
         db.add(db_lesson)
-        db.commit()
-        db.refresh(db_lesson)
+        mark_finance_months_dirty(db, lesson.lesson_date)
+        db.flush()
 
-        # Log dell'attività
-        student_full_name = f"{student.first_name} {student.last_name}"
+        # Log dell'attività (nella stessa transazione)
         log_activity(
             db=db,
             professor_id=current_user.id,
             action_type="create",
             entity_type="lesson",
             entity_id=db_lesson.id,
-            description=f"Creata lezione singola per {student_full_name} di {lesson.duration} ore"
+            payload=activity_payload(
+                "lesson_created",
+                student_ids=[lesson.student_id],
+                professor_ids=[lesson.professor_id],
+                hours=lesson.duration,
+                is_package=False,
+                lesson_date=lesson.lesson_date
+            )
         )
+        db.commit()
+        db.refresh(db_lesson)
         return db_lesson
 
+@router.post("/import", response_model=Dict[str, Any])
+def import_lessons(
+    file: UploadFile = File(..., description="CSV con intestazione: professor_id, student_id, lesson_date, duration, hourly_rate, ..."),
+    dry_run: bool = Query(False, description="Valida il file senza importare"),
+    db: Session = Depends(get_db),
+    current_user: models.Professor = Depends(get_current_admin)
+):
+    """
+    Import massivo di lezioni da CSV (COPY in staging e validazione in SQL).
+    Le righe valide vengono importate, quelle non valide restituite in errors con il numero di riga.
+    """
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        return import_lessons_csv(db, stream, current_user.id, dry_run=dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        stream.detach()
+
 @router.post("/handle-overflow", response_model=Dict[str, Any])
 def handle_lesson_overflow(
     overflow_data: dict, 
@@ -581,19 +684,137 @@ def handle_lesson_overflow(
         )
 
 @router.get("/", response_model=List[models.LessonResponse])
-def read_lessons(skip: int = 0, limit: int = 100000, db: Session = Depends(get_db)):
+@async_db_route
+def read_lessons(skip: int = 0, limit: int = 100000, db: Session = Depends(get_read_db)):
     lessons = db.query(models.Lesson).offset(skip).limit(limit).all()
     return lessons
 
+def _encode_lesson_cursor(lesson_date: date, lesson_id: int) -> str:
+    """Codifica la posizione (lesson_date, id) dell'ultima lezione restituita in un token opaco."""
+    raw = f"{lesson_date.isoformat()}|{lesson_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_lesson_cursor(cursor: str):
+    """Decodifica un token prodotto da _encode_lesson_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        date_part, id_part = raw.split("|")
+        return date.fromisoformat(date_part), int(id_part)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Cursore non valido")
+
+@router.get("/paged", response_model=models.LessonPageResponse)
+@async_db_route
+def read_lessons_paged(
+    cursor: Optional[str] = Query(None, description="Token restituito come next_cursor dalla pagina precedente"),
+    limit: int = Query(100, ge=1, le=1000),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    professor_id: Optional[int] = None,
+    student_id: Optional[int] = None,
+    package_id: Optional[int] = None,
+    is_package: Optional[bool] = None,
+    is_paid: Optional[bool] = None,
+    is_online: Optional[bool] = None,
+    fields: Optional[str] = Query(None, description="Campi da restituire separati da virgola (default: tutti)"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Elenco delle lezioni paginato a cursore su (lesson_date, id), con filtri lato server
+    e proiezione dei campi. Il costo dipende dalla dimensione della pagina, non della tabella.
+    """
+    allowed_fields = list(models.LessonResponse.model_fields.keys())
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in allowed_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Campi non validi: {', '.join(unknown)}")
+    else:
+        requested = allowed_fields
+    
+    # id e lesson_date servono sempre per costruire il cursore
+    selected = ["id", "lesson_date"] + [f for f in requested if f not in ("id", "lesson_date")]
+    query = db.query(*[getattr(models.Lesson, f) for f in selected])
+    
+    if date_from:
+        query = query.filter(models.Lesson.lesson_date >= date_from)
+    if date_to:
+        query = query.filter(models.Lesson.lesson_date <= date_to)
+    if professor_id is not None:
+        query = query.filter(models.Lesson.professor_id == professor_id)
+    if student_id is not None:
+        query = query.filter(models.Lesson.student_id == student_id)
+    if package_id is not None:
+        query = query.filter(models.Lesson.package_id == package_id)
+    if is_package is not None:
+        query = query.filter(models.Lesson.is_package == is_package)
+    if is_paid is not None:
+        query = query.filter(models.Lesson.is_paid == is_paid)
+    if is_online is not None:
+        query = query.filter(models.Lesson.is_online == is_online)
+    
+    if cursor:
+        last_date, last_id = _decode_lesson_cursor(cursor)
+        query = query.filter(
+            tuple_(models.Lesson.lesson_date, models.Lesson.id) > tuple_(last_date, last_id)
+        )
+    
+    # Una riga in più indica se esiste una pagina successiva
+    rows = query.order_by(models.Lesson.lesson_date, models.Lesson.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    items = []
+    for row in rows:
+        item = {f: getattr(row, f) for f in requested}
+        if isinstance(item.get("start_time"), time):
+            item["start_time"] = item["start_time"].strftime('%H:%M:%S')
+        items.append(item)
+    
+    next_cursor = None
+    if has_more and rows:
+        next_cursor = _encode_lesson_cursor(rows[-1].lesson_date, rows[-1].id)
+    
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/conflicts", response_model=models.LessonConflictResponse)
+@async_db_route
+def check_lesson_conflicts(
+    lesson_date: date,
+    start_time: str,
+    duration: Decimal = Query(..., gt=0),
+    student_id: Optional[int] = None,
+    professor_id: Optional[int] = None,
+    exclude_lesson_id: Optional[int] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Lezioni dello studente e/o del professore che si sovrappongono all'orario indicato
+    (exclude_lesson_id esclude la lezione in modifica). Un probe sugli indici GiST di time_range.
+    """
+    start_time_obj = parse_time_string(start_time)
+    if start_time_obj is None:
+        raise HTTPException(status_code=400, detail="Invalid time format. Use HH:MM or HH:MM:SS")
+    if student_id is None and professor_id is None:
+        raise HTTPException(status_code=400, detail="Specificare student_id e/o professor_id")
+
+    conflicts = find_lesson_conflicts(
+        db, lesson_date, start_time_obj, duration,
+        student_id=student_id, professor_id=professor_id, exclude_lesson_id=exclude_lesson_id
+    )
+    return {"has_conflict": bool(conflicts), "conflicts": conflicts}
+
 @router.get("/{lesson_id}", response_model=models.LessonResponse)
-def read_lesson(lesson_id: int, db: Session = Depends(get_db)):
+@async_db_route
+def read_lesson(lesson_id: int, db: Session = Depends(get_read_db)):
     db_lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
     if db_lesson is None:
         raise HTTPException(status_code=404, detail="Lesson not found")
     return db_lesson
 
 @router.get("/professor/{professor_id}", response_model=List[models.LessonResponse])
-def read_professor_lessons(professor_id: int, db: Session = Depends(get_db)):
+@async_db_route
+def read_professor_lessons(professor_id: int, db: Session = Depends(get_read_db)):
     # Controlla se il professore esiste
     professor = db.query(models.Professor).filter(models.Professor.id == professor_id).first()
     if not professor:
@@ -604,7 +825,8 @@ def read_professor_lessons(professor_id: int, db: Session = Depends(get_db)):
     return lessons
 
 @router.get("/student/{student_id}", response_model=List[models.LessonResponse])
-def read_student_lessons(student_id: int, db: Session = Depends(get_db)):
+@async_db_route
+def read_student_lessons(student_id: int, db: Session = Depends(get_read_db)):
     # Controlla se lo studente esiste
     student = db.query(models.Student).filter(models.Student.id == student_id).first()
     if not student:
@@ -625,8 +847,8 @@ def update_lesson(
     Aggiorna una lezione esistente. Se la lezione fa parte di un pacchetto, aggiorna anche le ore rimanenti del pacchetto.
     Gestisce correttamente la modifica della durata della lezione, anche per le lezioni di pacchetti.
     """
-    # Importa la funzione update_package_remaining_hours
-    from app.routes.packages import update_package_status
+    # Importa le funzioni per aggiornare ore e stato del pacchetto
+    from app.routes.packages import update_package_status, adjust_package_hours
     
     db_lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
     if db_lesson is None:
@@ -638,6 +860,7 @@ def update_lesson(
     old_package_id = db_lesson.package_id
     old_is_paid = db_lesson.is_paid
     old_price = db_lesson.price
+    old_lesson_date = db_lesson.lesson_date
     
     # Aggiorna i campi della lezione
     update_data = lesson.dict(exclude_unset=True)
@@ -672,9 +895,22 @@ def update_lesson(
     for key, value in update_data.items():
         setattr(db_lesson, key, value)
     
-    # Esegui il commit delle modifiche alla lezione
-    db.commit()
-    db.refresh(db_lesson)
+    _ensure_no_overlap(
+        db, db_lesson.lesson_date, db_lesson.start_time, db_lesson.duration,
+        db_lesson.student_id, db_lesson.professor_id, exclude_lesson_id=db_lesson.id
+    )
+    
+    # Sposta le ore usate dal vecchio al nuovo pacchetto (o ricalcola la differenza di durata)
+    hours_delta = {}
+    if old_is_package and old_package_id:
+        hours_delta[old_package_id] = hours_delta.get(old_package_id, Decimal('0')) - old_duration
+    if db_lesson.is_package and db_lesson.package_id:
+        hours_delta[db_lesson.package_id] = hours_delta.get(db_lesson.package_id, Decimal('0')) + Decimal(str(db_lesson.duration))
+    for package_id, delta in hours_delta.items():
+        adjust_package_hours(db, package_id, delta)
+    
+    # I dati economici del mese precedente e di quello nuovo vanno ricalcolati
+    mark_finance_months_dirty(db, old_lesson_date, db_lesson.lesson_date)
     
     # Lista di pacchetti da aggiornare
     packages_to_update = set()
@@ -689,29 +925,18 @@ def update_lesson(
     
     # Aggiorna tutti i pacchetti coinvolti
     for package_id in packages_to_update:
-        update_package_status(db, package_id)
-    
-    # Refresh della lezione per ottenere tutti i campi aggiornati
-    db.refresh(db_lesson)
+        update_package_status(db, package_id, commit=False)
 
-    # Log dell'attività
-    student = db.query(models.Student).filter(models.Student.id == db_lesson.student_id).first()
-    student_full_name = f"{student.first_name} {student.last_name}" if student else f"Studente #{db_lesson.student_id}"
-    lesson_type = "da pacchetto" if db_lesson.is_package else "singola"
-
-    # Descrizione base
-    description = f"Lezione {lesson_type} per {student_full_name} di {db_lesson.duration} ore"
+    # Log dell'attività (nella stessa transazione)
+    payment_change = {}
 
     # Aggiungi dettagli sul cambiamento dello stato di pagamento SOLO per lezioni singole
     if "is_paid" in update_data and old_is_paid != db_lesson.is_paid and not db_lesson.is_package:
-        if db_lesson.is_paid:
-            description += f" - impostata come pagata (€{db_lesson.price})"
-        else:
-            description += " - impostata come non pagata"
+        payment_change = {"paid": db_lesson.is_paid, "price": db_lesson.price}
 
     # Se è stato cambiato solo il prezzo senza cambiare lo stato di pagamento (solo per lezioni singole)
     elif "price" in update_data and old_price != db_lesson.price and db_lesson.is_paid and not db_lesson.is_package:
-        description += f" - aggiornato importo pagamento a €{db_lesson.price}"
+        payment_change = {"new_price": db_lesson.price}
 
     log_activity(
         db=db,
@@ -719,8 +944,21 @@ def update_lesson(
         action_type="update",
         entity_type="lesson",
         entity_id=db_lesson.id,
-        description=description
+        payload=activity_payload(
+            "lesson_updated",
+            student_ids=[db_lesson.student_id],
+            professor_ids=[db_lesson.professor_id],
+            package_ids=sorted(packages_to_update),
+            hours=db_lesson.duration,
+            is_package=db_lesson.is_package,
+            lesson_date=db_lesson.lesson_date,
+            **payment_change
+        )
     )
+    
+    # Un solo commit per lezione, pacchetti e log
+    db.commit()
+    db.refresh(db_lesson)
 
     return db_lesson
 
@@ -730,8 +968,8 @@ def delete_lesson(
     db: Session = Depends(get_db),
     current_user: models.Professor = Depends(get_current_professor)
 ):
-    # Importa la funzione update_package_remaining_hours
-    from app.routes.packages import update_package_status
+    # Importa le funzioni per aggiornare ore e stato del pacchetto
+    from app.routes.packages import update_package_status, adjust_package_hours
     
     db_lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
     if db_lesson is None:
@@ -742,29 +980,35 @@ def delete_lesson(
     if db_lesson.is_package and db_lesson.package_id:
         package_id = db_lesson.package_id
 
-    # Log dell'attività
-    # Ottieni i dati necessari per il log prima di eliminare la lezione
-    student = db.query(models.Student).filter(models.Student.id == db_lesson.student_id).first()
-    student_full_name = f"{student.first_name} {student.last_name}" if student else f"Studente #{db_lesson.student_id}"
-    lesson_type = "da pacchetto" if db_lesson.is_package else "singola"
     lesson_duration = db_lesson.duration
 
-    # Log dell'attività
+    # Log dell'attività (i dati della lezione restano nel payload dopo l'eliminazione)
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="delete",
         entity_type="lesson",
         entity_id=lesson_id,
-        description=f"Lezione {lesson_type} per {student_full_name} di {lesson_duration} ore"
+        payload=activity_payload(
+            "lesson_deleted",
+            student_ids=[db_lesson.student_id],
+            professor_ids=[db_lesson.professor_id],
+            package_ids=[package_id] if package_id else None,
+            hours=lesson_duration,
+            is_package=db_lesson.is_package,
+            lesson_date=db_lesson.lesson_date
+        )
     )
     
-    # Elimina la lezione
+    # Elimina la lezione e restituisci le ore al pacchetto nella stessa transazione
     db.delete(db_lesson)
-    db.commit()
+    if package_id:
+        adjust_package_hours(db, package_id, -lesson_duration)
+    mark_finance_months_dirty(db, db_lesson.lesson_date)
     
     # Se la lezione faceva parte di un pacchetto, aggiorna le ore rimanenti
     if package_id:
-        update_package_status(db, package_id)
+        update_package_status(db, package_id, commit=False)
+    db.commit()
     
     return None
\ No newline at end of file
@@ -1,16 +1,19 @@
 # routes/packages.py
 from fastapi import APIRouter, Depends, HTTPException, status as http_status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Iterable, Union
 from datetime import date, timedelta
 from decimal import Decimal
-from sqlalchemy import func
+from sqlalchemy import func, select, update, case, and_, or_, literal, Select
+from sqlalchemy.orm import selectinload
 
-from ..auth import get_current_professor  # Importato per ottenere l'utente corrente
+from ..auth import get_current_professor, get_current_admin  # Importato per ottenere l'utente corrente
 from app.routes.activity import log_activity  # Importato per registrare le attività
+from ..activity_descriptions import activity_payload
 
 from .. import models
-from ..database import get_db
+from ..database import get_db, get_read_db, async_db_route
+from ..finance_rollups import mark_finance_months_dirty, mark_finance_months_dirty_from
 
 router = APIRouter(
     prefix="/packages",
@@ -40,55 +43,121 @@ def calculate_expiry_date(start_date: date) -> date:
     
     return expiry_date
 
-def update_package_status(db: Session, package_id: int, commit: bool = True):
+def package_status_expression(remaining_hours, today: date):
     """
-    Update package status based on expiry date, payment status and remaining hours.
-    Also recalculates remaining hours.
+    Espressione SQL equivalente alle regole di stato di update_package_status:
+    - non scaduto -> in_progress
+    - scaduto con ore rimanenti -> expired
+    - scaduto senza ore rimanenti -> completed solo se pagato e non aperto (costo > 0)
+    """
+    return case(
+        (models.Package.expiry_date >= today, "in_progress"),
+        (remaining_hours > 0, "expired"),
+        (and_(models.Package.is_paid == True, models.Package.package_cost > 0), "completed"),
+        else_="expired",
+    )
+
+def refresh_packages_status(
+    db: Session,
+    package_ids: Optional[Union[Iterable[int], Select]] = None,
+    commit: bool = True,
+) -> int:
+    """
+    Ricalcola remaining_hours e status per un insieme di pacchetti con un'unica UPDATE
+    basata sul contatore hours_used, senza scansionare le lezioni.
+    Scrive solo le righe i cui valori cambiano effettivamente.
+
+    Args:
+        package_ids: ID dei pacchetti (lista o select di ID); None per tutti i pacchetti
+        commit: se True esegue il commit della transazione
+
+    Returns:
+        Numero di pacchetti aggiornati
     """
-    # Get the package
-    package = db.query(models.Package).filter(models.Package.id == package_id).with_for_update().first()
-    if not package:
-        return None
-    
-    # Calculate hours used in lessons
-    hours_used = db.query(func.sum(models.Lesson.duration)).filter(
-        models.Lesson.package_id == package_id,
-        models.Lesson.is_package == True
-    ).scalar() or Decimal('0')
-    
-    # Remaining hours are total hours minus used hours
-    package.remaining_hours = max(Decimal('0'), package.total_hours - hours_used)
-    
-    # Update status based on expiry date, payment status and remaining hours
     today = date.today()
-    
-    # Se il package_cost è 0 (pacchetto aperto), non può mai essere pagato
-    if package.package_cost == Decimal('0'):
-        package.is_paid = False
-        package.payment_date = None
-    
-    if today <= package.expiry_date:
-        # Se non è scaduto, è in corso indipendentemente dal pagamento
-        package.status = "in_progress"
-    else:
-        # Se è scaduto, lo stato dipende dalle ore rimanenti
-        if package.remaining_hours > Decimal('0'):
-            # Se ha ore rimanenti, è considerato scaduto (expired)
-            # indipendentemente dallo stato di pagamento
-            package.status = "expired"
-        else:
-            # Se non ha ore rimanenti, è completato solo se pagato E se non è un pacchetto aperto
-            if package.is_paid and package.package_cost > Decimal('0'):
-                package.status = "completed"
-            else:
-                package.status = "expired"
-    
-    # Commit if requested
+
+    # Gli aggiornamenti in sospeso devono essere visibili alla UPDATE
+    db.flush()
+
+    remaining_hours = func.greatest(
+        literal(Decimal("0")),
+        models.Package.total_hours - models.Package.hours_used
+    )
+    is_open = models.Package.package_cost == 0
+
+    computed = select(
+        models.Package.id.label("id"),
+        remaining_hours.label("remaining_hours"),
+        package_status_expression(remaining_hours, today).label("status"),
+        # Se il package_cost è 0 (pacchetto aperto), non può mai essere pagato
+        case((is_open, False), else_=models.Package.is_paid).label("is_paid"),
+        case((is_open, None), else_=models.Package.payment_date).label("payment_date"),
+    )
+    if package_ids is not None:
+        computed = computed.where(models.Package.id.in_(package_ids))
+    computed = computed.subquery()
+
+    stmt = update(models.Package).where(
+        models.Package.id == computed.c.id,
+        or_(
+            models.Package.remaining_hours.is_distinct_from(computed.c.remaining_hours),
+            models.Package.status.is_distinct_from(computed.c.status),
+            models.Package.is_paid.is_distinct_from(computed.c.is_paid),
+            models.Package.payment_date.is_distinct_from(computed.c.payment_date),
+        )
+    ).values(
+        remaining_hours=computed.c.remaining_hours,
+        status=computed.c.status,
+        is_paid=computed.c.is_paid,
+        payment_date=computed.c.payment_date,
+    ).execution_options(synchronize_session=False)
+
+    result = db.execute(stmt)
+    expire_loaded_packages(db)
+
     if commit:
         db.commit()
-        db.refresh(package)
-    
-    return package
+
+    return result.rowcount
+
+def adjust_package_hours(db: Session, package_id: Optional[int], delta: Decimal):
+    """
+    Incrementa (o decrementa, con delta negativo) in modo atomico le ore usate di un pacchetto
+    e aggiorna di conseguenza le ore rimanenti, nella transazione del chiamante.
+    """
+    if not package_id or not delta:
+        return
+
+    delta = Decimal(str(delta))
+
+    # Le modifiche in sospeso vanno scritte prima di invalidare i pacchetti caricati
+    db.flush()
+    db.execute(
+        update(models.Package).where(
+            models.Package.id == package_id
+        ).values(
+            hours_used=models.Package.hours_used + delta,
+            remaining_hours=func.greatest(
+                literal(Decimal("0")),
+                models.Package.total_hours - (models.Package.hours_used + delta)
+            )
+        ).execution_options(synchronize_session=False)
+    )
+    expire_loaded_packages(db)
+
+def expire_loaded_packages(db: Session):
+    """Invalida i pacchetti già caricati nella sessione così da rileggere i valori aggiornati."""
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, models.Package):
+            db.expire(obj)
+
+def update_package_status(db: Session, package_id: int, commit: bool = True):
+    """
+    Update package status based on expiry date, payment status and remaining hours.
+    Also recalculates remaining hours.
+    """
+    refresh_packages_status(db, [package_id], commit=commit)
+    return db.query(models.Package).filter(models.Package.id == package_id).first()
 
 # Aggiungi questa funzione helper
 def package_orm_to_response(package_orm):
@@ -118,6 +187,12 @@ def package_orm_to_response(package_orm):
     
     return models.PackageResponse(**package_dict)
 
+def package_student_ids(db: Session, package_id: int) -> List[int]:
+    """Id degli studenti di un pacchetto, senza caricare gli studenti (per i payload del log)."""
+    return db.execute(
+        select(models.PackageStudent.student_id).where(models.PackageStudent.package_id == package_id)
+    ).scalars().all()
+
 # In backend/app/routes/packages.py
 # Update the create_package function to check for existing future packages
 @router.post("/", response_model=models.PackageResponse)
@@ -227,43 +302,33 @@ def create_package(
             student_id=student_id
         )
         db.add(db_package_student)
-    
-    db.commit()
-    db.refresh(db_package)
-
-    # Log dell'attività
-    student_names = []
-    for student_id in package.student_ids:
-        student = db.query(models.Student).filter(models.Student.id == student_id).first()
-        if student:
-            student_names.append(f"{student.first_name} {student.last_name}")
 
-    students_str = ", ".join(student_names) if student_names else "nessuno studente"
+    # Log dell'attività (nella stessa transazione)
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="create",
         entity_type="package",
         entity_id=db_package.id,
-        description=f"Creato pacchetto di {total_hours} ore per {students_str}"
+        payload=activity_payload(
+            "package_created",
+            student_ids=package.student_ids,
+            package_ids=[db_package.id],
+            hours=total_hours
+        )
     )
+    db.commit()
+    db.refresh(db_package)
     
     return package_orm_to_response(db_package)
 
 @router.get("/", response_model=List[models.PackageResponse])
-def read_packages(skip: int = 0, limit: int = 10000, db: Session = Depends(get_db)):
-    # Fetch all packages
-    packages = db.query(models.Package).offset(skip).limit(limit).all()
-    
-    # Update status for each package
-    for pkg in packages:
-        # Update package status
-        update_package_status(db, pkg.id, commit=False)
-    
-    db.commit()
-    
-    # Now re-fetch packages to ensure we have the latest data
-    packages = db.query(models.Package).offset(skip).limit(limit).all()
+@async_db_route
+def read_packages(skip: int = 0, limit: int = 10000, db: Session = Depends(get_read_db)):
+    # Lo stato salvato è mantenuto dallo sweeper notturno: la lettura non scrive nulla
+    packages = db.query(models.Package).options(
+        selectinload(models.Package.students)
+    ).order_by(models.Package.id).offset(skip).limit(limit).all()
     
     # Convert packages to PackageResponse manually
     package_responses = [package_orm_to_response(pkg) for pkg in packages]
@@ -271,70 +336,45 @@ def read_packages(skip: int = 0, limit: int = 10000, db: Session = Depends(get_d
     return package_responses
 
 @router.get("/{package_id}", response_model=models.PackageResponse)
-def read_package(package_id: int, db: Session = Depends(get_db)):
+@async_db_route
+def read_package(package_id: int, db: Session = Depends(get_read_db)):
     """Get a specific package by ID with detailed information."""
     # Find the package
     db_package = db.query(models.Package).filter(models.Package.id == package_id).first()
     if db_package is None:
         raise HTTPException(status_code=404, detail="Package not found")
     
-    # Always update status when fetching a package
-    update_package_status(db, package_id, commit=True)
-    
-    # Re-fetch the package to get up-to-date data
-    db_package = db.query(models.Package).filter(models.Package.id == package_id).first()
-    
     # Use the custom function to convert ORM to response model
     return package_orm_to_response(db_package)
 
 @router.get("/student/{student_id}", response_model=List[models.PackageResponse])
-def read_student_packages(student_id: int, db: Session = Depends(get_db)):
+@async_db_route
+def read_student_packages(student_id: int, db: Session = Depends(get_read_db)):
     # Verifica che lo studente esista
     student = db.query(models.Student).filter(models.Student.id == student_id).first()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
     # Ottieni tutti i pacchetti dello studente tramite la tabella di giunzione
-    packages = db.query(models.Package).join(
-        models.PackageStudent
-    ).filter(
-        models.PackageStudent.student_id == student_id
-    ).all()
-    
-    # Aggiorna lo stato di ogni pacchetto
-    for pkg in packages:
-        update_package_status(db, pkg.id, commit=False)
-    
-    db.commit()
-    
-    # Ricarica i pacchetti con lo stato aggiornato
-    packages = db.query(models.Package).join(
+    packages = db.query(models.Package).options(
+        selectinload(models.Package.students)
+    ).join(
         models.PackageStudent
     ).filter(
         models.PackageStudent.student_id == student_id
     ).all()
     
-    return packages
+    return [package_orm_to_response(pkg) for pkg in packages]
 
 @router.get("/student/{student_id}/active", response_model=models.PackageResponse)
-def read_student_active_package(student_id: int, db: Session = Depends(get_db)):
+@async_db_route
+def read_student_active_package(student_id: int, db: Session = Depends(get_read_db)):
     # Verifica che lo studente esista
     student = db.query(models.Student).filter(models.Student.id == student_id).first()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
-    # Aggiorna tutti i pacchetti per questo studente
-    packages = db.query(models.Package).join(
-        models.PackageStudent
-    ).filter(
-        models.PackageStudent.student_id == student_id
-    ).all()
-    
-    for pkg in packages:
-        update_package_status(db, pkg.id, commit=False)
-    db.commit()
-    
-    # Ottieni il pacchetto attivo
+    # Ottieni il pacchetto attivo (stato mantenuto dallo sweeper, nessuna scrittura)
     active_package = db.query(models.Package).join(
         models.PackageStudent
     ).filter(
@@ -345,7 +385,19 @@ def read_student_active_package(student_id: int, db: Session = Depends(get_db)):
     if not active_package:
         raise HTTPException(status_code=404, detail="No active package found for this student")
     
-    return active_package
+    return package_orm_to_response(active_package)
+
+@router.post("/refresh-status", response_model=dict)
+def refresh_all_packages_status(
+    db: Session = Depends(get_db),
+    current_user: models.Professor = Depends(get_current_admin)
+):
+    """
+    Manutenzione: riallinea stato e ore rimanenti salvati di tutti i pacchetti.
+    Normalmente non serve: lo sweeper notturno aggiorna i pacchetti scaduti.
+    """
+    updated = refresh_packages_status(db)
+    return {"updated_packages": updated}
 
 # Modifica della funzione update_package in packages.py
 @router.put("/{package_id}", response_model=models.PackageResponse)
@@ -360,11 +412,8 @@ def update_package(
     if db_package is None:
         raise HTTPException(status_code=404, detail="Package not found")
     
-    # Calculate hours used in lessons
-    hours_used = db.query(func.sum(models.Lesson.duration)).filter(
-        models.Lesson.package_id == package_id,
-        models.Lesson.is_package == True
-    ).scalar() or Decimal('0')
+    # Hours used in lessons (maintained by lesson writes)
+    hours_used = db_package.hours_used
     
     # Create a copy of the update data
     update_data = package.dict(exclude_unset=True)
@@ -483,35 +532,22 @@ def update_package(
             )
             db.add(db_package_student)
     
-    # Save changes
-    db.commit()
-    
     # Update remaining hours and status
-    update_package_status(db, package_id)
+    update_package_status(db, package_id, commit=False)
     
     # Refresh package data
     db.refresh(db_package)
 
-    # Log dell'attività
-    student_names = []
-    for student in db_package.students:
-        student_names.append(f"{student.first_name} {student.last_name}")
-
-    students_str = ", ".join(student_names) if student_names else "nessuno studente"
-
-    # Descrizione base
-    description = f"Modificato pacchetto di {db_package.total_hours} ore per {students_str}"
+    # Log dell'attività (nella stessa transazione)
+    payment_change = {}
 
     # Aggiungi dettagli sul cambiamento dello stato di pagamento
     if "is_paid" in update_data and old_is_paid != db_package.is_paid:
-        if db_package.is_paid:
-            description += f" - impostato come pagato (€{db_package.package_cost})"
-        else:
-            description += " - impostato come non pagato"
+        payment_change = {"paid": db_package.is_paid, "cost": db_package.package_cost}
 
     # Se è stato cambiato solo il costo senza cambiare lo stato di pagamento
     elif "package_cost" in update_data and old_package_cost != db_package.package_cost and db_package.is_paid:
-        description += f" - aggiornato importo pagamento a €{db_package.package_cost}"
+        payment_change = {"new_price": db_package.package_cost}
 
     log_activity(
         db=db,
@@ -519,8 +555,15 @@ def update_package(
         action_type="update",
         entity_type="package",
         entity_id=package_id,
-        description=description
+        payload=activity_payload(
+            "package_updated",
+            student_ids=package_student_ids(db, package_id),
+            package_ids=[package_id],
+            hours=db_package.total_hours,
+            **payment_change
+        )
     )
+    db.commit()
 
     return package_orm_to_response(db_package)  # Use the helper function for consistent response format
 
@@ -565,26 +608,27 @@ def extend_package_expiry(
     
     # Aggiorna il pacchetto
     db_package.expiry_date = new_expiry
-    db_package.status = "in_progress"  # Rimetti il pacchetto in corso
     db_package.extension_count += 1  # Incrementa il contatore delle estensioni
     
-    db.commit()
-    db.refresh(db_package)
+    # Lo stato dipende dalla nuova scadenza: l'estensione può lasciarlo ancora scaduto
+    update_package_status(db, package_id, commit=False)
 
-    # Log dell'attività
-    student_names = []
-    for student in db_package.students:
-        student_names.append(f"{student.first_name} {student.last_name}")
-
-    students_str = ", ".join(student_names) if student_names else "nessuno studente"
+    # Log dell'attività (nella stessa transazione)
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="update",
         entity_type="package",
         entity_id=package_id,
-        description=f"Estesa scadenza del pacchetto per {students_str} a {new_expiry.strftime('%d/%m/%Y')}"
+        payload=activity_payload(
+            "package_extended",
+            student_ids=package_student_ids(db, package_id),
+            package_ids=[package_id],
+            expiry_date=new_expiry
+        )
     )
+    db.commit()
+    db.refresh(db_package)
 
     return db_package
 
@@ -658,31 +702,31 @@ def add_package_payment(
         package.is_paid = False
         package.payment_date = None
     
-    db.commit()
-    db.refresh(db_payment)
-    
-    # Ottieni i nomi degli studenti per il log più descrittivo
-    student_names = []
-    for student in package.students:
-        student_names.append(f"{student.first_name} {student.last_name}")
+    mark_finance_months_dirty(db, payment.payment_date)
     
-    students_str = ", ".join(student_names) if student_names else "nessuno studente"
+    # Il pagamento può completare un pacchetto scaduto ed esaurito
+    update_package_status(db, package_id, commit=False)
     
-    # Log dell'attività con i nomi degli studenti
+    # Log dell'attività con gli studenti del pacchetto
     # MODIFICA IMPORTANTE: Usa package_id come entity_id invece di payment_id
     # In questo modo il clic porterà alla pagina del pacchetto
-    description = f"Aggiunto pagamento di €{payment.amount} al pacchetto per {students_str}"
-    if package.package_cost == Decimal('0'):
-        description += " (pacchetto aperto)"
-    
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="create",
         entity_type="package_payment",
         entity_id=package_id,  # Usa package_id invece di db_payment.id
-        description=description
+        payload=activity_payload(
+            "package_payment_added",
+            student_ids=package_student_ids(db, package_id),
+            package_ids=[package_id],
+            amount=payment.amount,
+            payment_date=payment.payment_date,
+            open_package=package.package_cost == Decimal('0') or None
+        )
     )
+    db.commit()
+    db.refresh(db_payment)
     
     return db_payment
 
@@ -707,13 +751,6 @@ def delete_package_payment(
     # Ottieni il pacchetto associato
     package = db.query(models.Package).filter(models.Package.id == payment.package_id).first()
     
-    # Ottieni i nomi degli studenti prima di eliminare
-    student_names = []
-    for student in package.students:
-        student_names.append(f"{student.first_name} {student.last_name}")
-    
-    students_str = ", ".join(student_names) if student_names else "nessuno studente"
-    
     # Salva l'ID del pacchetto per il log
     package_id = payment.package_id
     
@@ -727,9 +764,12 @@ def delete_package_payment(
     
     # Elimina il pagamento
     db.delete(payment)
-    db.commit()
+    mark_finance_months_dirty(db, payment.payment_date)
     
-    # Log dell'attività con i nomi degli studenti
+    # Senza il pagamento un pacchetto completato può tornare scaduto
+    update_package_status(db, package_id, commit=False)
+    
+    # Log dell'attività con gli studenti del pacchetto (nella stessa transazione)
     # MODIFICA IMPORTANTE: Usa package_id come entity_id invece di payment_id
     log_activity(
         db=db,
@@ -737,15 +777,23 @@ def delete_package_payment(
         action_type="delete",
         entity_type="package_payment",
         entity_id=package_id,  # Usa package_id invece di payment_id
-        description=f"Eliminato pagamento di €{payment.amount} dal pacchetto per {students_str}"
+        payload=activity_payload(
+            "package_payment_deleted",
+            student_ids=package_student_ids(db, package_id),
+            package_ids=[package_id],
+            amount=payment.amount,
+            payment_date=payment.payment_date
+        )
     )
+    db.commit()
     
     return None
 
 @router.get("/{package_id}/payments", response_model=List[models.PackagePaymentResponse])
+@async_db_route
 def get_package_payments(
     package_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Ottiene tutti i pagamenti di un pacchetto."""
     package = db.query(models.Package).filter(models.Package.id == package_id).first()
@@ -789,36 +837,24 @@ def cancel_package_extension(
         db_package.expiry_date = base_expiry_date
     
     # Update package status based on the new expiry date
-    today = date.today()
-    if today < db_package.expiry_date:
-        db_package.status = "in_progress"
-    else:
-        # Usa la stessa logica che abbiamo definito in update_package_status
-        if db_package.remaining_hours > Decimal('0'):
-            db_package.status = "expired"
-        else:
-            if db_package.is_paid:
-                db_package.status = "completed"
-            else:
-                db_package.status = "expired"
-    
-    db.commit()
-    db.refresh(db_package)
-
-    # Log dell'attività
-    student_names = []
-    for student in db_package.students:
-        student_names.append(f"{student.first_name} {student.last_name}")
+    update_package_status(db, package_id, commit=False)
 
-    students_str = ", ".join(student_names) if student_names else "nessuno studente"
+    # Log dell'attività (nella stessa transazione)
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="update",
         entity_type="package",
         entity_id=package_id,
-        description=f"Annullata estensione del pacchetto per {students_str}, nuova scadenza: {db_package.expiry_date.strftime('%d/%m/%Y')}"
+        payload=activity_payload(
+            "package_extension_cancelled",
+            student_ids=package_student_ids(db, package_id),
+            package_ids=[package_id],
+            expiry_date=db_package.expiry_date
+        )
     )
+    db.commit()
+    db.refresh(db_package)
 
     return db_package
 
@@ -850,29 +886,36 @@ def delete_package(
         for lesson in related_lessons
     ]
     
+    # I mesi delle lezioni e dei pagamenti eliminati vanno ricalcolati
+    mark_finance_months_dirty(db, *[lesson.lesson_date for lesson in related_lessons])
+    mark_finance_months_dirty_from(
+        db,
+        select(models.PackagePayment.payment_date).where(models.PackagePayment.package_id == package_id)
+    )
+    
     # Delete associated lessons
     for lesson in related_lessons:
         db.delete(lesson)
     
-    # Delete the package
-    db.delete(db_package)
-    db.commit()
-
-    # Log dell'attività
-    student_names = []
-    for student in db_package.students:
-        student_names.append(f"{student.first_name} {student.last_name}")
-
-    students_str = ", ".join(student_names) if student_names else "nessuno studente"
+    # Log dell'attività (nella stessa transazione, prima che le righe package_students vengano eliminate)
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="delete",
         entity_type="package",
         entity_id=package_id,
-        description=f"Eliminato pacchetto di {db_package.total_hours} ore per {students_str}"
+        payload=activity_payload(
+            "package_deleted",
+            student_ids=package_student_ids(db, package_id),
+            package_ids=[package_id],
+            hours=db_package.total_hours
+        )
     )
     
+    # Delete the package
+    db.delete(db_package)
+    db.commit()
+    
     # Return information about what was deleted
     return {
         "package_id": package_id,
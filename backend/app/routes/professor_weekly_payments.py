@@ -2,7 +2,7 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, cast, Date, and_
 from typing import List, Dict, Any
 from datetime import date, timedelta, datetime
 
@@ -10,6 +10,7 @@ from .. import models
 from ..database import get_db
 from ..auth import get_current_admin
 from app.routes.activity import log_activity
+from ..activity_descriptions import activity_payload
 
 from pydantic import BaseModel
 from typing import Optional
@@ -61,6 +62,70 @@ def get_professor_weekly_payment(
     
     return payment
 
+@router.get("/payroll", response_model=List[models.ProfessorWeeklyPayrollResponse])
+def get_weekly_payroll(
+    start_week: date,
+    end_week: Optional[date] = None,
+    db: Session = Depends(get_db),
+    current_user: models.Professor = Depends(get_current_admin)
+):
+    """
+    Restituisce per ogni professore e per ogni settimana dell'intervallo il numero di lezioni,
+    le ore, i compensi (somma di total_payment) e lo stato di pagamento settimanale.
+    Calcolato con un'unica query raggruppata per settimana.
+    """
+    first_monday = get_monday_of_week(start_week)
+    last_monday = get_monday_of_week(end_week or start_week)
+    if last_monday < first_monday:
+        raise HTTPException(status_code=400, detail="La settimana finale precede quella iniziale")
+    
+    week_start = cast(func.date_trunc('week', models.Lesson.lesson_date), Date)
+    
+    weekly_lessons = db.query(
+        models.Lesson.professor_id.label("professor_id"),
+        week_start.label("week_start_date"),
+        func.count(models.Lesson.id).label("lesson_count"),
+        func.sum(models.Lesson.duration).label("total_hours"),
+        func.sum(models.Lesson.total_payment).label("total_earnings")
+    ).filter(
+        models.Lesson.lesson_date >= first_monday,
+        models.Lesson.lesson_date < last_monday + timedelta(days=7)
+    ).group_by(
+        models.Lesson.professor_id, week_start
+    ).subquery()
+    
+    rows = db.query(
+        weekly_lessons,
+        models.Professor.first_name,
+        models.Professor.last_name,
+        models.ProfessorWeeklyPayment.is_paid,
+        models.ProfessorWeeklyPayment.marked_at
+    ).join(
+        models.Professor, models.Professor.id == weekly_lessons.c.professor_id
+    ).outerjoin(
+        models.ProfessorWeeklyPayment,
+        and_(
+            models.ProfessorWeeklyPayment.professor_id == weekly_lessons.c.professor_id,
+            models.ProfessorWeeklyPayment.week_start_date == weekly_lessons.c.week_start_date
+        )
+    ).order_by(
+        weekly_lessons.c.week_start_date, models.Professor.last_name, models.Professor.first_name
+    ).all()
+    
+    return [
+        {
+            "professor_id": row.professor_id,
+            "professor_name": f"{row.first_name} {row.last_name}",
+            "week_start_date": row.week_start_date,
+            "lesson_count": row.lesson_count,
+            "total_hours": row.total_hours,
+            "total_earnings": row.total_earnings,
+            "is_paid": bool(row.is_paid),
+            "marked_at": row.marked_at
+        }
+        for row in rows
+    ]
+
 @router.get("/week/{week_start_date}", response_model=Dict[int, models.ProfessorWeeklyPaymentResponse])
 def get_weekly_payments_status(
     week_start_date: date,
@@ -129,23 +194,23 @@ def toggle_professor_payment_status(
                 # Se stiamo togliendo il pagamento, rimuovi la data
                 existing_payment.marked_at = None
             
-            db.commit()
-            db.refresh(existing_payment)
-            
-            # Log dell'attività
-            status_text = "pagato" if existing_payment.is_paid else "non pagato"
-            date_info = ""
-            if existing_payment.is_paid and existing_payment.marked_at:
-                date_info = f" in data {existing_payment.marked_at.strftime('%d/%m/%Y')}"
-            
+            # Log dell'attività (nella stessa transazione)
             log_activity(
                 db=db,
                 professor_id=current_user.id,
                 action_type="update",
                 entity_type="professor_weekly_payment",
                 entity_id=existing_payment.id,
-                description=f"Marcato {professor.first_name} {professor.last_name} come {status_text}{date_info} per la settimana del {monday.strftime('%d/%m/%Y')}"
+                payload=activity_payload(
+                    "professor_weekly_payment",
+                    professor_ids=[request.professor_id],
+                    paid=existing_payment.is_paid,
+                    marked_at=existing_payment.marked_at,
+                    week_start_date=monday
+                )
             )
+            db.commit()
+            db.refresh(existing_payment)
             
             return existing_payment
         else:
@@ -159,22 +224,25 @@ def toggle_professor_payment_status(
             )
             
             db.add(new_payment)
-            db.commit()
-            db.refresh(new_payment)
-            
-            # Log dell'attività
-            date_info = ""
-            if new_payment.marked_at:
-                date_info = f" in data {new_payment.marked_at.strftime('%d/%m/%Y')}"
+            db.flush()
             
+            # Log dell'attività (nella stessa transazione)
             log_activity(
                 db=db,
                 professor_id=current_user.id,
                 action_type="create",
                 entity_type="professor_weekly_payment",
                 entity_id=new_payment.id,
-                description=f"Marcato {professor.first_name} {professor.last_name} come pagato{date_info} per la settimana del {monday.strftime('%d/%m/%Y')}"
+                payload=activity_payload(
+                    "professor_weekly_payment",
+                    professor_ids=[request.professor_id],
+                    paid=True,
+                    marked_at=new_payment.marked_at,
+                    week_start_date=monday
+                )
             )
+            db.commit()
+            db.refresh(new_payment)
             
             return new_payment
             
@@ -206,14 +274,17 @@ def delete_weekly_payment_record(
         raise HTTPException(status_code=404, detail="Record di pagamento non trovato")
     
     # Log dell'attività prima di eliminare
-    professor = db.query(models.Professor).filter(models.Professor.id == payment.professor_id).first()
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="delete",
         entity_type="professor_weekly_payment",
         entity_id=payment_id,
-        description=f"Eliminato record pagamento settimanale per {professor.first_name if professor else 'Professore sconosciuto'} {professor.last_name if professor else ''} della settimana del {payment.week_start_date.strftime('%d/%m/%Y')}"
+        payload=activity_payload(
+            "professor_weekly_payment_deleted",
+            professor_ids=[payment.professor_id],
+            week_start_date=payment.week_start_date
+        )
     )
     
     db.delete(payment)
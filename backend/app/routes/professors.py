@@ -5,10 +5,12 @@ from typing import List
 
 from .. import models
 from ..database import get_db
+from ..finance_rollups import mark_finance_months_dirty_from
 from ..utils import get_password_hash
-from ..auth import get_current_professor, get_current_admin
+from ..auth import get_current_professor, get_current_admin, invalidate_principal
 
 from app.routes.activity import log_activity  # Importato per registrare le attività
+from ..activity_descriptions import activity_payload
 
 router = APIRouter(
     prefix="/professors",
@@ -38,19 +40,19 @@ def create_professor(professor: models.ProfessorCreate, db: Session = Depends(ge
     
     # Salva nel database
     db.add(db_professor)
-    db.commit()
-    db.refresh(db_professor)
+    db.flush()
 
-    # Log dell'attività
+    # Log dell'attività (nella stessa transazione)
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="create",
         entity_type="professor",
         entity_id=db_professor.id,
-        description=f"Creato professore {db_professor.first_name} {db_professor.last_name}" + 
-                    (f" (admin)" if db_professor.is_admin else "")
+        payload=activity_payload("professor_created", professor_ids=[db_professor.id], is_admin=db_professor.is_admin)
     )
+    db.commit()
+    db.refresh(db_professor)
     return db_professor
 
 @router.get("/", response_model=List[models.ProfessorResponse])
@@ -90,6 +92,9 @@ def update_professor(
             detail="Non hai il permesso di modificare questo professore"
         )
     
+    # Username attuale, per invalidare la cache dei professori autenticati
+    old_username = db_professor.username
+    
     # Solo gli admin possono modificare lo stato di admin o le note
     update_data = professor.dict(exclude_unset=True)
     
@@ -113,26 +118,24 @@ def update_professor(
     for key, value in update_data.items():
         setattr(db_professor, key, value)
     
-    db.commit()
-    db.refresh(db_professor)
-
-    # Log dell'attività
-    description = f"Aggiornato professore {db_professor.first_name} {db_professor.last_name}"
-    if "password" in update_data:
-        description += " (modificata password)"
-    if "is_admin" in update_data:
-        description += f" (status admin: {update_data['is_admin']})"
-    if "notes" in update_data:
-        description += " (modificate note)"
-
+    # Log dell'attività (nella stessa transazione)
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="update",
         entity_type="professor",
         entity_id=professor_id,
-        description=description
+        payload=activity_payload(
+            "professor_updated",
+            professor_ids=[professor_id],
+            password_changed="password" in update_data or None,
+            is_admin=update_data.get("is_admin"),
+            notes_changed="notes" in update_data or None
+        )
     )
+    db.commit()
+    invalidate_principal(old_username, db_professor.username)
+    db.refresh(db_professor)
     return db_professor
 
 @router.delete("/{professor_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -158,17 +161,28 @@ def delete_professor(professor_id: int, db: Session = Depends(get_db), current_u
             detail="Non puoi eliminare il tuo account"
         )
     
+    # Le lezioni del professore vengono eliminate in cascata: ricalcola i loro mesi
+    mark_finance_months_dirty_from(
+        db,
+        db.query(models.Lesson.lesson_date).filter(models.Lesson.professor_id == professor_id)
+    )
+    
     db.delete(db_professor)
-    db.commit()
 
-    # Log dell'attività
+    # Log dell'attività (nella stessa transazione)
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="delete",
         entity_type="professor",
         entity_id=professor_id,
-        description=f"Eliminato professore {db_professor.first_name} {db_professor.last_name}" + 
-                    (f" (admin)" if db_professor.is_admin else "")
+        payload=activity_payload(
+            "professor_deleted",
+            professor_ids=[professor_id],
+            professor_name=f"{db_professor.first_name} {db_professor.last_name}",
+            is_admin=db_professor.is_admin
+        )
     )
+    db.commit()
+    invalidate_principal(db_professor.username)
     return None
\ No newline at end of file
@@ -0,0 +1,63 @@
+# routes/stats.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import date
+
+from .. import statistics
+from ..database import get_read_db, async_db_route
+
+router = APIRouter(
+    prefix="/stats",
+    tags=["statistics"],
+    responses={404: {"description": "Not found"}},
+)
+
+def _check_range(start_date: Optional[date], end_date: Optional[date]):
+    if start_date and end_date and end_date < start_date:
+        raise HTTPException(status_code=400, detail="La data finale precede quella iniziale")
+
+@router.get("/finance")
+@async_db_route
+def get_finance_stats(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    bucket: Optional[str] = Query(None, description="Raggruppamento opzionale: month o week"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Entrate (pagamenti pacchetti e prezzo delle lezioni singole), uscite (compensi professori)
+    e netto nel periodo. Con bucket restituisce anche la serie per mese o settimana.
+    """
+    _check_range(start_date, end_date)
+    if bucket and bucket not in statistics.BUCKETS:
+        raise HTTPException(status_code=400, detail="bucket deve essere 'month' o 'week'")
+    
+    result = statistics.finance_summary(db, start_date, end_date)
+    result.update({"start_date": start_date, "end_date": end_date})
+    
+    if bucket:
+        result["bucket"] = bucket
+        result["series"] = statistics.finance_trend(db, bucket, start_date, end_date)
+    
+    return result
+
+@router.get("/students")
+@async_db_route
+def get_student_stats(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: Session = Depends(get_read_db)
+):
+    _check_range(start_date, end_date)
+    return statistics.student_activity(db, start_date, end_date)
+
+@router.get("/professors")
+@async_db_route
+def get_professor_stats(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: Session = Depends(get_read_db)
+):
+    _check_range(start_date, end_date)
+    return statistics.professor_activity(db, start_date, end_date)
@@ -1,14 +1,24 @@
 # routes/students.py
-from fastapi import APIRouter, Depends, HTTPException, status
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from pydantic import BaseModel
 
-from ..auth import get_current_professor  # Per ottenere l'utente corrente
+from ..auth import get_current_professor, get_current_admin  # Per ottenere l'utente corrente
 from app.routes.activity import log_activity  # Per registrare le attività
+from ..activity_descriptions import activity_payload
 
 from .. import models
 from ..database import get_db
+from ..finance_rollups import mark_finance_months_dirty_from
+from ..search import search_names, normalize
+from ..student_duplicates import find_duplicate_candidates, merge_students
+
+# Similarità minima perché un nome sia segnalato come quasi omonimo
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("SEARCH_NEAR_DUPLICATE_THRESHOLD", "0.5"))
+# Quasi omonimi restituiti dal controllo
+MAX_NEAR_DUPLICATES = 5
 
 router = APIRouter(
     prefix="/students",
@@ -16,30 +26,96 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-class HomonymCheckResponse(BaseModel):
-    has_homonyms: bool
-    message: Optional[str] = None
+def _find_homonyms(db: Session, first_name: str, last_name: str) -> List[models.Student]:
+    """Studenti con lo stesso nome e cognome, senza distinzione di maiuscole e accenti."""
+    return db.query(models.Student).filter(
+        models.Student.search_name == normalize(f"{first_name} {last_name}")
+    ).all()
+
+def _search_results(db: Session, matches) -> List[dict]:
+    """Studenti trovati da search_names, nello stesso ordine e con il punteggio."""
+    if not matches:
+        return []
+    students = {
+        student.id: student
+        for student in db.query(models.Student).filter(models.Student.id.in_([student_id for student_id, _ in matches]))
+    }
+    return [
+        {
+            "id": student_id,
+            "first_name": students[student_id].first_name,
+            "last_name": students[student_id].last_name,
+            "birth_date": students[student_id].birth_date,
+            "score": score,
+        }
+        for student_id, score in matches if student_id in students
+    ]
+
+@router.get("/search", response_model=List[models.StudentSearchResult])
+def search_students(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """
+    Autocompletamento studenti: i primi risultati per pertinenza, ignorando maiuscole e accenti
+    e in qualsiasi ordine di nome e cognome. Usa l'indice trigram su search_name.
+    """
+    return _search_results(db, search_names(db, models.Student, q, limit))
 
-@router.get("/check-homonyms/", response_model=HomonymCheckResponse)
+@router.get("/check-homonyms/", response_model=models.HomonymCheckResponse)
 def check_student_homonyms(first_name: str, last_name: str, db: Session = Depends(get_db)):
-    """Verifica se esistono studenti omonimi con lo stesso nome e cognome."""
-    existing_students = db.query(models.Student).filter(
-        models.Student.first_name == first_name,
-        models.Student.last_name == last_name
-    ).all()
-    
-    has_homonyms = len(existing_students) > 0
+    """
+    Verifica se esistono studenti omonimi (stesso nome e cognome, senza distinzione di
+    maiuscole e accenti) e segnala i nomi quasi uguali, ad esempio con un refuso.
+    """
+    homonym_ids = {student.id for student in _find_homonyms(db, first_name, last_name)}
+    has_homonyms = len(homonym_ids) > 0
     message = "Esistono studenti con lo stesso nome e cognome" if has_homonyms else None
     
-    return {"has_homonyms": has_homonyms, "message": message}
+    matches = search_names(db, models.Student, f"{first_name} {last_name}", MAX_NEAR_DUPLICATES + len(homonym_ids))
+    near_duplicates = [
+        (student_id, score) for student_id, score in matches
+        if student_id not in homonym_ids and score >= NEAR_DUPLICATE_THRESHOLD
+    ][:MAX_NEAR_DUPLICATES]
+    
+    return {
+        "has_homonyms": has_homonyms,
+        "message": message,
+        "near_duplicates": _search_results(db, near_duplicates),
+    }
+
+@router.get("/duplicates", response_model=List[models.StudentDuplicatePair])
+def read_duplicate_students(
+    threshold: Optional[float] = Query(None, ge=0, le=1),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: models.Professor = Depends(get_current_admin)
+):
+    """
+    Coppie di studenti probabilmente duplicati (stesso cognome o nome e cognome invertiti,
+    nome completo simile), dalla più simile, con il numero di lezioni e pacchetti di ciascuno.
+    """
+    return find_duplicate_candidates(db, threshold=threshold, limit=limit)
+
+@router.post("/merge", response_model=models.StudentMergeResponse)
+def merge_duplicate_students(
+    merge: models.StudentMergeRequest,
+    db: Session = Depends(get_db),
+    current_user: models.Professor = Depends(get_current_admin)
+):
+    """Unisce i duplicati merge_ids nello studente keep_id spostando lezioni e pacchetti."""
+    try:
+        return merge_students(db, merge.keep_id, merge.merge_ids, current_user.id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/", response_model=models.StudentResponse, status_code=status.HTTP_201_CREATED)
 def create_student(student: models.StudentCreate, db: Session = Depends(get_db), current_user: models.Professor = Depends(get_current_professor)):
     # Cerca studenti con lo stesso nome e cognome
-    existing_students = db.query(models.Student).filter(
-        models.Student.first_name == student.first_name,
-        models.Student.last_name == student.last_name
-    ).all()
+    existing_students = _find_homonyms(db, student.first_name, student.last_name)
     
     # Se ci sono omonimi e la data di nascita non è fornita, solleva un'eccezione
     if existing_students and student.birth_date is None:
@@ -68,18 +144,19 @@ def create_student(student: models.StudentCreate, db: Session = Depends(get_db),
     
     # Salva nel database
     db.add(db_student)
-    db.commit()
-    db.refresh(db_student)
+    db.flush()
 
-    # Log dell'attività
+    # Log dell'attività (nella stessa transazione)
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="create",
         entity_type="student",
         entity_id=db_student.id,
-        description=f"Creato studente {db_student.first_name} {db_student.last_name}"
+        payload=activity_payload("student_created", student_ids=[db_student.id])
     )
+    db.commit()
+    db.refresh(db_student)
     return db_student
 
 @router.get("/", response_model=List[models.StudentResponse])
@@ -108,11 +185,9 @@ def update_student(student_id: int, student: models.StudentUpdate, db: Session =
         last_name = student.last_name or db_student.last_name
         
         # Cerca studenti con lo stesso nome e cognome (escludendo lo studente corrente)
-        existing_students = db.query(models.Student).filter(
-            models.Student.first_name == first_name,
-            models.Student.last_name == last_name,
-            models.Student.id != student_id
-        ).all()
+        existing_students = [
+            existing for existing in _find_homonyms(db, first_name, last_name) if existing.id != student_id
+        ]
         
         # Se ci sono omonimi e non è fornita una data di nascita
         if existing_students and student.birth_date is None and db_student.birth_date is None:
@@ -126,18 +201,17 @@ def update_student(student_id: int, student: models.StudentUpdate, db: Session =
     for key, value in update_data.items():
         setattr(db_student, key, value)
     
-    db.commit()
-    db.refresh(db_student)
-
-    # Log dell'attività
+    # Log dell'attività (nella stessa transazione)
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="update",
         entity_type="student",
         entity_id=student_id,
-        description=f"Aggiornato studente {db_student.first_name} {db_student.last_name}"
+        payload=activity_payload("student_updated", student_ids=[student_id])
     )
+    db.commit()
+    db.refresh(db_student)
     return db_student
 
 @router.delete("/{student_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -149,16 +223,22 @@ def delete_student(student_id: int, db: Session = Depends(get_db), current_user:
     # Prima di eliminare lo studente (per poter accedere ai dati)
     student_name = f"{db_student.first_name} {db_student.last_name}"
     
+    # Le lezioni dello studente vengono eliminate in cascata: ricalcola i loro mesi
+    mark_finance_months_dirty_from(
+        db,
+        db.query(models.Lesson.lesson_date).filter(models.Lesson.student_id == student_id)
+    )
+    
     db.delete(db_student)
-    db.commit()
 
-    # Dopo aver eliminato lo studente
+    # Log dell'attività (nella stessa transazione)
     log_activity(
         db=db,
         professor_id=current_user.id,
         action_type="delete",
         entity_type="student",
         entity_id=student_id,
-        description=f"Eliminato studente {student_name}"
+        payload=activity_payload("student_deleted", student_ids=[student_id], student_name=student_name)
     )
+    db.commit()
     return None
\ No newline at end of file
@@ -0,0 +1,121 @@
+# app/search.py
+"""
+Ricerca testuale su nomi (studenti, professori) e descrizioni del log attività.
+
+Due backend con la stessa interfaccia:
+- "postgres" (default): colonne generate search_name (minuscolo, senza accenti) con indici
+  GIN trigram (pg_trgm). Un nome corrisponde se contiene tutte le parole del termine, in
+  qualsiasi ordine ("rossi mar" trova "Mario Rossi"), oppure se è simile sopra la soglia;
+  prima le corrispondenze per parole, poi per similarity(). Descrizioni con indice trigram
+  per ILIKE e indice full-text (to_tsvector italiano) per le parole intere.
+- "memory": stesso ordinamento calcolato in Python sui trigrammi (stessa definizione
+  di pg_trgm). Non richiede estensioni, pensato per test e database diversi da PostgreSQL.
+
+Il backend si sceglie con SEARCH_BACKEND; se il database non è PostgreSQL si usa "memory".
+"""
+import os
+import re
+from typing import List, Tuple, Iterable, Optional, Set
+
+from sqlalchemy import or_, and_, case, func, literal_column, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "postgres").lower()
+# Soglia di similarità per le corrispondenze approssimate (come pg_trgm.similarity_threshold)
+SIMILARITY_THRESHOLD = float(os.environ.get("SEARCH_SIMILARITY_THRESHOLD", "0.3"))
+# Configurazione full-text delle descrizioni, deve coincidere con l'indice ix_activity_logs_description_fts
+TEXT_SEARCH_CONFIG = "italian"
+
+_ACCENTS = str.maketrans(models.SEARCH_ACCENTS_FROM, models.SEARCH_ACCENTS_TO)
+
+def normalize(value: Optional[str]) -> str:
+    """Minuscolo, senza accenti e con spazi compattati, come la colonna generata search_name."""
+    return " ".join((value or "").lower().translate(_ACCENTS).split())
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def trigrams(value: str) -> Set[str]:
+    """Trigrammi di una stringa secondo pg_trgm: parole alfanumeriche con due spazi prima e uno dopo."""
+    result = set()
+    for word in re.findall(r"\w+", normalize(value)):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+def similarity(a: str, b: str) -> float:
+    """Equivalente di similarity() di pg_trgm."""
+    ta, tb = trigrams(a), trigrams(b)
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+def rank_in_memory(entries: Iterable[Tuple[int, str]], term: str, limit: int) -> List[Tuple[int, float]]:
+    """
+    Ordina le voci (id, testo) per pertinenza rispetto al termine: prima quelle che contengono
+    tutte le parole del termine, poi quelle approssimate sopra la soglia, entrambe per similarità.
+    """
+    term = normalize(term)
+    words = term.split()
+    ranked = []
+    for entity_id, value in entries:
+        text = normalize(value)
+        score = similarity(text, term)
+        contains = all(word in text for word in words)
+        if contains or score >= SIMILARITY_THRESHOLD:
+            ranked.append((not contains, -score, entity_id, score))
+    ranked.sort()
+    return [(entity_id, score) for _, _, entity_id, score in ranked[:limit]]
+
+class PostgresSearch:
+    name = "postgres"
+
+    def search_names(self, db: Session, model, term: str, limit: int) -> List[Tuple[int, float]]:
+        term = normalize(term)
+        # L'operatore % usa pg_trgm.similarity_threshold: allineato a SIMILARITY_THRESHOLD per la
+        # transazione corrente, così entrambi i backend applicano la stessa soglia
+        db.execute(select(func.set_config("pg_trgm.similarity_threshold", str(SIMILARITY_THRESHOLD), True)))
+        score = func.similarity(model.search_name, term)
+        # Ogni parola è una condizione ILIKE servita dall'indice trigram
+        contains = and_(*(model.search_name.ilike(f"%{escape_like(word)}%") for word in term.split()))
+        rows = db.query(model.id, score.label("score")).filter(
+            or_(contains, model.search_name.op("%")(term))
+        ).order_by(case((contains, 0), else_=1), score.desc(), model.id).limit(limit).all()
+        return [(row.id, float(row.score)) for row in rows]
+
+    def description_condition(self, term: str):
+        document = func.to_tsvector(literal_column(f"'{TEXT_SEARCH_CONFIG}'"), func.coalesce(models.ActivityLog.description, ""))
+        query = func.plainto_tsquery(literal_column(f"'{TEXT_SEARCH_CONFIG}'"), term)
+        return or_(
+            models.ActivityLog.description.ilike(f"%{escape_like(term)}%"),
+            document.op("@@")(query)
+        )
+
+class MemorySearch:
+    name = "memory"
+
+    def search_names(self, db: Session, model, term: str, limit: int) -> List[Tuple[int, float]]:
+        rows = db.query(model.id, model.first_name, model.last_name).all()
+        return rank_in_memory(((row.id, f"{row.first_name} {row.last_name}") for row in rows), term, limit)
+
+    def description_condition(self, term: str):
+        return models.ActivityLog.description.ilike(f"%{escape_like(term)}%")
+
+_BACKENDS = {"postgres": PostgresSearch(), "memory": MemorySearch()}
+
+def get_search_backend(db: Session):
+    if db.get_bind().dialect.name != "postgresql":
+        return _BACKENDS["memory"]
+    return _BACKENDS.get(SEARCH_BACKEND, _BACKENDS["postgres"])
+
+def search_names(db: Session, model, term: str, limit: int = 50) -> List[Tuple[int, float]]:
+    """Id di studenti o professori il cui nome corrisponde al termine, con punteggio, dal più pertinente."""
+    if not normalize(term):
+        return []
+    return get_search_backend(db).search_names(db, model, term, limit)
+
+def description_condition(db: Session, term: str):
+    """Condizione sulle descrizioni salvate del log attività (attività precedenti ai payload)."""
+    return get_search_backend(db).description_condition(term)
@@ -0,0 +1,187 @@
+# app/slow_queries.py
+"""
+Modalità diagnostica: log delle query lente con piano EXPLAIN campionato.
+
+Quando è attiva, ogni istruzione SQL più lenta della soglia viene scritta come riga JSON
+in un file a rotazione (SLOW_QUERY_LOG_PATH) con route di origine, durata e forma dei
+parametri (tipi, mai i valori). Per una frazione delle SELECT lente viene aggiunto il piano
+EXPLAIN (ANALYZE, BUFFERS), eseguito sulla stessa connessione dentro un savepoint:
+ANALYZE riesegue la query, per questo è campionato e limitato alle sole letture.
+
+Con la modalità attiva le risposte includono l'header Server-Timing con il tempo speso
+nel database. Le impostazioni si cambiano a runtime da /diagnostics/slow-queries e valgono
+per il processo che riceve la richiesta (con più worker uvicorn va ripetuta per ciascuno,
+oppure impostata all'avvio con le variabili d'ambiente).
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+from .request_metrics import current_request_stats
+
+SLOW_QUERY_LOG_ENABLED = os.environ.get("SLOW_QUERY_LOG_ENABLED", "false").lower() == "true"
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "200"))
+# Frazione delle SELECT lente di cui catturare il piano (0 = mai, 1 = sempre)
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.environ.get("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0.1"))
+SLOW_QUERY_LOG_PATH = os.environ.get("SLOW_QUERY_LOG_PATH", "logs/slow_queries.jsonl")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get("SLOW_QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get("SLOW_QUERY_LOG_BACKUPS", "5"))
+# Voci recenti restituite dall'endpoint di diagnostica
+RECENT_ENTRIES = 50
+EXPLAIN_SAVEPOINT = "slow_query_explain"
+
+def parameter_shape(parameters) -> Any:
+    """Forma dei parametri di una query: nomi/posizioni e tipi, senza i valori."""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+class SlowQueryLog:
+    def __init__(self):
+        self.enabled = SLOW_QUERY_LOG_ENABLED
+        self.threshold_ms = SLOW_QUERY_THRESHOLD_MS
+        self.explain_sample_rate = SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+        self.path = SLOW_QUERY_LOG_PATH
+        self.recent = deque(maxlen=RECENT_ENTRIES)
+        self.logged = 0
+        self.lock = threading.Lock()
+        self._logger: Optional[logging.Logger] = None
+
+    def settings(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "explain_sample_rate": self.explain_sample_rate,
+            "path": self.path,
+            "logged": self.logged,
+        }
+
+    def _get_logger(self) -> logging.Logger:
+        if self._logger is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handler = RotatingFileHandler(
+                self.path, maxBytes=SLOW_QUERY_LOG_MAX_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("slow_queries")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def write(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, default=str, ensure_ascii=False)
+        with self.lock:
+            self._get_logger().info(line)
+            self.recent.append(entry)
+            self.logged += 1
+
+    def should_explain(self, statement: str, executemany: bool) -> bool:
+        if executemany or self.explain_sample_rate <= 0:
+            return False
+        if not statement.lstrip().upper().startswith("SELECT"):
+            return False
+        return random.random() < self.explain_sample_rate
+
+slow_query_log = SlowQueryLog()
+
+def _explain(conn, statement: str, parameters) -> Optional[List[str]]:
+    """
+    EXPLAIN (ANALYZE, BUFFERS) della query sulla stessa connessione, in un savepoint
+    per non interrompere la transazione del chiamante se il piano fallisce.
+    """
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(f"SAVEPOINT {EXPLAIN_SAVEPOINT}")
+        try:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+            plan = [row[0] for row in cursor.fetchall()]
+            cursor.execute(f"RELEASE SAVEPOINT {EXPLAIN_SAVEPOINT}")
+            return plan
+        except Exception as e:
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {EXPLAIN_SAVEPOINT}")
+            return [f"EXPLAIN non riuscito: {e}"]
+    finally:
+        cursor.close()
+
+def instrument_slow_queries(engine):
+    """Registra sul motore (sync) gli hook del log delle query lente."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if slow_query_log.enabled:
+            conn.info.setdefault("slow_query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        pending = conn.info.get("slow_query_started_at")
+        if not pending:
+            return
+        elapsed_ms = (time.perf_counter() - pending.pop()) * 1000
+        if not slow_query_log.enabled or elapsed_ms < slow_query_log.threshold_ms:
+            return
+
+        stats = current_request_stats.get()
+        shape = parameter_shape(parameters[0] if executemany and parameters else parameters)
+        entry = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "route": stats.route if stats is not None else None,
+            "method": stats.scope.get("method") if stats is not None and stats.scope else None,
+            "duration_ms": round(elapsed_ms, 2),
+            "statement": statement,
+            "parameters": shape,
+            "executemany": len(parameters) if executemany else None,
+            "plan": None,
+        }
+        if slow_query_log.should_explain(statement, executemany):
+            entry["plan"] = _explain(conn, statement, parameters)
+        slow_query_log.write(entry)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("slow_query_started_at"):
+            connection.info["slow_query_started_at"].pop()
+
+class ServerTimingMiddleware:
+    """
+    Aggiunge l'header Server-Timing (tempo e numero di query SQL) quando il log delle query
+    lente è attivo. Va registrato dentro MetricsMiddleware, che raccoglie le statistiche.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not slow_query_log.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            stats = current_request_stats.get()
+            if message["type"] == "http.response.start" and stats is not None:
+                app_ms = (time.perf_counter() - started) * 1000
+                value = (
+                    f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                    f"app;dur={app_ms:.1f}"
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
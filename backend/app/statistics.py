@@ -0,0 +1,256 @@
+# app/statistics.py
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Optional, Dict, Any, List
+
+from sqlalchemy import select, func, case, literal, union_all, and_, or_, not_, Date, cast
+from sqlalchemy.orm import Session
+
+from . import models
+from .finance_rollups import sql_month
+
+BUCKETS = ("month", "week")
+
+def _date_range_filter(column, start_date: Optional[date], end_date: Optional[date]):
+    """Condizioni sul periodo (estremi inclusi) da passare a .where()."""
+    conditions = []
+    if start_date:
+        conditions.append(column >= start_date)
+    if end_date:
+        conditions.append(column <= end_date)
+    return conditions
+
+def rollup_window(start_date: Optional[date], end_date: Optional[date], today: Optional[date] = None):
+    """
+    Mesi chiusi interamente compresi nel periodo, leggibili dai finance_rollups.
+
+    Returns:
+        (primo mese incluso, primo mese escluso) oppure None se nessun mese è coperto
+    """
+    current_month = (today or date.today()).replace(day=1)
+
+    first = None
+    if start_date:
+        first = start_date if start_date.day == 1 else _next_month(start_date.replace(day=1))
+
+    last = current_month
+    if end_date:
+        next_day = end_date + timedelta(days=1)
+        end_month = next_day.replace(day=1) if next_day.day == 1 else end_date.replace(day=1)
+        last = min(last, end_month)
+
+    if first is not None and first >= last:
+        return None
+    return first, last
+
+def _next_month(month: date) -> date:
+    return (month + timedelta(days=32)).replace(day=1)
+
+def _dirty_months():
+    return select(models.FinanceDirtyMonth.month)
+
+def finance_ledger(start_date: Optional[date] = None, end_date: Optional[date] = None, window=None):
+    """
+    Movimenti economici nel periodo come una select (UNION ALL):
+    una riga per lezione (incasso singola, compenso professore, ore) e una per pagamento pacchetto.
+    Se window è indicato, esclude i mesi già coperti dai finance_rollups (quelli non in coda di ricalcolo).
+    """
+    zero = literal(Decimal("0"))
+    is_single = models.Lesson.is_package == False
+
+    def outside_window(column):
+        if window is None:
+            return []
+        first, last = window
+        covered = [column < last]
+        if first is not None:
+            covered.append(column >= first)
+        return [or_(not_(and_(*covered)), sql_month(column).in_(_dirty_months()))]
+
+    lessons = select(
+        models.Lesson.lesson_date.label("day"),
+        case((and_(is_single, models.Lesson.is_paid == True), models.Lesson.price), else_=zero).label("single_income"),
+        case((and_(is_single, models.Lesson.is_paid == False), models.Lesson.price), else_=zero).label("single_unpaid"),
+        zero.label("package_income"),
+        models.Lesson.total_payment.label("expenses"),
+        models.Lesson.duration.label("hours"),
+        literal(1).label("lesson_count"),
+    ).where(
+        *_date_range_filter(models.Lesson.lesson_date, start_date, end_date),
+        *outside_window(models.Lesson.lesson_date)
+    )
+
+    payments = select(
+        models.PackagePayment.payment_date.label("day"),
+        zero.label("single_income"),
+        zero.label("single_unpaid"),
+        models.PackagePayment.amount.label("package_income"),
+        zero.label("expenses"),
+        zero.label("hours"),
+        literal(0).label("lesson_count"),
+    ).where(
+        *_date_range_filter(models.PackagePayment.payment_date, start_date, end_date),
+        *outside_window(models.PackagePayment.payment_date)
+    )
+
+    return union_all(lessons, payments)
+
+def rollup_ledger(window):
+    """Righe dei finance_rollups per i mesi chiusi del periodo che non sono in coda di ricalcolo."""
+    first, last = window
+    conditions = [
+        models.FinanceRollup.month < last,
+        models.FinanceRollup.month.not_in(_dirty_months()),
+    ]
+    if first is not None:
+        conditions.append(models.FinanceRollup.month >= first)
+
+    return select(
+        models.FinanceRollup.month.label("day"),
+        models.FinanceRollup.student_revenue.label("single_income"),
+        models.FinanceRollup.student_unpaid.label("single_unpaid"),
+        models.FinanceRollup.package_payments.label("package_income"),
+        models.FinanceRollup.professor_cost.label("expenses"),
+        models.FinanceRollup.hours.label("hours"),
+        models.FinanceRollup.lesson_count.label("lesson_count"),
+    ).where(*conditions)
+
+def combined_ledger(start_date: Optional[date], end_date: Optional[date], use_rollups: bool = True):
+    """
+    Unisce i finance_rollups dei mesi chiusi e i movimenti calcolati al momento
+    per il mese corrente, i mesi parziali e quelli in coda di ricalcolo.
+    """
+    window = rollup_window(start_date, end_date) if use_rollups else None
+    if window is None:
+        return finance_ledger(start_date, end_date).subquery("ledger")
+    return union_all(
+        finance_ledger(start_date, end_date, window),
+        rollup_ledger(window)
+    ).subquery("ledger")
+
+def _finance_aggregates(ledger):
+    return [
+        func.coalesce(func.sum(ledger.c.single_income), 0).label("single_lessons_income"),
+        func.coalesce(func.sum(ledger.c.single_unpaid), 0).label("single_lessons_unpaid"),
+        func.coalesce(func.sum(ledger.c.package_income), 0).label("packages_income"),
+        func.coalesce(func.sum(ledger.c.expenses), 0).label("expenses"),
+        func.coalesce(func.sum(ledger.c.hours), 0).label("total_hours"),
+        func.coalesce(func.sum(ledger.c.lesson_count), 0).label("lesson_count"),
+    ]
+
+def _finance_row_to_dict(row) -> Dict[str, Any]:
+    total_income = Decimal(row.packages_income) + Decimal(row.single_lessons_income)
+    return {
+        "total_income": total_income,
+        "packages_income": Decimal(row.packages_income),
+        "single_lessons_income": Decimal(row.single_lessons_income),
+        "single_lessons_unpaid": Decimal(row.single_lessons_unpaid),
+        "expenses": Decimal(row.expenses),
+        "net_profit": total_income - Decimal(row.expenses),
+        "total_hours": Decimal(row.total_hours),
+        "lesson_count": int(row.lesson_count),
+    }
+
+def finance_summary(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict[str, Any]:
+    """Totali economici del periodo in un'unica query (rollup per i mesi chiusi, calcolo live per il resto)."""
+    ledger = combined_ledger(start_date, end_date)
+    row = db.execute(select(*_finance_aggregates(ledger))).one()
+    return _finance_row_to_dict(row)
+
+def finance_trend(db: Session, bucket: str, start_date: Optional[date] = None, end_date: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Totali economici raggruppati per mese o settimana, in un'unica query."""
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+
+    # I rollup sono mensili: le settimane sono sempre calcolate dai movimenti
+    ledger = combined_ledger(start_date, end_date, use_rollups=(bucket == "month"))
+    period = cast(func.date_trunc(bucket, ledger.c.day), Date).label("period")
+    rows = db.execute(
+        select(period, *_finance_aggregates(ledger)).group_by(period).order_by(period)
+    ).all()
+
+    return [{"period": row.period, **_finance_row_to_dict(row)} for row in rows]
+
+def student_activity(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None, top: int = 5) -> Dict[str, Any]:
+    """
+    Totale studenti, studenti attivi nel periodo e studenti più attivi in un'unica query:
+    i totali sono calcolati con funzioni finestra prima del LIMIT.
+    """
+    per_student = select(
+        models.Lesson.student_id,
+        func.count(models.Lesson.id).label("lesson_count"),
+        func.sum(models.Lesson.duration).label("total_hours"),
+    ).where(
+        *_date_range_filter(models.Lesson.lesson_date, start_date, end_date)
+    ).group_by(models.Lesson.student_id).subquery()
+
+    lesson_count = func.coalesce(per_student.c.lesson_count, 0)
+    rows = db.execute(
+        select(
+            models.Student.id,
+            models.Student.first_name,
+            models.Student.last_name,
+            lesson_count.label("lesson_count"),
+            func.coalesce(per_student.c.total_hours, 0).label("total_hours"),
+            func.count().over().label("total_students"),
+            func.count(per_student.c.student_id).over().label("active_students"),
+        ).outerjoin(
+            per_student, per_student.c.student_id == models.Student.id
+        ).order_by(lesson_count.desc(), models.Student.id).limit(top)
+    ).all()
+
+    return {
+        "total_students": rows[0].total_students if rows else 0,
+        "active_students": rows[0].active_students if rows else 0,
+        "top_students": [
+            {
+                "id": row.id,
+                "name": f"{row.first_name} {row.last_name}",
+                "lesson_count": row.lesson_count,
+                "total_hours": row.total_hours,
+            }
+            for row in rows if row.lesson_count > 0
+        ],
+    }
+
+def professor_activity(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None, top: int = 5) -> Dict[str, Any]:
+    """Totale professori, professori attivi nel periodo e professori più attivi in un'unica query."""
+    per_professor = select(
+        models.Lesson.professor_id,
+        func.count(models.Lesson.id).label("lesson_count"),
+        func.sum(models.Lesson.duration).label("total_hours"),
+        func.sum(models.Lesson.total_payment).label("total_earnings"),
+    ).where(
+        *_date_range_filter(models.Lesson.lesson_date, start_date, end_date)
+    ).group_by(models.Lesson.professor_id).subquery()
+
+    lesson_count = func.coalesce(per_professor.c.lesson_count, 0)
+    rows = db.execute(
+        select(
+            models.Professor.id,
+            models.Professor.first_name,
+            models.Professor.last_name,
+            lesson_count.label("lesson_count"),
+            func.coalesce(per_professor.c.total_hours, 0).label("total_hours"),
+            func.coalesce(per_professor.c.total_earnings, 0).label("total_earnings"),
+            func.count().over().label("total_professors"),
+            func.count(per_professor.c.professor_id).over().label("active_professors"),
+        ).outerjoin(
+            per_professor, per_professor.c.professor_id == models.Professor.id
+        ).order_by(lesson_count.desc(), models.Professor.id).limit(top)
+    ).all()
+
+    return {
+        "total_professors": rows[0].total_professors if rows else 0,
+        "active_professors": rows[0].active_professors if rows else 0,
+        "top_professors": [
+            {
+                "id": row.id,
+                "name": f"{row.first_name} {row.last_name}",
+                "lesson_count": row.lesson_count,
+                "total_hours": row.total_hours,
+                "total_earnings": row.total_earnings,
+            }
+            for row in rows if row.lesson_count > 0
+        ],
+    }
@@ -0,0 +1,188 @@
+# app/student_duplicates.py
+"""
+Ricerca e unione di studenti duplicati.
+
+I candidati si trovano con un self-join della tabella students a blocchi: si confrontano
+solo le coppie con lo stesso cognome normalizzato (minuscolo, senza accenti) oppure con
+nome e cognome invertiti ("Rossi Mario" / "Mario Rossi"). Entrambi sono join di uguaglianza
+(hash join), quindi il costo cresce con la dimensione dei blocchi e non con il quadrato
+della tabella. Le coppie del blocco sono poi filtrate per similarity() sul nome completo
+(search_name) e scartate se hanno date di nascita diverse (omonimi veri).
+
+L'unione sposta lezioni, serie di lezioni e pacchetti (package_students) degli studenti
+duplicati sullo studente da mantenere ed elimina i duplicati, in un'unica transazione.
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text, select, func
+from sqlalchemy.orm import Session
+
+from . import models
+from .activity_descriptions import activity_payload
+from .routes.activity import log_activity
+
+# Similarità minima del nome completo per proporre una coppia
+DUPLICATE_SIMILARITY_THRESHOLD = float(os.environ.get("DUPLICATE_SIMILARITY_THRESHOLD", "0.6"))
+
+CANDIDATES_SQL = """
+    WITH people AS (
+        SELECT id, search_name, birth_date,
+               translate(lower(btrim(last_name)), :accents_from, :accents_to) AS surname,
+               translate(lower(btrim(first_name)), :accents_from, :accents_to) AS given_name
+        FROM students
+    ),
+    pairs AS (
+        -- Blocco: stesso cognome normalizzato
+        SELECT a.id AS student_a, b.id AS student_b
+        FROM people a
+        JOIN people b ON b.surname = a.surname AND b.id > a.id
+        UNION
+        -- Nome e cognome invertiti
+        SELECT LEAST(a.id, b.id), GREATEST(a.id, b.id)
+        FROM people a
+        JOIN people b ON b.given_name = a.surname AND b.id <> a.id
+    )
+    SELECT p.student_a, p.student_b, similarity(a.search_name, b.search_name) AS score
+    FROM pairs p
+    JOIN people a ON a.id = p.student_a
+    JOIN people b ON b.id = p.student_b
+    WHERE similarity(a.search_name, b.search_name) >= :threshold
+      AND (a.birth_date IS NULL OR b.birth_date IS NULL OR a.birth_date = b.birth_date)
+    ORDER BY score DESC, p.student_a, p.student_b
+    LIMIT :limit
+"""
+
+def _student_summaries(db: Session, student_ids) -> Dict[int, Dict[str, Any]]:
+    """Dati anagrafici e numero di lezioni e pacchetti degli studenti indicati."""
+    lesson_count = select(func.count()).where(
+        models.Lesson.student_id == models.Student.id
+    ).correlate(models.Student).scalar_subquery()
+    package_count = select(func.count()).where(
+        models.PackageStudent.student_id == models.Student.id
+    ).correlate(models.Student).scalar_subquery()
+    rows = db.execute(
+        select(
+            models.Student.id,
+            models.Student.first_name,
+            models.Student.last_name,
+            models.Student.birth_date,
+            lesson_count.label("lesson_count"),
+            package_count.label("package_count"),
+        ).where(models.Student.id.in_(list(student_ids)))
+    )
+    return {row.id: dict(row._mapping) for row in rows}
+
+def find_duplicate_candidates(
+    db: Session,
+    threshold: Optional[float] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """
+    Coppie di studenti probabilmente duplicati, dalla più simile, con il numero di lezioni
+    e di pacchetti di ciascuno (utile per scegliere quale mantenere).
+    """
+    pairs = db.execute(text(CANDIDATES_SQL), {
+        "accents_from": models.SEARCH_ACCENTS_FROM,
+        "accents_to": models.SEARCH_ACCENTS_TO,
+        "threshold": DUPLICATE_SIMILARITY_THRESHOLD if threshold is None else threshold,
+        "limit": limit,
+    }).all()
+    if not pairs:
+        return []
+
+    students = _student_summaries(db, {pair.student_a for pair in pairs} | {pair.student_b for pair in pairs})
+    return [
+        {
+            "score": round(float(pair.score), 3),
+            "student_a": students[pair.student_a],
+            "student_b": students[pair.student_b],
+        }
+        for pair in pairs
+    ]
+
+def merge_students(db: Session, keep_id: int, merge_ids: List[int], professor_id: Optional[int]) -> Dict[str, Any]:
+    """
+    Unisce gli studenti merge_ids in keep_id in un'unica transazione: sposta lezioni, serie
+    e pacchetti, completa i dati anagrafici mancanti di keep_id ed elimina i duplicati.
+
+    Raises:
+        ValueError: se la richiesta non è valida
+        LookupError: se uno degli studenti non esiste
+    """
+    merge_ids = sorted(set(merge_ids))
+    if not merge_ids:
+        raise ValueError("Nessuno studente da unire")
+    if keep_id in merge_ids:
+        raise ValueError("Lo studente da mantenere non può essere tra quelli da unire")
+
+    try:
+        # Blocca gli studenti coinvolti fino al commit
+        students = {
+            student.id: student
+            for student in db.query(models.Student).filter(
+                models.Student.id.in_([keep_id] + merge_ids)
+            ).order_by(models.Student.id).with_for_update()
+        }
+        missing = [student_id for student_id in [keep_id] + merge_ids if student_id not in students]
+        if missing:
+            raise LookupError(f"Studenti non trovati: {', '.join(map(str, missing))}")
+
+        params = {"keep_id": keep_id, "merge_ids": merge_ids}
+        lessons_moved = db.execute(text(
+            "UPDATE lessons SET student_id = :keep_id WHERE student_id = ANY(:merge_ids)"
+        ), params).rowcount
+        db.execute(text(
+            "UPDATE lesson_series SET student_id = :keep_id WHERE student_id = ANY(:merge_ids)"
+        ), params)
+        # Un pacchetto condiviso tra duplicato e studente mantenuto resta una sola riga
+        package_ids = db.execute(text("""
+            DELETE FROM package_students WHERE student_id = ANY(:merge_ids)
+            RETURNING package_id
+        """), params).scalars().all()
+        package_ids = sorted(set(package_ids))
+        if package_ids:
+            db.execute(text("""
+                INSERT INTO package_students (package_id, student_id)
+                SELECT unnest(CAST(:package_ids AS integer[])), :keep_id
+                ON CONFLICT DO NOTHING
+            """), {"package_ids": package_ids, "keep_id": keep_id})
+
+        keep = students[keep_id]
+        merged = [students[student_id] for student_id in merge_ids]
+        for field in ("birth_date", "email", "phone"):
+            if getattr(keep, field) is None:
+                setattr(keep, field, next((getattr(s, field) for s in merged if getattr(s, field) is not None), None))
+        merged_names = [f"{s.first_name} {s.last_name}" for s in merged]
+
+        # Le righe collegate sono già state spostate: la cascata non elimina nulla
+        db.query(models.Student).filter(models.Student.id.in_(merge_ids)).delete(synchronize_session=False)
+        for student in merged:
+            db.expunge(student)
+
+        log_activity(
+            db=db,
+            professor_id=professor_id,
+            action_type="merge",
+            entity_type="student",
+            entity_id=keep_id,
+            payload=activity_payload(
+                "students_merged",
+                student_ids=[keep_id],
+                package_ids=package_ids,
+                merged_ids=merge_ids,
+                merged_names=merged_names,
+                lesson_count=lessons_moved,
+                package_count=len(package_ids)
+            )
+        )
+        db.commit()
+        return {
+            "student_id": keep_id,
+            "merged_ids": merge_ids,
+            "lessons_moved": lessons_moved,
+            "packages_moved": package_ids,
+        }
+    except Exception:
+        db.rollback()
+        raise
@@ -1,12 +1,16 @@
 # app/utils.py
+import os
 import bcrypt
 from datetime import date, time
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
+# Fattore di costo bcrypt per i nuovi hash; gli hash con un costo diverso vengono rigenerati al login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
 def get_password_hash(password: str) -> str:
     """Genera un hash della password."""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -14,22 +18,23 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica che una password corrisponda all'hash."""
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Indica se l'hash è stato generato con un costo diverso da BCRYPT_ROUNDS (formato $2b$<costo>$...)."""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
 def recalculate_package_hours(package_id: int, db: Session):
-    """Ricalcola le ore rimanenti di un pacchetto basandosi sulle lezioni esistenti."""
+    """Ricalcola le ore rimanenti di un pacchetto a partire dal contatore hours_used."""
     from . import models
     
     package = db.query(models.Package).filter(models.Package.id == package_id).first()
     if not package:
         return
     
-    # Calcola le ore totali usate nelle lezioni di questo pacchetto
-    total_used_hours = db.query(func.sum(models.Lesson.duration)).filter(
-        models.Lesson.package_id == package_id,
-        models.Lesson.is_package == True
-    ).scalar() or 0
-    
-    # Aggiorna le ore rimanenti
-    package.remaining_hours = package.total_hours - total_used_hours
+    # Aggiorna le ore rimanenti (hours_used è mantenuto dalle scritture delle lezioni)
+    package.remaining_hours = package.total_hours - package.hours_used
     
     # Aggiorna lo stato del pacchetto
     if package.remaining_hours <= 0:
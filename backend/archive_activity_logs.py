@@ -0,0 +1,70 @@
+# archive_activity_logs.py
+import sys
+import os
+import argparse
+from dotenv import load_dotenv
+
+# Aggiunge il path del progetto al PYTHONPATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+from app.database import SessionLocal
+from app.activity_archive import (
+    ensure_activity_partitions,
+    archive_old_partitions,
+    import_archive,
+    ACTIVITY_LOG_RETENTION_MONTHS,
+    ACTIVITY_LOG_ARCHIVE_DIR,
+)
+
+def run(args):
+    db = SessionLocal()
+    try:
+        if args.command == "partitions":
+            created = ensure_activity_partitions(db, months_ahead=args.months_ahead)
+            print("Partizioni create: " + (", ".join(created) if created else "nessuna"))
+
+        elif args.command == "archive":
+            report = archive_old_partitions(
+                db,
+                retention_months=args.retention_months,
+                archive_dir=args.dir,
+                dry_run=args.dry_run
+            )
+            if not report:
+                print("Nessuna partizione da archiviare")
+            for item in report:
+                if args.dry_run:
+                    print(f"Da archiviare: {item['partition']}")
+                else:
+                    print(f"Archiviata {item['partition']}: {item['rows']} righe in {item['path']}")
+
+        elif args.command == "import":
+            for path in args.files:
+                count = import_archive(db, path)
+                print(f"Importate {count} righe da {path}")
+    except Exception as e:
+        print(f"Errore durante la manutenzione del log attività: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partizioni, retention e archivio del log attività")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    partitions = subparsers.add_parser("partitions", help="Crea le partizioni dei prossimi mesi")
+    partitions.add_argument("--months-ahead", type=int, default=None, help="Mesi da creare oltre quello corrente")
+
+    archive = subparsers.add_parser("archive", help="Esporta ed elimina le partizioni oltre la retention")
+    archive.add_argument("--retention-months", type=int, default=ACTIVITY_LOG_RETENTION_MONTHS,
+                         help="Mesi da mantenere nel database")
+    archive.add_argument("--dir", default=ACTIVITY_LOG_ARCHIVE_DIR, help="Cartella degli archivi")
+    archive.add_argument("--dry-run", action="store_true", help="Mostra solo le partizioni da archiviare")
+
+    import_parser = subparsers.add_parser("import", help="Reimporta archivi NDJSON compressi")
+    import_parser.add_argument("files", nargs="+", help="File activity_logs_YYYY_MM.ndjson.gz")
+
+    run(parser.parse_args())
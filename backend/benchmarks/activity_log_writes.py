@@ -0,0 +1,119 @@
+# benchmarks/activity_log_writes.py
+"""
+Misura la latenza di creazione di una lezione con il log delle attività
+in una transazione separata (commit dopo il commit della lezione, come prima)
+e nella stessa transazione della lezione (log_activity senza commit).
+
+Crea uno schema temporaneo con un professore, uno studente e un pacchetto,
+poi esegue N creazioni per ciascuna modalità e stampa media e percentili.
+Usa le stesse variabili DB_* dell'applicazione.
+
+    python benchmarks/activity_log_writes.py [--lessons 2000] [--keep]
+"""
+import sys
+import os
+import time
+import argparse
+import statistics
+from datetime import date
+from decimal import Decimal
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.database import engine
+from app.routes.activity import log_activity
+from app.activity_descriptions import activity_payload
+from app.routes.packages import adjust_package_hours
+
+SCHEMA = "bench_activity_log_writes"
+
+def seed(db):
+    professor = models.Professor(first_name="Prof", last_name="Bench", username="bench", password="x")
+    student = models.Student(first_name="Studente", last_name="Bench")
+    package = models.Package(
+        start_date=date(2025, 1, 6), total_hours=Decimal("100000"), package_cost=Decimal("0"),
+        status="in_progress", is_paid=False, remaining_hours=Decimal("100000"),
+        expiry_date=date(2099, 12, 31)
+    )
+    db.add_all([professor, student, package])
+    db.flush()
+    db.add(models.PackageStudent(package_id=package.id, student_id=student.id))
+    db.commit()
+    return professor.id, student.id, package.id
+
+def create_lesson(db, professor_id, student_id, package_id, separate_log_commit: bool):
+    payload = activity_payload(
+        "lesson_created", student_ids=[student_id], professor_ids=[professor_id],
+        package_ids=[package_id], hours=Decimal("1"), is_package=True, lesson_date=date(2025, 1, 7)
+    )
+    lesson = models.Lesson(
+        professor_id=professor_id, student_id=student_id, lesson_date=date(2025, 1, 7),
+        duration=Decimal("1"), is_package=True, package_id=package_id,
+        hourly_rate=Decimal("15"), total_payment=Decimal("15"), is_paid=True, price=Decimal("0")
+    )
+    db.add(lesson)
+    adjust_package_hours(db, package_id, lesson.duration)
+    if separate_log_commit:
+        # Comportamento precedente: commit della lezione, poi commit del log
+        db.commit()
+        log_activity(db, professor_id, "create", "lesson", lesson.id, payload=payload)
+        db.commit()
+    else:
+        log_activity(db, professor_id, "create", "lesson", lesson.id, payload=payload)
+        db.commit()
+
+def run(Session, ids, lessons: int, separate_log_commit: bool):
+    timings = []
+    with Session() as db:
+        for _ in range(lessons):
+            started = time.perf_counter()
+            create_lesson(db, *ids, separate_log_commit)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def summary(timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    return f"media {statistics.mean(timings):.2f} ms, mediana {statistics.median(timings):.2f} ms, p95 {p95:.2f} ms"
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenza di creazione lezione con log separato e nella stessa transazione")
+    parser.add_argument("--lessons", type=int, default=2000, help="Lezioni da creare per ciascuna modalità")
+    parser.add_argument("--keep", action="store_true", help="Non eliminare lo schema di benchmark")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        models.Base.metadata.create_all(conn)
+
+    bench_engine = create_engine(engine.url, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=bench_engine)
+    try:
+        with Session() as db:
+            ids = seed(db)
+
+        # Riscaldamento del pool e della cache delle query compilate
+        run(Session, ids, min(50, args.lessons), False)
+
+        separate = run(Session, ids, args.lessons, True)
+        same_transaction = run(Session, ids, args.lessons, False)
+
+        print(f"Creazione di {args.lessons} lezioni da pacchetto")
+        print(f"  log in transazione separata: {summary(separate)}")
+        print(f"  log nella stessa transazione: {summary(same_transaction)}")
+    finally:
+        bench_engine.dispose()
+        if not args.keep:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+if __name__ == "__main__":
+    main()
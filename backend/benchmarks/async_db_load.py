@@ -0,0 +1,127 @@
+# benchmarks/async_db_load.py
+"""
+Confronta richieste/secondo e latenza (p50, p99) degli endpoint di lettura
+con lo stack sync (psycopg2, threadpool) e con DB_ASYNC=true (asyncpg, AsyncSession).
+
+Per ciascuna modalità avvia l'API con uvicorn in un processo separato, attende /health
+e invia richieste concorrenti per la durata indicata, a rotazione sugli endpoint.
+Usa il database configurato dalle variabili DB_* (deve contenere dati realistici).
+
+    python benchmarks/async_db_load.py [--concurrency 100] [--duration 20] [--path /lessons/paged?limit=100 ...]
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+import itertools
+import subprocess
+from dotenv import load_dotenv
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+load_dotenv()
+
+import httpx
+
+DEFAULT_PATHS = [
+    "/lessons/paged?limit=100",
+    "/packages/?limit=100",
+    "/stats/finance?bucket=month",
+]
+
+def start_server(port: int, async_mode: bool, workers: int):
+    env = dict(os.environ)
+    env["DB_ASYNC"] = "true" if async_mode else "false"
+    # Nessun job in background durante la misura
+    env.update({
+        "PACKAGE_SWEEPER_ENABLED": "false",
+        "FINANCE_ROLLUP_ENABLED": "false",
+        "ACTIVITY_LOG_MAINTENANCE_ENABLED": "false",
+    })
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+
+async def wait_ready(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Il server su {base_url} non ha risposto entro {timeout} secondi")
+
+async def load(base_url: str, paths, concurrency: int, duration: float, headers):
+    timings = []
+    errors = 0
+    cycle = itertools.cycle(paths)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+        deadline = time.monotonic() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(next(cycle))
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.TransportError:
+                    errors += 1
+                    continue
+                timings.append((time.perf_counter() - started) * 1000)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+    return timings, errors, elapsed
+
+def summary(timings, errors, elapsed):
+    if not timings:
+        return f"nessuna risposta valida ({errors} errori)"
+    timings = sorted(timings)
+    p50 = timings[len(timings) // 2]
+    p99 = timings[max(int(len(timings) * 0.99) - 1, 0)]
+    return f"{len(timings) / elapsed:.1f} req/s, p50 {p50:.1f} ms, p99 {p99:.1f} ms, {errors} errori"
+
+async def run_mode(args, async_mode: bool):
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = start_server(args.port, async_mode, args.workers)
+    try:
+        await wait_ready(base_url)
+        headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+        # Riscaldamento dei pool di connessioni
+        await load(base_url, args.path, args.concurrency, 2, headers)
+        return await load(base_url, args.path, args.concurrency, args.duration, headers)
+    finally:
+        server.terminate()
+        server.wait()
+
+async def main():
+    parser = argparse.ArgumentParser(description="Carico sugli endpoint di lettura in modalità sync e async")
+    parser.add_argument("--concurrency", type=int, default=100, help="Richieste contemporanee")
+    parser.add_argument("--duration", type=float, default=20, help="Secondi di misura per modalità")
+    parser.add_argument("--workers", type=int, default=1, help="Processi uvicorn")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", action="append", help="Endpoint da chiamare (ripetibile)")
+    parser.add_argument("--token", help="Token JWT per gli endpoint protetti (es. /activities/)")
+    args = parser.parse_args()
+    args.path = args.path or DEFAULT_PATHS
+
+    print(f"Endpoint: {', '.join(args.path)}")
+    print(f"{args.concurrency} richieste contemporanee, {args.duration:.0f} s per modalità, {args.workers} worker")
+    for label, async_mode in (("sync (psycopg2)", False), ("async (asyncpg)", True)):
+        result = await run_mode(args, async_mode)
+        print(f"  {label}: {summary(*result)}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+# benchmarks/login_throughput.py
+"""
+Misura il throughput dei login concorrenti e il ritardo dell'event loop
+con la verifica bcrypt eseguita direttamente nella coroutine (come prima)
+e nel pool dedicato di app/password_pool.py.
+
+Mentre i login sono in corso un task "heartbeat" si risveglia ogni 10 ms:
+il suo ritardo rispetto al previsto è il tempo per cui le altre richieste
+resterebbero bloccate. Non richiede il database.
+
+    python benchmarks/login_throughput.py [--logins 64] [--concurrency 32] [--rounds 12]
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+import statistics
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+import bcrypt
+from fastapi import HTTPException
+
+from app.utils import verify_password
+from app.password_pool import PasswordHashPool, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE
+
+HEARTBEAT_INTERVAL = 0.01
+
+async def heartbeat(lags, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + HEARTBEAT_INTERVAL
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lags.append((time.perf_counter() - expected) * 1000)
+
+async def run(logins: int, concurrency: int, hashed: str, pool=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    rejected = 0
+
+    async def login():
+        nonlocal rejected
+        async with semaphore:
+            try:
+                if pool is None:
+                    verify_password("password123", hashed)
+                else:
+                    await pool.run(verify_password, "password123", hashed)
+            except HTTPException:
+                rejected += 1
+
+    lags = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(heartbeat(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    return elapsed, rejected, lags
+
+def summary(logins, elapsed, rejected, lags):
+    lags = sorted(lags) or [0.0]
+    p95 = lags[max(int(len(lags) * 0.95) - 1, 0)]
+    return (
+        f"{(logins - rejected) / elapsed:.1f} login/s, {rejected} rifiutati (429), "
+        f"ritardo event loop mediana {statistics.median(lags):.1f} ms, p95 {p95:.1f} ms, max {lags[-1]:.1f} ms"
+    )
+
+async def main():
+    parser = argparse.ArgumentParser(description="Throughput dei login con bcrypt nell'event loop e nel pool dedicato")
+    parser.add_argument("--logins", type=int, default=64, help="Login totali per ciascuna modalità")
+    parser.add_argument("--concurrency", type=int, default=32, help="Login contemporanei")
+    parser.add_argument("--rounds", type=int, default=12, help="Costo bcrypt dell'hash verificato")
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS, help="Thread del pool")
+    parser.add_argument("--max-queue", type=int, default=PASSWORD_HASH_MAX_QUEUE, help="Coda massima del pool")
+    args = parser.parse_args()
+
+    hashed = bcrypt.hashpw(b"password123", bcrypt.gensalt(rounds=args.rounds)).decode("utf-8")
+    pool = PasswordHashPool(args.workers, args.max_queue)
+    try:
+        inline = await run(args.logins, args.concurrency, hashed)
+        pooled = await run(args.logins, args.concurrency, hashed, pool)
+    finally:
+        pool.shutdown()
+
+    print(f"{args.logins} login, {args.concurrency} contemporanei, costo bcrypt {args.rounds}")
+    print(f"  bcrypt nell'event loop: {summary(args.logins, *inline)}")
+    print(f"  pool dedicato ({args.workers} thread, coda {args.max_queue}): {summary(args.logins, *pooled)}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
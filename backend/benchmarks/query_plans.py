@@ -0,0 +1,186 @@
+# benchmarks/query_plans.py
+"""
+Confronta i piani di esecuzione delle query più frequenti prima e dopo gli indici compositi.
+
+Crea uno schema temporaneo, lo popola con un dataset sintetico, esegue
+EXPLAIN (ANALYZE, BUFFERS) di ogni query senza gli indici e poi con gli indici,
+e stampa piani e tempi. Usa le stesse variabili DB_* dell'applicazione.
+
+    python benchmarks/query_plans.py [--lessons 200000] [--keep]
+"""
+import sys
+import os
+import argparse
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from sqlalchemy import text
+
+from app import models
+from app.database import engine
+
+SCHEMA = "bench_query_plans"
+
+# Indici introdotti dalla migrazione 0003_query_indexes
+BENCH_INDEXES = {
+    "lessons": [
+        "ix_lessons_package_id_is_package",
+        "ix_lessons_professor_id_lesson_date",
+        "ix_lessons_student_id_lesson_date",
+        "ix_lessons_lesson_date_id",
+    ],
+    "package_students": ["ix_package_students_student_id"],
+    "package_payments": ["ix_package_payments_package_id"],
+    "activity_logs": ["ix_activity_logs_timestamp", "ix_activity_logs_professor_id_timestamp"],
+}
+BENCH_CONSTRAINTS = {
+    "professor_weekly_payments": ["uq_professor_weekly_payments_professor_week"],
+}
+
+QUERIES = {
+    "ore usate di un pacchetto": """
+        SELECT SUM(duration) FROM lessons WHERE package_id = 42 AND is_package = true
+    """,
+    "lezioni di un professore in un mese": """
+        SELECT * FROM lessons
+        WHERE professor_id = 7 AND lesson_date BETWEEN DATE '2025-03-01' AND DATE '2025-03-31'
+    """,
+    "lezioni di uno studente": """
+        SELECT * FROM lessons WHERE student_id = 123 ORDER BY lesson_date
+    """,
+    "pacchetti di uno studente": """
+        SELECT p.* FROM packages p JOIN package_students ps ON ps.package_id = p.id
+        WHERE ps.student_id = 123
+    """,
+    "pagamento settimanale di un professore": """
+        SELECT * FROM professor_weekly_payments
+        WHERE professor_id = 7 AND week_start_date = DATE '2025-03-03'
+    """,
+    "pagamenti di un pacchetto": """
+        SELECT * FROM package_payments WHERE package_id = 42 ORDER BY payment_date
+    """,
+    "attività recenti": """
+        SELECT * FROM activity_logs WHERE timestamp >= now() - interval '30 days'
+        ORDER BY timestamp DESC LIMIT 100
+    """,
+    "attività recenti di un professore": """
+        SELECT * FROM activity_logs WHERE professor_id = 7 AND timestamp >= now() - interval '30 days'
+        ORDER BY timestamp DESC LIMIT 50
+    """,
+}
+
+def seed(conn, lessons: int):
+    students = max(lessons // 40, 100)
+    packages = max(lessons // 20, 100)
+    conn.execute(text("""
+        INSERT INTO professors (first_name, last_name, username, password, is_admin)
+        SELECT 'Prof', 'N' || g, 'prof' || g, 'x', false FROM generate_series(1, 80) g
+    """))
+    conn.execute(text("""
+        INSERT INTO students (first_name, last_name)
+        SELECT 'Studente', 'N' || g FROM generate_series(1, :n) g
+    """), {"n": students})
+    conn.execute(text("""
+        INSERT INTO packages (start_date, total_hours, package_cost, status, is_paid, remaining_hours,
+                              hours_used, expiry_date, extension_count, total_paid)
+        SELECT d, 8, 200, 'in_progress', false, 8, 0, d + 27, 0, 0
+        FROM (SELECT DATE '2023-01-02' + (g % 900) AS d FROM generate_series(1, :n) g) s
+    """), {"n": packages})
+    conn.execute(text("""
+        INSERT INTO package_students (package_id, student_id)
+        SELECT id, 1 + (id % :students) FROM packages
+    """), {"students": students})
+    conn.execute(text("""
+        INSERT INTO package_payments (package_id, amount, payment_date)
+        SELECT id, 100, start_date FROM packages
+    """))
+    conn.execute(text("""
+        INSERT INTO lessons (professor_id, student_id, lesson_date, duration, is_package, package_id,
+                             hourly_rate, total_payment, is_paid, price, is_online)
+        SELECT 1 + (g % 80), 1 + (g % :students), DATE '2023-01-02' + (g % 900), 1,
+               g % 3 <> 0, CASE WHEN g % 3 <> 0 THEN 1 + (g % :packages) END,
+               15, 15, true, 0, false
+        FROM generate_series(1, :n) g
+    """), {"n": lessons, "students": students, "packages": packages})
+    conn.execute(text("""
+        INSERT INTO professor_weekly_payments (professor_id, week_start_date, is_paid)
+        SELECT p, DATE '2023-01-02' + 7 * w, true FROM generate_series(1, 80) p, generate_series(0, 128) w
+    """))
+    conn.execute(text("""
+        INSERT INTO activity_logs (professor_id, action_type, entity_type, entity_id, description, timestamp)
+        SELECT 1 + (g % 80), 'create', 'lesson', g, 'Creata lezione', now() - (g % 1000) * interval '1 hour'
+        FROM generate_series(1, :n) g
+    """), {"n": lessons})
+
+def explain_all(conn):
+    conn.execute(text("ANALYZE"))
+    plans = {}
+    for name, sql in QUERIES.items():
+        rows = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")).scalars().all()
+        plans[name] = rows
+    return plans
+
+def drop_bench_indexes(conn):
+    for table, constraints in BENCH_CONSTRAINTS.items():
+        for name in constraints:
+            conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}"))
+    for indexes in BENCH_INDEXES.values():
+        for name in indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+def create_bench_indexes(conn):
+    for table_name in list(BENCH_INDEXES) + list(BENCH_CONSTRAINTS):
+        table = models.Base.metadata.tables[table_name]
+        for index in table.indexes:
+            if index.name in BENCH_INDEXES.get(table_name, []):
+                index.create(conn)
+    for table, constraints in BENCH_CONSTRAINTS.items():
+        for name in constraints:
+            conn.execute(text(
+                f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE (professor_id, week_start_date)"
+            ))
+
+def execution_time(plan_rows):
+    for row in reversed(plan_rows):
+        if row.strip().startswith("Execution Time"):
+            return row.strip()
+    return ""
+
+def main():
+    parser = argparse.ArgumentParser(description="Piani di esecuzione prima/dopo gli indici compositi")
+    parser.add_argument("--lessons", type=int, default=200000, help="Numero di lezioni da generare")
+    parser.add_argument("--keep", action="store_true", help="Non eliminare lo schema di benchmark")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        models.Base.metadata.create_all(conn)
+
+        print(f"Popolamento dataset ({args.lessons} lezioni)...")
+        seed(conn, args.lessons)
+
+        drop_bench_indexes(conn)
+        before = explain_all(conn)
+
+        create_bench_indexes(conn)
+        after = explain_all(conn)
+
+        for name in QUERIES:
+            print("=" * 80)
+            print(name)
+            print(f"  prima: {execution_time(before[name])}")
+            print(f"  dopo:  {execution_time(after[name])}")
+            print("-" * 80 + "\nPiano senza indici:")
+            print("\n".join(before[name]))
+            print("-" * 80 + "\nPiano con indici:")
+            print("\n".join(after[name]))
+
+        if not args.keep:
+            conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+if __name__ == "__main__":
+    main()
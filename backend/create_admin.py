@@ -10,11 +10,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 load_dotenv()
 
 from app import models
-from app.database import SessionLocal, engine
+from app.database import SessionLocal
 from app.utils import get_password_hash
 
-# Crea le tabelle se non esistono
-models.Base.metadata.create_all(bind=engine)
+# Le tabelle devono essere già state create con: alembic upgrade head
 
 def create_admin():
     db = SessionLocal()
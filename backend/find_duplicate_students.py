@@ -0,0 +1,65 @@
+# find_duplicate_students.py
+import sys
+import os
+import argparse
+from dotenv import load_dotenv
+
+# Aggiunge il path del progetto al PYTHONPATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+from app import models
+from app.database import SessionLocal
+from app.student_duplicates import find_duplicate_candidates, merge_students
+
+def _describe(student):
+    birth_date = f", nato il {student['birth_date']:%d/%m/%Y}" if student["birth_date"] else ""
+    return (
+        f"#{student['id']} {student['first_name']} {student['last_name']}{birth_date} "
+        f"({student['lesson_count']} lezioni, {student['package_count']} pacchetti)"
+    )
+
+def run(args):
+    db = SessionLocal()
+    try:
+        if args.merge:
+            professor_id = None
+            if args.username:
+                professor = db.query(models.Professor).filter(models.Professor.username == args.username).first()
+                if not professor:
+                    print(f"Professore {args.username} non trovato")
+                    sys.exit(1)
+                professor_id = professor.id
+
+            keep_id, *merge_ids = args.merge
+            result = merge_students(db, keep_id, merge_ids, professor_id)
+            print(
+                f"Uniti {len(result['merged_ids'])} studenti in #{keep_id}: "
+                f"spostate {result['lessons_moved']} lezioni e {len(result['packages_moved'])} pacchetti"
+            )
+            return
+
+        candidates = find_duplicate_candidates(db, threshold=args.threshold, limit=args.limit)
+        for pair in candidates:
+            print(f"{pair['score']:.2f}  {_describe(pair['student_a'])}  <->  {_describe(pair['student_b'])}")
+        print(f"Coppie di possibili duplicati: {len(candidates)}")
+    except Exception as e:
+        print(f"Errore durante la ricerca dei duplicati: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ricerca e unione di studenti duplicati")
+    parser.add_argument("--threshold", type=float, help="Similarità minima del nome completo (default DUPLICATE_SIMILARITY_THRESHOLD)")
+    parser.add_argument("--limit", type=int, default=100, help="Coppie da mostrare")
+    parser.add_argument("--merge", type=int, nargs="+", metavar="ID",
+                        help="Unisce gli studenti: il primo id è quello da mantenere, i successivi i duplicati")
+    parser.add_argument("--username", help="Professore registrato come autore dell'unione nel log attività")
+
+    args = parser.parse_args()
+    if args.merge and len(args.merge) < 2:
+        parser.error("--merge richiede l'id da mantenere e almeno un duplicato")
+    run(args)
@@ -0,0 +1,54 @@
+# import_lessons.py
+import sys
+import os
+import argparse
+from dotenv import load_dotenv
+
+# Aggiunge il path del progetto al PYTHONPATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+from app import models
+from app.database import SessionLocal
+from app.lesson_import import import_lessons_csv
+
+def run(args):
+    db = SessionLocal()
+    try:
+        professor_id = None
+        if args.username:
+            professor = db.query(models.Professor).filter(models.Professor.username == args.username).first()
+            if not professor:
+                print(f"Professore {args.username} non trovato")
+                sys.exit(1)
+            professor_id = professor.id
+
+        with open(args.file, encoding="utf-8-sig", newline="") as stream:
+            report = import_lessons_csv(db, stream, professor_id, dry_run=args.dry_run)
+
+        for item in report["errors"][:args.max_errors]:
+            print(f"Riga {item['row']}: {'; '.join(item['errors'])}")
+        if len(report["errors"]) > args.max_errors:
+            print(f"... altre {len(report['errors']) - args.max_errors} righe con errori")
+
+        print(f"Righe lette: {report['total_rows']}, valide: {report['valid_rows']}, con errori: {len(report['errors'])}")
+        if args.dry_run:
+            print("Validazione completata, nessuna lezione importata (--dry-run)")
+        else:
+            print(f"Lezioni importate: {report['imported']}, pacchetti aggiornati: {len(report['packages_updated'])}")
+    except Exception as e:
+        print(f"Errore durante l'import delle lezioni: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import massivo di lezioni da CSV")
+    parser.add_argument("file", help="File CSV con intestazione (professor_id, student_id, lesson_date, duration, hourly_rate, ...)")
+    parser.add_argument("--username", help="Professore registrato come autore dell'import nel log attività")
+    parser.add_argument("--dry-run", action="store_true", help="Valida il file senza importare")
+    parser.add_argument("--max-errors", type=int, default=50, help="Righe con errori da mostrare")
+
+    run(parser.parse_args())
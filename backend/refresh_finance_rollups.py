@@ -0,0 +1,32 @@
+# refresh_finance_rollups.py
+import sys
+import os
+import argparse
+from dotenv import load_dotenv
+
+# Aggiunge il path del progetto al PYTHONPATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+from app.finance_rollups import run_finance_rollup_refresh
+
+def refresh_finance_rollups(full: bool):
+    try:
+        months = run_finance_rollup_refresh(full=full)
+        if full:
+            print("finance_rollups ricostruiti completamente")
+        elif months:
+            print("Mesi ricalcolati: " + ", ".join(m.strftime('%m/%Y') for m in months))
+        else:
+            print("Nessun mese da ricalcolare")
+    except Exception as e:
+        print(f"Errore durante l'aggiornamento dei finance_rollups: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggiorna gli aggregati economici mensili")
+    parser.add_argument("--full", action="store_true", help="Ricostruisce tutti i mesi")
+    args = parser.parse_args()
+    refresh_finance_rollups(args.full)
@@ -0,0 +1,23 @@
+# sweep_packages.py
+import sys
+import os
+from dotenv import load_dotenv
+
+# Aggiunge il path del progetto al PYTHONPATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+from app.package_maintenance import run_package_sweeper
+
+def sweep_packages():
+    try:
+        updated = run_package_sweeper()
+        print(f"Pacchetti aggiornati: {updated}")
+    except Exception as e:
+        print(f"Errore durante l'aggiornamento dei pacchetti scaduti: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    sweep_packages()
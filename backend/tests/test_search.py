@@ -0,0 +1,57 @@
+# tests/test_search.py
+"""
+Ricerca per nome del backend "memory" (app/search.py): normalizzazione, similarità e
+ordinamento, senza database.
+"""
+import pytest
+
+from app import search
+
+NAMES = [
+    (1, "Maria Rossi"),
+    (2, "Mario Rossi"),
+    (3, "Luca Verdi"),
+    (4, "Niccolò Bianchi"),
+]
+
+def test_normalize_folds_case_accents_and_spaces():
+    assert search.normalize("  NICCOLÒ   Rossi ") == "niccolo rossi"
+    assert search.normalize("Niccolò") == search.normalize("niccolo")
+    assert search.normalize(None) == ""
+
+def test_similarity_ignores_accents_and_case():
+    assert search.similarity("Niccolò", "niccolo") == 1.0
+    assert search.similarity("NICCOLO", "niccolò") == 1.0
+    assert search.similarity("", "niccolo") == 0.0
+
+@pytest.mark.parametrize("term", ["niccolo", "Niccolò", "NICCOLÒ bianchi"])
+def test_accented_name_matches_plain_term(term):
+    assert [entity_id for entity_id, _ in search.rank_in_memory(NAMES, term, 10)] == [4]
+
+def test_surname_first_term_matches_by_words():
+    results = search.rank_in_memory(NAMES, "rossi mar", 10)
+    assert {entity_id for entity_id, _ in results} == {1, 2}
+
+def test_word_match_ranks_before_approximate_match(monkeypatch):
+    monkeypatch.setattr(search, "SIMILARITY_THRESHOLD", 0.3)
+    results = search.rank_in_memory(NAMES, "rossi mario", 10)
+    # Mario Rossi contiene tutte le parole; Maria Rossi è solo simile sopra la soglia
+    assert [entity_id for entity_id, _ in results] == [2, 1]
+    assert results[0][1] == 1.0
+    assert 0.3 <= results[1][1] < 1.0
+
+def test_similarity_threshold_cuts_approximate_matches(monkeypatch):
+    approximate = search.similarity("Maria Rossi", "rossi mario")
+
+    monkeypatch.setattr(search, "SIMILARITY_THRESHOLD", approximate)
+    assert [entity_id for entity_id, _ in search.rank_in_memory(NAMES, "rossi mario", 10)] == [2, 1]
+
+    monkeypatch.setattr(search, "SIMILARITY_THRESHOLD", approximate + 0.01)
+    assert [entity_id for entity_id, _ in search.rank_in_memory(NAMES, "rossi mario", 10)] == [2]
+
+def test_threshold_does_not_drop_word_matches(monkeypatch):
+    monkeypatch.setattr(search, "SIMILARITY_THRESHOLD", 1.0)
+    assert [entity_id for entity_id, _ in search.rank_in_memory(NAMES, "verdi", 10)] == [3]
+
+def test_limit():
+    assert len(search.rank_in_memory(NAMES, "rossi", 1)) == 1
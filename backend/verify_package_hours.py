@@ -0,0 +1,44 @@
+# verify_package_hours.py
+import sys
+import os
+import argparse
+from dotenv import load_dotenv
+
+# Aggiunge il path del progetto al PYTHONPATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+from app.database import SessionLocal
+from app.package_maintenance import reconcile_package_hours
+
+def verify_package_hours(repair: bool):
+    db = SessionLocal()
+    try:
+        report = reconcile_package_hours(db, repair=repair)
+        if not report:
+            print("Nessuna differenza tra hours_used e le lezioni registrate")
+            return
+        
+        for row in report:
+            print(
+                f"Pacchetto {row['package_id']}: hours_used={row['stored_hours_used']} "
+                f"ore da lezioni={row['actual_hours_used']}"
+            )
+        
+        if repair:
+            print(f"Riallineati {len(report)} pacchetti")
+        else:
+            print(f"{len(report)} pacchetti divergenti (usa --repair per correggerli)")
+    except Exception as e:
+        print(f"Errore durante la verifica delle ore dei pacchetti: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica (e ripara) il contatore hours_used dei pacchetti")
+    parser.add_argument("--repair", action="store_true", help="Riallinea i pacchetti divergenti")
+    args = parser.parse_args()
+    verify_package_hours(args.repair)
@@ -12,7 +12,8 @@ import { studentService } from '../../services/api';
  * @param {string} props.helperText - Testo di supporto (opzionale)
  * @param {boolean} props.disabled - Se il campo è disabilitato (opzionale)
  * @param {boolean} props.required - Se il campo è obbligatorio (opzionale)
- * @param {Array} props.students - Lista di studenti (opzionale, se non fornita li carica)
+ * @param {Array} props.students - Lista di studenti (opzionale, se non fornita la ricerca
+ *   avviene sul server mentre si digita, con /students/search)
  */
 function StudentAutocomplete({
   value,
@@ -32,46 +33,78 @@ function StudentAutocomplete({
   // Assicurati che disabled sia sempre un booleano
   const isDisabled = disabled === true || disabled === "true";
   
-  // Carica gli studenti se non sono stati forniti come prop
+  // Senza lista di studenti la ricerca avviene sul server
+  const isServerSearch = !Array.isArray(students);
+  
+  // Ordina alfabeticamente gli studenti forniti come prop
   useEffect(() => {
-    const fetchStudents = async () => {
-      if (Array.isArray(students)) {
-        // Se gli studenti sono forniti, ordinali alfabeticamente 
-        const sortedStudents = [...students].sort((a, b) => {
-          // Ordinamento per nome e cognome
-          const fullNameA = `${a.first_name} ${a.last_name}`.toLowerCase();
-          const fullNameB = `${b.first_name} ${b.last_name}`.toLowerCase();
-          return fullNameA.localeCompare(fullNameB);
-        });
-        setOptions(sortedStudents);
-        return;
-      }
+    if (isServerSearch) return;
+    const sortedStudents = [...students].sort((a, b) => {
+      // Ordinamento per nome e cognome
+      const fullNameA = `${a.first_name} ${a.last_name}`.toLowerCase();
+      const fullNameB = `${b.first_name} ${b.last_name}`.toLowerCase();
+      return fullNameA.localeCompare(fullNameB);
+    });
+    setOptions(sortedStudents);
+  }, [students, isServerSearch]);
 
+  // Ricerca sul server mentre si digita (con un breve ritardo tra un tasto e l'altro)
+  useEffect(() => {
+    if (!isServerSearch) return;
+    const query = inputValue.trim();
+    if (!query) {
+      setOptions([]);
+      setHasMoreResults(false);
+      return;
+    }
+
+    let active = true;
+    const timer = setTimeout(async () => {
       try {
         setLoading(true);
-        const response = await studentService.getAll();
-        if (response && response.data) {
-          // Ordina gli studenti alfabeticamente
-          const sortedStudents = [...response.data].sort((a, b) => {
-            // Ordinamento per nome e cognome
-            const fullNameA = `${a.first_name} ${a.last_name}`.toLowerCase();
-            const fullNameB = `${b.first_name} ${b.last_name}`.toLowerCase();
-            return fullNameA.localeCompare(fullNameB);
-          });
-          setOptions(sortedStudents);
+        // Un risultato in più per sapere se ce ne sono altri
+        const response = await studentService.search(query, 6);
+        if (active && response && response.data) {
+          setOptions(response.data.slice(0, 5));
+          setHasMoreResults(response.data.length > 5);
         }
       } catch (err) {
-        console.error('Errore nel caricamento degli studenti:', err);
+        console.error('Errore nella ricerca degli studenti:', err);
       } finally {
-        setLoading(false);
+        if (active) setLoading(false);
       }
+    }, 250);
+
+    return () => {
+      active = false;
+      clearTimeout(timer);
     };
+  }, [inputValue, isServerSearch]);
 
-    fetchStudents();
-  }, [students]);
+  // Con la ricerca sul server carica lo studente selezionato, che può non essere tra i risultati
+  useEffect(() => {
+    if (!isServerSearch || !value || typeof value === 'object') return;
+    if (selectedStudent && selectedStudent.id === parseInt(value)) return;
+
+    let active = true;
+    studentService.getById(value)
+      .then(response => {
+        if (active) setSelectedStudent(response.data);
+      })
+      .catch(err => console.error('Errore nel caricamento dello studente:', err));
+
+    return () => {
+      active = false;
+    };
+  }, [value, isServerSearch, selectedStudent]);
 
   // Aggiorna lo studente selezionato quando cambia il valore o le opzioni
   useEffect(() => {
+    if (isServerSearch) {
+      if (!value) setSelectedStudent(null);
+      else if (typeof value === 'object') setSelectedStudent(value);
+      return;
+    }
     if (value && options.length > 0) {
       if (typeof value === 'object') {
         setSelectedStudent(value);
@@ -82,7 +115,7 @@ function StudentAutocomplete({
     } else {
       setSelectedStudent(null);
     }
-  }, [value, options]);
+  }, [value, options, isServerSearch]);
 
   // Gestisce il cambio di selezione
   const handleStudentChange = (event, newValue) => {
@@ -94,6 +127,9 @@ function StudentAutocomplete({
 
   // Filtra le opzioni in base all'input e limita i risultati a 5
   const filterOptions = (options, state) => {
+    // I risultati della ricerca sul server sono già filtrati e ordinati
+    if (isServerSearch) return options;
+
     // Filtro nativo di Autocomplete
     const { inputValue } = state;
     const filtered = options.filter(option => {
@@ -116,7 +152,11 @@ function StudentAutocomplete({
       onInputChange={(event, newInputValue) => {
         setInputValue(newInputValue);
       }}
-      options={options}
+      options={
+        isServerSearch && selectedStudent && !options.some(option => option.id === selectedStudent.id)
+          ? [selectedStudent, ...options]
+          : options
+      }
       getOptionLabel={(option) => `${option.first_name} ${option.last_name}`}
       isOptionEqualToValue={(option, value) => option.id === value.id}
       loading={loading}
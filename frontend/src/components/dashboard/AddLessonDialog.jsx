@@ -65,7 +65,6 @@ function AddLessonDialog({
   const [localSelectedPackage, setLocalSelectedPackage] = useState(null);
   const [overlapWarningOpen, setOverlapWarningOpen] = useState(false);
   const [overlappingLesson, setOverlappingLesson] = useState(null);
-  const [studentLessons, setStudentLessons] = useState([]);
   const [packageStudents, setPackageStudents] = useState([]);
   const [expiredPackages, setExpiredPackages] = useState([]);
   const [recentlyEndedPackages, setRecentlyEndedPackages] = useState([]);
@@ -145,21 +144,6 @@ function AddLessonDialog({
     }
   };
 
-  // Carica le lezioni dello studente quando lo studente cambia
-  const loadStudentLessons = async (studentId) => {
-    if (!studentId) {
-      setStudentLessons([]);
-      return;
-    }
-
-    try {
-      const response = await lessonService.getByStudent(studentId);
-      setStudentLessons(response.data || []);
-    } catch (err) {
-      console.error('Error loading student lessons:', err);
-      setError('Impossibile caricare le lezioni dello studente. Prova a riaggiornare la pagina.');
-    }
-  };
 
   useEffect(() => {
     if (lessonForm.package_id && studentPackages && studentPackages.length > 0) {
@@ -286,10 +270,8 @@ function AddLessonDialog({
         is_online: lessonForm.is_online || false  // Use the actual value from the form
       };
 
-      // Controllo sovrapposizioni usando la funzione utility
-      // Combiniamo le lezioni locali e quelle caricate per lo studente
-      const allLessons = [...lessons, ...studentLessons];
-      const { hasOverlap, overlappingLesson } = checkLessonOverlap(lessonForm, allLessons);
+      // Controllo sovrapposizioni sul server (studente e professore)
+      const { hasOverlap, overlappingLesson } = await checkLessonOverlap(formattedValues);
 
       if (hasOverlap) {
         setOverlappingLesson(overlappingLesson);
@@ -353,7 +335,6 @@ function AddLessonDialog({
       }));
       setLocalPackages([]);
       setLocalSelectedPackage(null);
-      setStudentLessons([]);
       setExpiredPackages([]); // Reset pacchetti scaduti
       setRecentlyEndedPackages([]); // Reset pacchetti terminati
       return;
@@ -397,9 +378,6 @@ function AddLessonDialog({
       setRecentlyEndedPackages(recentlyEnded);
       setLocalSelectedPackage(null);
 
-      // Load all lessons for this student regardless of professor
-      await loadStudentLessons(studentId);
-
       if (handleStudentChange) {
         await handleStudentChange(studentId);
       }
@@ -453,7 +431,6 @@ function AddLessonDialog({
       setExpiredPackages([]);
       setRecentlyEndedPackages([]);
       setLocalSelectedPackage(null);
-      setStudentLessons([]);
 
       // Se stiamo usando il dialogo dal dettaglio pacchetto, imposta alcuni valori di default
       if (context === 'packageDetail' && fixedPackageId) {
@@ -514,9 +491,6 @@ function AddLessonDialog({
               if (selectedPackage) {
                 setLocalSelectedPackage(selectedPackage);
               }
-
-              // Carica le lezioni dello studente
-              await loadStudentLessons(lessonForm.student_id);
             } catch (err) {
               console.error('Error loading student packages:', err);
               setError('Errore nel caricamento dei pacchetti dello studente');
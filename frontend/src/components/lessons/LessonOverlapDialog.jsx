@@ -15,11 +15,14 @@ import { it } from 'date-fns/locale';
 
 /**
  * Dialog component to show warning when a lesson overlaps with another lesson
- * for the same student.
+ * for the same student or the same professor.
  */
 function LessonOverlapDialog({ open, onClose, overlappingLesson }) {
   if (!overlappingLesson) return null;
 
+  const isProfessorConflict = overlappingLesson.conflict_on?.includes('professor')
+    && !overlappingLesson.conflict_on?.includes('student');
+
   return (
     <Dialog
       open={open}
@@ -33,7 +36,9 @@ function LessonOverlapDialog({ open, onClose, overlappingLesson }) {
       </DialogTitle>
       <DialogContent>
         <DialogContentText gutterBottom>
-          Lo studente ha già una lezione programmata in questo orario. Non è possibile creare lezioni sovrapposte per lo stesso studente.
+          {isProfessorConflict
+            ? 'Il professore ha già una lezione programmata in questo orario. Non è possibile creare lezioni sovrapposte per lo stesso professore.'
+            : 'Lo studente ha già una lezione programmata in questo orario. Non è possibile creare lezioni sovrapposte per lo stesso studente.'}
         </DialogContentText>
         
         <Box sx={{ mt: 2, p: 2, bgcolor: 'background.paper', borderRadius: 1, boxShadow: 1 }}>
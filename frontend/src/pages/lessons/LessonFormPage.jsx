@@ -61,7 +61,6 @@ function LessonFormPage() {
   const [overlapLesson, setOverlapLesson] = useState(null);
 
   // Selected student's lessons
-  const [studentLessons, setStudentLessons] = useState([]);
 
   // Default initial values
   const [initialValues, setInitialValues] = useState({
@@ -171,9 +170,6 @@ function LessonFormPage() {
       await loadPackageLessons(lesson.package_id, lesson.id);
     }
 
-    // Load student lessons to check for overlaps
-    await loadStudentLessons(lesson.student_id);
-
     // Set initial form values
     const lessonDate = new Date(lesson.lesson_date);
     let startTime = null;
@@ -326,9 +322,6 @@ function LessonFormPage() {
         setExpiredPackages(expiredWithHoursPackages);
         setRecentlyEndedPackages(recentlyEnded);
       }
-
-      // Load student lessons to check for overlaps
-      await loadStudentLessons(studentId);
     } catch (err) {
       console.error('Error fetching student data:', err);
       setError('Errore nel caricamento dei dati dello studente');
@@ -336,19 +329,6 @@ function LessonFormPage() {
     }
   };
 
-  // Load student lessons
-  const loadStudentLessons = async (studentId) => {
-    try {
-      const response = await lessonService.getByStudent(studentId);
-      setStudentLessons(response.data);
-      return response.data;
-    } catch (err) {
-      console.error('Error loading student lessons:', err);
-      setError('Unable to load student lessons. Please try refreshing the page.');
-      return [];
-    }
-  };
-
   // Handle package change
   const handlePackageChange = async (packageId, setFieldValue) => {
     if (!packageId) {
@@ -528,9 +508,8 @@ function LessonFormPage() {
       }
 
       // Check for overlaps with utility function
-      const { hasOverlap, overlappingLesson } = checkLessonOverlap(
+      const { hasOverlap, overlappingLesson } = await checkLessonOverlap(
         formattedValues,
-        studentLessons,
         isEditMode ? parseInt(id) : null
       );
 
@@ -48,6 +48,7 @@ function StudentFormPage() {
   const [loading, setLoading] = useState(isEditMode);
   const [error, setError] = useState('');
   const [hasHomonyms, setHasHomonyms] = useState(false);
+  const [nearDuplicates, setNearDuplicates] = useState([]);
   const [initialValues, setInitialValues] = useState({
     first_name: '',
     last_name: '',
@@ -159,6 +160,10 @@ function StudentFormPage() {
         const homonymResponse = await checkForHomonyms(firstName, lastName);
         const homonymsFound = homonymResponse?.has_homonyms || false;
         setHasHomonyms(homonymsFound);
+        // Nomi quasi uguali (refusi, accenti, nome e cognome invertiti), escluso lo studente in modifica
+        setNearDuplicates(
+          (homonymResponse?.near_duplicates || []).filter(student => !isEditMode || student.id !== parseInt(id))
+        );
 
         if (homonymsFound) {
           setFieldError('birth_date', 'Studente già esistente. Se si tratta di studenti omonimi, data di nascita obbligatoria.');
@@ -225,6 +230,18 @@ function StudentFormPage() {
                   />
                 </Grid>
 
+                {nearDuplicates.length > 0 && (
+                  <Grid item xs={12}>
+                    <Alert severity="warning">
+                      Esistono studenti con un nome simile:{' '}
+                      {nearDuplicates
+                        .map(student => `${student.first_name} ${student.last_name}${student.birth_date ? ` (${format(parseISO(student.birth_date), 'dd/MM/yyyy')})` : ''}`)
+                        .join(', ')}
+                      . Verifica che lo studente non sia già presente.
+                    </Alert>
+                  </Grid>
+                )}
+
                 <Grid item xs={12} md={6}>
                   <DatePicker
                     label={hasHomonyms ? "Data di nascita (obbligatoria)" : "Data di nascita"}
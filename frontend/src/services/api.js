@@ -100,6 +100,14 @@ export const professorWeeklyPaymentService = {
     return api.get(`/professor-weekly-payments/week/${formattedDate}`);
   },
   
+  // Riepilogo compensi per professore e settimana calcolato dal server
+  getPayroll: async (startWeek, endWeek = null) => {
+    const formatWeek = (date) => date instanceof Date ? format(date, 'yyyy-MM-dd') : date;
+    const params = { start_week: formatWeek(startWeek) };
+    if (endWeek) params.end_week = formatWeek(endWeek);
+    return api.get('/professor-weekly-payments/payroll', { params });
+  },
+  
   getProfessorWeeklyPayment: async (professorId, weekStartDate) => {
     const formattedDate = weekStartDate instanceof Date 
       ? format(weekStartDate, 'yyyy-MM-dd')
@@ -180,9 +188,24 @@ export const studentService = {
     return api.delete(`/students/${id}`);
   },
   
+  // Autocompletamento: primi risultati per pertinenza (ignora maiuscole, accenti e ordine nome/cognome)
+  search: async (query, limit = 10) => {
+    return api.get('/students/search', { params: { q: query, limit } });
+  },
+  
   checkHomonyms: async (firstName, lastName) => {
     return api.get(`/students/check-homonyms/?first_name=${encodeURIComponent(firstName)}&last_name=${encodeURIComponent(lastName)}`);
   },
+  
+  // Coppie di possibili duplicati con numero di lezioni e pacchetti (solo admin)
+  getDuplicates: async (params = {}) => {
+    return api.get('/students/duplicates', { params });
+  },
+  
+  // Unisce i duplicati mergeIds nello studente keepId (solo admin)
+  merge: async (keepId, mergeIds) => {
+    return api.post('/students/merge', { keep_id: keepId, merge_ids: mergeIds });
+  },
 };
 
 // Package service
@@ -281,6 +304,12 @@ export const lessonService = {
     return api.get('/lessons/');
   },
   
+  // Pagina di lezioni filtrata lato server (params: cursor, limit, date_from, date_to,
+  // professor_id, student_id, package_id, is_package, is_paid, is_online, fields)
+  getPage: async (params = {}) => {
+    return api.get('/lessons/paged', { params });
+  },
+  
   getById: async (id) => {
     return api.get(`/lessons/${id}`);
   },
@@ -305,10 +334,50 @@ export const lessonService = {
     return api.delete(`/lessons/${id}`);
   },
   
+  // Lezioni sovrapposte all'orario indicato (params: lesson_date, start_time, duration,
+  // student_id, professor_id, exclude_lesson_id)
+  checkConflicts: async (params) => {
+    return api.get('/lessons/conflicts', { params });
+  },
+  
   // Nuovo metodo per gestire l'overflow delle ore
   handleOverflow: async (data) => {
     return api.post('/lessons/handle-overflow', data);
   },
+  
+  // Import massivo da CSV (solo admin): restituisce righe importate ed errori per riga
+  importCsv: async (file, dryRun = false) => {
+    const formData = new FormData();
+    formData.append('file', file);
+    return api.post('/lessons/import', formData, { params: { dry_run: dryRun } });
+  },
+};
+
+// Lesson series service (lezioni settimanali ricorrenti)
+export const lessonSeriesService = {
+  getAll: async (params = {}) => {
+    return api.get('/lesson-series/', { params });
+  },
+  
+  getById: async (id) => {
+    return api.get(`/lesson-series/${id}`);
+  },
+  
+  // data: weekday, start_time, duration, professor_id, student_id, start_date,
+  // end_date oppure occurrences, is_package/package_id, skip_conflicts
+  create: async (data) => {
+    return api.post('/lesson-series/', data);
+  },
+  
+  // Modifica le lezioni da data.from_date (default oggi) in poi
+  update: async (id, data) => {
+    return api.put(`/lesson-series/${id}`, data);
+  },
+  
+  // Annulla le lezioni da fromDate (default oggi) in poi
+  cancel: async (id, fromDate = null) => {
+    return api.delete(`/lesson-series/${id}`, { params: fromDate ? { from_date: fromDate } : {} });
+  },
 };
 
 // Activity service
@@ -322,7 +391,10 @@ export const activityService = {
     if (params.action_type) queryParams.append('action_type', params.action_type);
     if (params.entity_type) queryParams.append('entity_type', params.entity_type);
     if (params.professor_id) queryParams.append('professor_id', params.professor_id);
+    if (params.student_id) queryParams.append('student_id', params.student_id);
+    if (params.package_id) queryParams.append('package_id', params.package_id);
     if (params.search) queryParams.append('search', params.search);
+    if (params.search_type) queryParams.append('search_type', params.search_type);
     
     const queryString = queryParams.toString();
     const url = queryString ? `?${queryString}` : '';
@@ -353,6 +425,7 @@ export const activityService = {
     if (params.action_type) queryParams.append('action_type', params.action_type);
     if (params.entity_type) queryParams.append('entity_type', params.entity_type);
     if (params.search) queryParams.append('search', params.search);
+    if (params.search_type) queryParams.append('search_type', params.search_type);
     
     const queryString = queryParams.toString();
     const url = queryString ? `?${queryString}` : '';
@@ -365,17 +438,18 @@ export const activityService = {
 };
 
 // Statistics service
+// params opzionali: start_date, end_date (yyyy-MM-dd) e, per le finanze, bucket ('month' o 'week')
 export const statsService = {
-  getFinanceStats: async () => {
-    return api.get('/stats/finance');
+  getFinanceStats: async (params = {}) => {
+    return api.get('/stats/finance', { params });
   },
   
-  getStudentStats: async () => {
-    return api.get('/stats/students');
+  getStudentStats: async (params = {}) => {
+    return api.get('/stats/students', { params });
   },
   
-  getProfessorStats: async () => {
-    return api.get('/stats/professors');
+  getProfessorStats: async (params = {}) => {
+    return api.get('/stats/professors', { params });
   },
 };
 
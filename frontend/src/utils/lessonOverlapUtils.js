@@ -1,105 +1,37 @@
 // src/utils/lessonOverlapUtils.js
-import { parseISO } from 'date-fns';
+import { lessonService } from '../services/api';
 
 /**
- * Checks if a lesson overlaps with existing lessons for the same student
+ * Checks on the server if a lesson overlaps with existing lessons of the same
+ * student or professor (one indexed query, no need to load all lessons).
  * 
- * @param {Object} formValues - The form values for the new lesson
- * @param {Array} existingLessons - All existing lessons to check against
+ * @param {Object} formValues - Lesson values already formatted for the API
+ *   (lesson_date 'yyyy-MM-dd', start_time 'HH:mm:ss', duration, student_id, professor_id)
  * @param {number} lessonIdToExclude - Optional ID of lesson to exclude (for editing)
- * @returns {Object} Result with hasOverlap flag and overlappingLesson object if found
+ * @returns {Promise<Object>} Result with hasOverlap flag and overlappingLesson object if found
  */
-export const checkLessonOverlap = (formValues, existingLessons, lessonIdToExclude = null) => {
-  // Filter to only include lessons for the same student
-  const studentLessons = existingLessons.filter(
-    lesson => lesson.student_id === parseInt(formValues.student_id)
-  );
-  
-  if (!studentLessons.length || !formValues.student_id) {
+export const checkLessonOverlap = async (formValues, lessonIdToExclude = null) => {
+  if (!formValues.student_id || !formValues.start_time || !formValues.duration) {
     return { hasOverlap: false };
   }
 
-  // Convert form values to Date objects for comparison
-  const lessonDate = new Date(formValues.lesson_date);
-  
-  let startHours, startMinutes;
-  if (formValues.start_time instanceof Date) {
-    startHours = formValues.start_time.getHours();
-    startMinutes = formValues.start_time.getMinutes();
-  } else if (typeof formValues.start_time === 'string' && formValues.start_time) {
-    const timeParts = formValues.start_time.split(':');
-    startHours = parseInt(timeParts[0] || 0);
-    startMinutes = parseInt(timeParts[1] || 0);
-  } else {
-    startHours = 0;
-    startMinutes = 0;
+  const params = {
+    lesson_date: formValues.lesson_date,
+    start_time: formValues.start_time,
+    duration: formValues.duration,
+    student_id: parseInt(formValues.student_id),
+  };
+  if (formValues.professor_id) {
+    params.professor_id = parseInt(formValues.professor_id);
   }
-  
-  // Create Date objects for the new lesson's start and end times
-  const newLessonStart = new Date(lessonDate);
-  newLessonStart.setHours(startHours, startMinutes, 0, 0);
-  
-  const durationHours = Math.floor(parseFloat(formValues.duration));
-  const durationMinutes = Math.round((parseFloat(formValues.duration) - durationHours) * 60);
-  
-  const newLessonEnd = new Date(newLessonStart);
-  newLessonEnd.setHours(
-    newLessonStart.getHours() + durationHours,
-    newLessonStart.getMinutes() + durationMinutes,
-    0,
-    0
-  );
-
-  // Check each existing lesson for overlap
-  for (const lesson of studentLessons) {
-    // Skip the current lesson if we're editing
-    if (lessonIdToExclude && lesson.id === parseInt(lessonIdToExclude)) {
-      continue;
-    }
-    
-    // Get the date of the existing lesson
-    const existingDate = parseISO(lesson.lesson_date);
-    
-    // Only check lessons on the same day
-    if (existingDate.getDate() !== lessonDate.getDate() ||
-        existingDate.getMonth() !== lessonDate.getMonth() ||
-        existingDate.getFullYear() !== lessonDate.getFullYear()) {
-      continue;
-    }
-    
-    // Extract start time
-    let existingStartHours = 0, existingStartMinutes = 0;
-    if (lesson.start_time) {
-      const timeParts = typeof lesson.start_time === 'string' 
-        ? lesson.start_time.split(':') 
-        : [0, 0];
-      existingStartHours = parseInt(timeParts[0] || 0);
-      existingStartMinutes = parseInt(timeParts[1] || 0);
-    }
-    
-    // Create Date objects for existing lesson's start and end
-    const existingLessonStart = new Date(existingDate);
-    existingLessonStart.setHours(existingStartHours, existingStartMinutes, 0, 0);
-    
-    const existingDurationHours = Math.floor(parseFloat(lesson.duration));
-    const existingDurationMinutes = Math.round((parseFloat(lesson.duration) - existingDurationHours) * 60);
-    
-    const existingLessonEnd = new Date(existingLessonStart);
-    existingLessonEnd.setHours(
-      existingLessonStart.getHours() + existingDurationHours,
-      existingLessonStart.getMinutes() + existingDurationMinutes,
-      0,
-      0
-    );
-    
-    // Check for overlap: (new start < existing end) AND (new end > existing start)
-    if (newLessonStart < existingLessonEnd && newLessonEnd > existingLessonStart) {
-      return {
-        hasOverlap: true,
-        overlappingLesson: lesson
-      };
-    }
+  if (lessonIdToExclude) {
+    params.exclude_lesson_id = parseInt(lessonIdToExclude);
   }
-  
-  return { hasOverlap: false };
-};
\ No newline at end of file
+
+  const response = await lessonService.checkConflicts(params);
+  const { has_conflict, conflicts } = response.data;
+
+  return has_conflict
+    ? { hasOverlap: true, overlappingLesson: conflicts[0] }
+    : { hasOverlap: false };
+};